@@ -1,5 +1,8 @@
+from django.core.exceptions import ValidationError
 from rest_framework import serializers
 from core.models import *
+from api.utils.bulk_update import BUILDING_BULK_UPDATE_FIELDS
+from core.utils.choice_registry import apply_choices
 
 # ==================================================
 # Palika
@@ -71,6 +74,7 @@ class RoadUploadSerializer(serializers.ModelSerializer):
         model = RoadUpload
         fields = "__all__"
         read_only = ["id"]
+        read_only_fields = ["ingestion_report"]
 
 
 class RoadPostSerializer(serializers.ModelSerializer):
@@ -288,6 +292,7 @@ class BuildingUploadSerializer(serializers.ModelSerializer):
         model = BuildingUpload
         fields = "__all__"
         read_only = ["id"]
+        read_only_fields = ["ingestion_report"]
 
 
 class BuildingPostSerializer(serializers.ModelSerializer):
@@ -461,6 +466,49 @@ class BuildingUpdateSerializer(serializers.ModelSerializer):
             return road.road_name_en
 
 
+class BuildingBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    filter = serializers.DictField(
+        required=False, help_text="Building filter params, e.g. ward_no or tole_name."
+    )
+    changes = serializers.DictField(
+        help_text="New value of every changed field, e.g. tole_name or road_id."
+    )
+
+    def validate_changes(self, changes):
+        if not changes:
+            raise serializers.ValidationError("No changes given.")
+        invalid_fields = set(changes) - set(BUILDING_BULK_UPDATE_FIELDS)
+        if invalid_fields:
+            raise serializers.ValidationError(
+                f"Fields cannot be bulk updated: {', '.join(sorted(invalid_fields))}"
+            )
+        # the choices of the fields are only set once a building was instantiated
+        apply_choices(
+            Building, BuildingCategoryChoice, Building.BUILDING_CHOICES_FIELDS
+        )
+        errors = {}
+        cleaned = {}
+        for field_name, value in changes.items():
+            try:
+                cleaned[field_name] = Building._meta.get_field(field_name).clean(
+                    value, None
+                )
+            except ValidationError as e:
+                errors[field_name] = e.messages
+        road_id = cleaned.get("road_id")
+        if road_id is not None and not Road.objects.filter(road_id=road_id).exists():
+            errors["road_id"] = [f"Road {road_id} does not exist."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return cleaned
+
+    def validate(self, data):
+        if not data.get("ids") and not data.get("filter"):
+            raise serializers.ValidationError("Either ids or filter is required.")
+        return data
+
+
 class BuildingDetailSerializer(serializers.ModelSerializer):
     informant_name = serializers.CharField(source="attr_data.informant", read_only=True)
     informant_contact = serializers.CharField(source="attr_data.ph_no", read_only=True)
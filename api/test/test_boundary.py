@@ -0,0 +1,121 @@
+import json
+import tempfile
+
+from django.contrib.gis.geos import Polygon
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from core.utils import topojson
+from dmaps.file_handlers import (
+    BOUNDARY_GEOJSON_TOLERANCES,
+    build_boundary_geojson,
+    get_boundary_geojson,
+    handlegeometryfile,
+)
+from dmaps.models import BoundaryGeojson, GeometryFile, MunicipalityGeometry
+from api.test.fixtures import LOCMEM_CACHES
+
+
+class TopoJSONTest(TestCase):
+    """
+    Borders shared by neighbouring polygons are stored as a single arc.
+    """
+
+    def test_shared_border_is_one_arc(self):
+        square = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+        neighbour = [[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]]
+        topology = topojson.encode(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"name": name},
+                        "geometry": {"type": "Polygon", "coordinates": [ring]},
+                    }
+                    for name, ring in (("a", square), ("b", neighbour))
+                ],
+            },
+            quantization=3,
+        )
+        geometries = topology["objects"]["boundaries"]["geometries"]
+        first, second = geometries[0]["arcs"][0], geometries[1]["arcs"][0]
+        shared = set(first) & {~index for index in second}
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(geometries[1]["properties"], {"name": "b"})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BoundaryGeojsonQueryTest(TestCase):
+    """
+    Boundary GeoJSON is queried on the Django managed connection.
+    """
+
+    def test_empty_layer_has_no_features(self):
+        geojson = get_boundary_geojson(MunicipalityGeometry._meta.db_table)
+        self.assertEqual(geojson, {"type": "FeatureCollection", "features": []})
+
+    def test_features_keep_attributes_without_geometry_column(self):
+        MunicipalityGeometry.objects.create(
+            name="palika", geom=Polygon.from_bbox((85.3, 27.7, 85.4, 27.8))
+        )
+        features = get_boundary_geojson(MunicipalityGeometry._meta.db_table)["features"]
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]["properties"]["name"], "palika")
+        self.assertNotIn("geom", features[0]["properties"])
+        self.assertEqual(features[0]["geometry"]["type"], "Polygon")
+
+    def test_view_serves_layer(self):
+        MunicipalityGeometry.objects.create(
+            name="palika", geom=Polygon.from_bbox((85.3, 27.7, 85.4, 27.8))
+        )
+        response = self.client.get("/api/v1/dmaps/municipality-geojson/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)["features"]), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BoundaryGeojsonBuildTest(TestCase):
+    """
+    The stored GeoJSON of an uploaded geometry file survives the hooks of its rows.
+    """
+
+    def test_upload_builds_blobs_after_commit(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        geojson = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"name": "palika"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [
+                            [[85.3, 27.7], [85.4, 27.7], [85.4, 27.8], [85.3, 27.7]]
+                        ],
+                    },
+                }
+            ],
+        }
+        with override_settings(MEDIA_ROOT=media_root.name):
+            geometry_file = GeometryFile.objects.create(
+                file_type="municipality",
+                file_upload=SimpleUploadedFile(
+                    "palika.geojson", json.dumps(geojson).encode()
+                ),
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                handlegeometryfile(geometry_file.id)
+        self.assertEqual(
+            BoundaryGeojson.objects.filter(layer="municipality").count(),
+            2 * len(BOUNDARY_GEOJSON_TOLERANCES),
+        )
+
+    def test_rebuild_replaces_blobs(self):
+        build_boundary_geojson("municipality", [BOUNDARY_GEOJSON_TOLERANCES[0]])
+        MunicipalityGeometry.objects.create(
+            name="palika", geom=Polygon.from_bbox((85.3, 27.7, 85.4, 27.8))
+        )
+        build_boundary_geojson("municipality", [BOUNDARY_GEOJSON_TOLERANCES[0]])
+        self.assertEqual(BoundaryGeojson.objects.count(), 2)
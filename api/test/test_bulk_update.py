@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from core.models import Building, HistoryLog, Road
+from api.serializers.core_serializers import BuildingBulkUpdateSerializer
+from api.test.fixtures import LOCMEM_CACHES
+from api.utils.bulk_update import bulk_update_buildings
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BuildingBulkUpdateTest(TestCase):
+    """
+    Bulk updates change only differing rows and log them as one edit.
+    """
+
+    def test_changed_buildings_share_related_id(self):
+        buildings = [
+            Building.objects.create(tole_name=tole_name)
+            for tole_name in ("old", "old", "new")
+        ]
+        result = bulk_update_buildings(
+            Building.objects.filter(id__in=[building.id for building in buildings]),
+            {"tole_name": "new"},
+        )
+        self.assertEqual(result["matched"], 3)
+        self.assertEqual(result["updated"], 2)
+        logs = HistoryLog.objects.order_by("id")
+        self.assertEqual(
+            [log.object_id for log in logs], [building.id for building in buildings[:2]]
+        )
+        self.assertEqual({log.related_id for log in logs}, {result["related_id"]})
+        self.assertEqual(logs[0].changes, {"tole_name": {"old": "old", "new": "new"}})
+        self.assertEqual(
+            Building.objects.filter(tole_name="new").count(), len(buildings)
+        )
+
+    def test_moved_buildings_are_renumbered(self):
+        Road.objects.create(road_id=7, road_name_en="Main road")
+        moved = Building.objects.create(road_id=1, tole_name="old")
+        kept = Building.objects.create(road_id=7, tole_name="old")
+        with patch("core.utils.renumbering.dispatch_renumbering") as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_update_buildings(
+                    Building.objects.filter(id__in=[moved.id, kept.id]),
+                    {"road_id": 7, "tole_name": "new"},
+                )
+        dispatch.assert_called_once_with([("building_ids", moved.id)])
+        moved.refresh_from_db()
+        self.assertEqual(moved.associate_road_name, "Main road")
+
+    def test_road_must_exist(self):
+        Road.objects.create(road_id=7)
+        serializer = BuildingBulkUpdateSerializer(
+            data={"ids": [1], "changes": {"road_id": 8}}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("road_id", serializer.errors["changes"])
+        serializer = BuildingBulkUpdateSerializer(
+            data={"ids": [1], "changes": {"road_id": 7}}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
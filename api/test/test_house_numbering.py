@@ -0,0 +1,300 @@
+from unittest.mock import patch
+
+import geopandas as gpd
+import numpy as np
+from django.contrib.gis.geos import LineString, Point
+from django.test import TestCase, override_settings
+from shapely.geometry import LineString as ShapelyLineString, Point as ShapelyPoint
+
+from core.batch_numbering import (
+    house_numbers,
+    left_round,
+    merge_reports,
+    number_buildings,
+    number_ward,
+    partition_components,
+    renumber_affected,
+    right_round,
+)
+from core.models import Building, Road, RoadGeometry
+from core.road_network import RoadNetwork
+from core.tasks import dispatch_house_numbering, number_house_partition_task
+from core.script import LeftDirRound, RightDirRound, get_direction
+from core.utils.house_number_index import HouseNumberIndex
+from core.utils.renumbering import dispatch_renumbering
+from api.test.fixtures import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoadNetworkTestCase(TestCase):
+    """
+    Major road 1, subsidiary road 2 starting on it and subsidiary road 3 starting
+    on road 2, loaded as ``self.network``.
+    """
+
+    def setUp(self):
+        for road_id, category, coordinates in (
+            (1, "major", ((85.30, 27.70), (85.31, 27.70))),
+            (2, "subsidiary", ((85.305, 27.70), (85.305, 27.705))),
+            (3, "subsidiary", ((85.305, 27.702), (85.306, 27.702))),
+        ):
+            Road.objects.create(
+                feature=RoadGeometry.objects.create(geom=LineString(coordinates)),
+                road_id=road_id,
+                road_category=category,
+                road_name_en=f"road {road_id}",
+            )
+        self.network = RoadNetwork.load()
+
+
+class RoadNetworkTest(RoadNetworkTestCase):
+    """
+    Subsidiary roads are connected to the road they start on.
+    """
+
+    def test_road_chain(self):
+        road = self.network.road(3)
+        self.assertEqual(self.network.get_parent(road).road_id, 2)
+        self.assertEqual(self.network.get_road_ids(road), "/1/2")
+        self.assertEqual(self.network.get_road_ids(self.network.road(1)), "")
+        self.assertEqual(self.network.get_metric_address("1/2/3"), "road 1")
+
+    def test_metric_prefix(self):
+        prefix = self.network.get_distance(self.network.road(3))
+        self.assertRegex(prefix, r"^/\d+/\d+$")
+        self.assertEqual(self.network.get_distance(self.network.road(1)), "")
+
+    def test_components(self):
+        self.assertEqual(
+            sorted(sorted(component) for component in self.network.components()),
+            [[1, 2, 3]],
+        )
+
+    def test_affected_roads(self):
+        self.assertEqual(self.network.descendants([2]), {2, 3})
+        self.assertEqual(self.network.descendants([3]), {3})
+        road_2 = self.network.projected_geometry(self.network.road(2))
+        self.assertIn(3, self.network.roads_starting_near(road_2))
+        self.assertNotIn(1, self.network.roads_starting_near(road_2))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchNumberingTest(RoadNetworkTestCase):
+    """
+    The vectorized numbering agrees with the per house functions of core.script.
+    """
+
+    def test_rounding_matches_script(self):
+        distances = np.arange(0.1, 30, 0.37)
+        self.assertEqual(
+            left_round(distances).tolist(), [LeftDirRound(d) for d in distances]
+        )
+        self.assertEqual(
+            right_round(distances).tolist(), [RightDirRound(d) for d in distances]
+        )
+
+    def test_sides_match_script(self):
+        road = ShapelyLineString([(0, 0), (100, 0)])
+        gates = [ShapelyPoint(20.4, 5), ShapelyPoint(47.6, -5), ShapelyPoint(80, 3)]
+        numbers, directions = house_numbers(
+            gpd.GeoSeries([road] * len(gates)), gpd.GeoSeries(gates)
+        )
+        self.assertEqual(
+            directions.tolist(), [get_direction(gate, road) for gate in gates]
+        )
+        self.assertEqual(numbers.tolist(), [19, 48, 79])
+
+    def test_ward_is_numbered(self):
+        building = Building.objects.create(
+            ward_no=1,
+            association_type="main",
+            road_id=2,
+            centroid=ShapelyPoint(85.3051, 27.703).wkt,
+            ref_centroid=ShapelyPoint(85.3051, 27.703).wkt,
+        )
+        report = number_ward(1, self.network)
+        self.assertEqual(report["numbered"], 1)
+        building.refresh_from_db()
+        self.assertEqual(building.metric_address, "road 1")
+        self.assertEqual(building.house_no.count("/"), 1)
+
+    def test_only_affected_houses_are_renumbered(self):
+        for road_id, point in ((3, (85.3055, 27.70201)), (1, (85.302, 27.70002))):
+            Building.objects.create(
+                ward_no=1,
+                association_type="main",
+                road_id=road_id,
+                centroid=ShapelyPoint(*point).wkt,
+                ref_centroid=ShapelyPoint(*point).wkt,
+            )
+        report = renumber_affected(road_ids=[2], network=self.network)
+        self.assertEqual(report["roads"], 2)
+        self.assertEqual(report["numbered"], 1)
+        self.assertIsNone(Building.objects.get(road_id=1).house_no)
+        self.assertIsNotNone(Building.objects.get(road_id=3).house_no)
+
+    def test_lowest_id_keeps_a_shared_number(self):
+        gate = ShapelyPoint(85.3051, 27.703).wkt
+        first, second = [
+            Building.objects.create(
+                association_type="main", road_id=2, centroid=gate, ref_centroid=gate
+            )
+            for _ in range(2)
+        ]
+        number_buildings(Building.objects.order_by("-id"), self.network)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertLess(
+            int(first.house_no.rpartition("/")[2]),
+            int(second.house_no.rpartition("/")[2]),
+        )
+
+    def test_skipped_houses_keep_their_numbers(self):
+        gate = ShapelyPoint(85.3051, 27.703).wkt
+        skipped = Building.objects.create(
+            association_type="main", road_id=2, centroid=gate, ref_centroid=gate
+        )
+        number_buildings(Building.objects.all(), self.network)
+        skipped.refresh_from_db()
+        # the ref_centroid is now more than 10m away from the centroid
+        Building.objects.filter(id=skipped.id).update(
+            centroid=ShapelyPoint(85.3061, 27.703).wkt
+        )
+        numbered = Building.objects.create(
+            association_type="main", road_id=2, centroid=gate, ref_centroid=gate
+        )
+        report = number_buildings(Building.objects.all(), self.network)
+        self.assertEqual(report["numbered"], 1)
+        self.assertEqual(report["skipped"], 1)
+        self.assertEqual(Building.objects.get(id=skipped.id).house_no, skipped.house_no)
+        numbered.refresh_from_db()
+        self.assertNotEqual(numbered.house_no, skipped.house_no)
+
+    def test_partitions_skip_roads_without_houses(self):
+        self.assertEqual(partition_components(self.network, 4), [])
+        Building.objects.create(association_type="main", road_id=3)
+        self.assertEqual(
+            [sorted(road_ids) for road_ids in partition_components(self.network, 4)],
+            [[1, 2, 3]],
+        )
+
+    def test_reports_are_merged(self):
+        report = merge_reports(
+            [
+                {
+                    "numbered": 3,
+                    "skipped": 1,
+                    "skipped_reasons": {"road not found": 1},
+                    "elapsed_seconds": 0.5,
+                },
+                {
+                    "numbered": 2,
+                    "skipped": 2,
+                    "skipped_reasons": {"road not found": 2},
+                    "elapsed_seconds": 1.5,
+                },
+            ]
+        )
+        self.assertEqual(report["numbered"], 5)
+        self.assertEqual(report["skipped_reasons"], {"road not found": 3})
+        self.assertEqual(report["partition_seconds_max"], 1.5)
+        self.assertEqual(report["errors"], [])
+
+    def test_failed_partition_is_reported(self):
+        with patch("core.tasks.RoadNetwork.load", side_effect=RuntimeError("boom")):
+            failed = number_house_partition_task([1, 2])
+        self.assertEqual(failed["stat"], "error")
+        report = merge_reports(
+            [
+                failed,
+                {
+                    "numbered": 2,
+                    "skipped": 0,
+                    "skipped_reasons": {},
+                    "elapsed_seconds": 1.5,
+                },
+            ]
+        )
+        self.assertEqual(report["numbered"], 2)
+        self.assertEqual(report["errors"], ["boom"])
+
+    def test_wards_are_not_partitions(self):
+        with self.assertRaises(ValueError):
+            dispatch_house_numbering("ward")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenumberingHookTest(RoadNetworkTestCase):
+    """
+    Saving a road geometry, a road category or a gate queues a renumbering.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.road = Road.objects.get(road_id=2)
+        self.geometry = RoadGeometry.objects.get(pk=self.road.feature_id)
+        self.building = Building.objects.create(
+            association_type="main",
+            road_id=2,
+            ref_centroid=Point(85.3051, 27.703, srid=4326),
+        )
+
+    def queued(self, instance):
+        with patch("core.utils.renumbering.dispatch_renumbering") as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.save()
+        return [record for call in dispatch.call_args_list for record in call.args[0]]
+
+    def test_moved_road_geometry_is_queued(self):
+        previous = self.geometry.geom.wkt
+        self.geometry.geom = LineString((85.305, 27.70), (85.306, 27.705))
+        self.assertEqual(
+            self.queued(self.geometry),
+            [
+                ("feature_ids", self.geometry.pk),
+                ("geometries", previous),
+                ("geometries", self.geometry.geom.wkt),
+            ],
+        )
+
+    def test_road_category_is_queued(self):
+        self.road.road_category = "major"
+        self.assertIn(("road_ids", 2), self.queued(self.road))
+
+    def test_moved_gate_is_queued(self):
+        self.building.ref_centroid = Point(85.3052, 27.703, srid=4326)
+        self.assertEqual(
+            self.queued(self.building), [("building_ids", self.building.pk)]
+        )
+
+    def test_unchanged_save_is_not_queued(self):
+        self.road.road_name_en = "renamed"
+        for instance in (self.geometry, self.road, self.building):
+            self.assertEqual(self.queued(instance), [])
+
+    def test_dispatch_failure_is_logged(self):
+        with patch(
+            "core.tasks.renumber_buildings_task.delay",
+            side_effect=RuntimeError("no broker"),
+        ):
+            with self.assertLogs("core.utils.renumbering", "ERROR"):
+                dispatch_renumbering([("building_ids", self.building.pk)])
+
+
+class HouseNumberIndexTest(TestCase):
+    """
+    Taken numbers are bumped on the same side of the same road only.
+    """
+
+    def test_collisions_are_scoped_per_road(self):
+        index = HouseNumberIndex()
+        self.assertEqual(index.assign(1, 10, "494", 15, 2), 15)
+        self.assertEqual(index.assign(2, 10, "494", 15, 2), 17)
+        self.assertEqual(index.assign(3, 11, "494", 15, 2), 15)
+        self.assertEqual(index.assign(1, 10, "494", 15, 2), 15)
+
+    def test_released_number_is_reused(self):
+        index = HouseNumberIndex()
+        index.assign(1, 10, "", 3, 1)
+        index.release(1)
+        self.assertEqual(index.assign(2, 10, "", 3, 1), 3)
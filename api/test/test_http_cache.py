@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.models import PalikaGeometry
+from core.utils.http_cache import is_public_request, layer_validators
+from api.test.fixtures import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LayerVersionTest(TestCase):
+    """
+    Layer responses are versioned by the layer generation bumped on writes.
+    """
+
+    def test_etag_is_stable(self):
+        self.assertEqual(
+            layer_validators([PalikaGeometry]), layer_validators([PalikaGeometry])
+        )
+
+    def test_etag_changes_on_write(self):
+        etag, _ = layer_validators([PalikaGeometry])
+        time.sleep(0.01)
+        with self.captureOnCommitCallbacks(execute=True):
+            PalikaGeometry.objects.create(area=1)
+        self.assertNotEqual(layer_validators([PalikaGeometry])[0], etag)
+
+    def test_tile_is_not_modified(self):
+        url = "/api/v1/dmaps/municipality-boundary/14/12076/6874/"
+        response = self.client.get(url)
+        self.assertIn("ETag", response)
+        self.assertIn("max-age", response["Cache-Control"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_anonymous_unfiltered_responses_are_public(self):
+        url = "/api/v1/dmaps/municipality-boundary/14/12076/6874/"
+        response = self.client.get(url)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("Authorization", response["Vary"])
+
+        self.client.force_login(get_user_model().objects.create(username="editor"))
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+
+        request = RequestFactory().get(url, {"ward_no": 3})
+        self.assertFalse(is_public_request(request, filtered=True))
+        request = RequestFactory().get(url, HTTP_AUTHORIZATION="Token abc")
+        self.assertFalse(is_public_request(request))
@@ -0,0 +1,449 @@
+import os
+import tempfile
+import zipfile
+from unittest.mock import Mock, patch
+
+import geopandas as gpd
+import pandas as pd
+from django.contrib.gis.geos import LineString
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from shapely.geometry import (
+    LineString as ShapelyLineString,
+    Point as ShapelyPoint,
+    Polygon as ShapelyPolygon,
+)
+
+from core.models import (
+    Building,
+    BuildingGeometry,
+    FeatureCollection,
+    Road,
+    RoadGeometry,
+    RoadUpload,
+    VectorLayer,
+)
+from core.tasks import process_road_file, zipped_shapefile
+from user.models import User
+from api.test.fixtures import LOCMEM_CACHES
+from api.utils.file_handlers import (
+    BUILDING_NUMERIC_FIELDS,
+    BUILDING_REQUIRED_FIELDS,
+    IngestionReport,
+    convert_numeric_attributes,
+    copy_feature_collection,
+    get_char_fields_max_lengths,
+    handle_in_chunks,
+    handle_prepared_buildings,
+    handle_prepared_roads,
+    prepare_building_chunk,
+    prepare_chunks,
+    prepare_road_chunk,
+    read_csv_chunks,
+    read_file_chunks,
+    write_in_batches,
+)
+
+
+class FeatureCollectionCopyTest(TestCase):
+    """
+    Vector layer features are loaded with COPY through a staging table.
+    """
+
+    def test_features_are_copied(self):
+        layer = VectorLayer.objects.create(layer_name="landuse")
+        gdf = gpd.GeoDataFrame(
+            {"name": ["forest", None], "area": [1.5, float("nan")]},
+            geometry=[ShapelyPoint(85.3, 27.7, 1), ShapelyPoint(85.4, 27.8)],
+            crs="epsg:4326",
+        )
+        created = copy_feature_collection(gdf, layer.id, None, FeatureCollection)
+        self.assertEqual(created, 2)
+        features = FeatureCollection.objects.filter(vector_layer=layer).order_by("id")
+        self.assertEqual(features[0].attr_data, {"name": "forest", "area": 1.5})
+        self.assertEqual(features[1].attr_data, {"name": None, "area": None})
+        self.assertFalse(features[0].geom.hasz)
+        self.assertFalse(features[0].is_deleted)
+
+
+class IngestionPrepareTest(TestCase):
+    """
+    Chunks are prepared without the database and report skipped rows by their
+    index in the file, also when prepared in worker processes.
+    """
+
+    def setUp(self):
+        self.ward_gdf = gpd.GeoDataFrame(
+            {"ward_no": [3]},
+            geometry=[ShapelyPolygon([(0, 0), (10, 0), (10, 10), (0, 10)])],
+            crs="epsg:4326",
+        )
+        self.chunks = [
+            gpd.GeoDataFrame(
+                {field: [None, None] for field in BUILDING_REQUIRED_FIELDS},
+                geometry=[
+                    ShapelyPoint(x, 5).buffer(0.1) for x in (start + 4, start + 8)
+                ],
+                index=[start, start + 1],
+                crs="epsg:4326",
+            )
+            for start in (0, 2)
+        ]
+
+    def test_rows_outside_wards_are_skipped(self):
+        prepared = prepare_building_chunk(self.chunks[1], self.ward_gdf, {})
+        self.assertEqual(prepared["errors"], {3: "centroid outside every ward"})
+        self.assertEqual(prepared["computed"]["ward_no"].tolist(), [3])
+        self.assertEqual(len(prepared["computed"]["plus_code"][2]), 11)
+
+    def test_workers_keep_chunk_order(self):
+        prepared = list(
+            prepare_chunks(
+                prepare_building_chunk, iter(self.chunks), 2, self.ward_gdf, {}
+            )
+        )
+        self.assertEqual(
+            [list(chunk["attributes"].index) for chunk in prepared], [[0, 1], [2]]
+        )
+
+
+class IngestionReportTest(TestCase):
+    """
+    The ingestion report publishes the row counts after every chunk and batch.
+    """
+
+    def test_counts_are_published(self):
+        published = []
+        report = IngestionReport(published.append)
+        report.read(3, {2: "unknown road_id"})
+        report.inserted(2)
+        self.assertEqual(len(published), 2)
+        self.assertEqual(published[-1]["rows_read"], 3)
+        self.assertEqual(published[-1]["rows_inserted"], 2)
+        self.assertEqual(published[-1]["skipped_reasons"], {"unknown road_id": 1})
+
+    def test_skipped_rows_and_stages_are_reported(self):
+        report = IngestionReport()
+        report.read(2, {5: "unknown road_id"})
+        report.skip({9: "insert failed (DataError)"})
+        report.timed({"prepare": 0.5, "insert": 1})
+        report.timed({"insert": 1})
+        counts = report.as_dict()
+        self.assertEqual(counts["rows_skipped"], 2)
+        self.assertEqual(
+            counts["skipped_rows"],
+            {"unknown road_id": [5], "insert failed (DataError)": [9]},
+        )
+        self.assertEqual(counts["stage_seconds"], {"prepare": 0.5, "insert": 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IngestionValuesTest(TestCase):
+    """
+    Values read as text are converted before the insert and a bad value only
+    skips its own row.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email="importer@example.com")
+        Road.objects.create(
+            feature=RoadGeometry.objects.create(
+                geom=LineString((85.30, 27.70), (85.31, 27.70))
+            ),
+            road_id=7,
+            road_name_en="road 7",
+        )
+        self.ward_gdf = gpd.GeoDataFrame(
+            {"ward_no": [3]},
+            geometry=[ShapelyPolygon([(85, 27), (86, 27), (86, 28), (85, 28)])],
+            crs="epsg:4326",
+        )
+
+    def buildings(self, **columns):
+        rows = len(next(iter(columns.values())))
+        values = {field: [None] * rows for field in BUILDING_REQUIRED_FIELDS}
+        values.update(columns)
+        return gpd.GeoDataFrame(
+            values,
+            geometry=[
+                ShapelyPoint(85.305 + i * 0.001, 27.701).buffer(0.0001)
+                for i in range(rows)
+            ],
+            crs="epsg:4326",
+        )
+
+    def import_buildings(self, gdf):
+        return handle_prepared_buildings(
+            prepare_building_chunk(
+                gdf, self.ward_gdf, get_char_fields_max_lengths(Building)
+            ),
+            self.user.id,
+            BuildingGeometry,
+            Building,
+        )
+
+    def test_text_road_id_matches_road(self):
+        _, _, message = self.import_buildings(
+            self.buildings(road_id=["7", " 7 ", ""], floor=["2", "", "1.5"])
+        )
+        self.assertEqual(message, "")
+        self.assertEqual(
+            sorted(Building.objects.values_list("road_id", flat=True), key=str),
+            [7, 7, None],
+        )
+        self.assertEqual(
+            set(Building.objects.values_list("associate_road_name", flat=True)),
+            {"road 7", None},
+        )
+
+    def test_invalid_values_skip_their_rows(self):
+        _, _, message = self.import_buildings(
+            self.buildings(road_id=["7", "seven", "7"], floor=["2", "1", "two"])
+        )
+        self.assertEqual(Building.objects.count(), 1)
+        self.assertIn("(invalid road_id)", message)
+        self.assertIn("(invalid floor)", message)
+
+    def test_numeric_conversion(self):
+        attributes, errors = convert_numeric_attributes(
+            pd.DataFrame(
+                {"build_id": ["1", 2.0, "2.5", None], "floor": ["1.5", "", 3, "x"]},
+                dtype=object,
+            ),
+            BUILDING_NUMERIC_FIELDS,
+        )
+        self.assertEqual(errors, {2: "invalid build_id", 3: "invalid floor"})
+        self.assertEqual(attributes["build_id"].tolist(), [1, 2])
+        self.assertEqual(attributes["floor"].tolist(), [1.5, None])
+
+    def test_failed_batch_is_written_row_by_row(self):
+        written = []
+
+        def write(rows):
+            if any(row["value"] == "bad" for row, _ in rows):
+                raise ValueError("bad value")
+            written.extend(row["value"] for row, _ in rows)
+
+        attributes = pd.DataFrame({"value": ["a", "bad", "c", "d"]})
+        report = IngestionReport()
+        computed = pd.DataFrame({"position": range(4)})
+        created, failed = write_in_batches(write, attributes, computed, 2, report)
+        self.assertEqual(created, 3)
+        self.assertEqual(written, ["a", "c", "d"])
+        self.assertEqual(failed, {1: "insert failed (ValueError)"})
+        self.assertEqual(report.as_dict()["rows_inserted"], 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoadImportTest(TestCase):
+    """
+    Roads are written in batches with their computed lengths, ends and wards.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email="importer@example.com")
+        self.ward_gdf = gpd.GeoDataFrame(
+            {"ward_no": [3]},
+            geometry=[ShapelyPolygon([(85, 27), (86, 27), (86, 28), (85, 28)])],
+            crs="epsg:4326",
+        )
+
+    def roads(self, **columns):
+        values = {
+            "road_id": ["1", "2", "3"],
+            "road_name": ["a", "b", "c"],
+            "width": ["4", "5.5", "6"],
+            "road_cat": ["major", "minor", "subsidiary"],
+            "road_class": [None] * 3,
+            "road_type": [None] * 3,
+            "surface": ["paved", None, "gravel"],
+        }
+        values.update(columns)
+        return gpd.GeoDataFrame(
+            values,
+            geometry=[
+                ShapelyLineString([(85.3, 27.7 + i * 0.01), (85.31, 27.7 + i * 0.01)])
+                for i in range(3)
+            ],
+            crs="epsg:4326",
+        )
+
+    def test_roads_are_written_in_batches(self):
+        geometry_type, _ = handle_prepared_roads(
+            prepare_road_chunk(self.roads(), self.ward_gdf),
+            self.user.id,
+            RoadGeometry,
+            Road,
+            batch_size=2,
+        )
+        self.assertEqual(geometry_type, "LineString")
+        roads = list(Road.objects.order_by("road_id"))
+        self.assertEqual([road.road_id for road in roads], [1, 2, 3])
+        self.assertEqual(roads[1].road_width, 5.5)
+        self.assertEqual(roads[0].ward_no, [3])
+        self.assertAlmostEqual(roads[0].road_length, 988, delta=5)
+        self.assertEqual(roads[0].attr_data, {"surface": "paved"})
+        self.assertEqual(roads[0].start_point.coords, (85.3, 27.7))
+
+    def test_invalid_rows_are_skipped(self):
+        report = IngestionReport()
+        handle_prepared_roads(
+            prepare_road_chunk(self.roads(width=["4", "wide", "6"]), self.ward_gdf),
+            self.user.id,
+            RoadGeometry,
+            Road,
+            report=report,
+        )
+        self.assertEqual(Road.objects.count(), 2)
+        self.assertEqual(report.as_dict()["skipped_rows"], {"invalid width": [1]})
+
+    def test_missing_fields_are_reported(self):
+        message = handle_prepared_roads(
+            prepare_road_chunk(self.roads().drop(columns=["width"]), self.ward_gdf),
+            self.user.id,
+            RoadGeometry,
+            Road,
+        )
+        self.assertIn("width", message)
+        self.assertFalse(Road.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ParallelIngestionTest(TestCase):
+    """
+    Uploads imported with several workers prepare their chunks in a process pool,
+    unless the task runs in a daemonic celery worker child.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create(email="importer@example.com")
+        roads = gpd.GeoDataFrame(
+            {
+                "road_id": [1, 2, 3],
+                "road_name": ["a", "b", "c"],
+                "width": [4, 5.5, 6],
+                "road_cat": ["major", "minor", "subsidiary"],
+                "road_class": [None] * 3,
+                "road_type": [None] * 3,
+            },
+            geometry=[
+                ShapelyLineString([(85.3, 27.7 + i * 0.01), (85.31, 27.7 + i * 0.01)])
+                for i in range(3)
+            ],
+            crs="epsg:4326",
+        )
+        self.upload = RoadUpload.objects.create(
+            file_upload=SimpleUploadedFile("roads.geojson", roads.to_json().encode())
+        )
+
+    def test_chunks_are_prepared_in_processes(self):
+        process_road_file(self.upload.id, self.user.id, workers=2)
+        self.assertEqual(
+            sorted(Road.objects.values_list("road_id", flat=True)), [1, 2, 3]
+        )
+
+    def test_worker_child_prepares_chunks_itself(self):
+        with patch(
+            "api.utils.file_handlers.multiprocessing.current_process",
+            return_value=Mock(daemon=True),
+        ), patch("api.utils.file_handlers.ProcessPoolExecutor") as pool:
+            process_road_file(self.upload.id, self.user.id, workers=2)
+        pool.assert_not_called()
+        self.assertEqual(Road.objects.count(), 3)
+
+
+class ChunkReadingTest(TestCase):
+    """
+    Uploaded files are read in chunks indexed by the position of their rows.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_csv_chunks(self):
+        path = os.path.join(self.directory.name, "buildings.csv")
+        pd.DataFrame(
+            {
+                "longitude": [85.3 + i * 0.01 for i in range(5)],
+                "latitude": [27.7] * 5,
+                "remarks": ["", "a", "", "b", ""],
+            }
+        ).to_csv(path, index=False)
+        chunks = list(read_csv_chunks(path, chunk_size=2))
+        self.assertEqual([list(chunk.index) for chunk in chunks], [[0, 1], [2, 3], [4]])
+        self.assertEqual(chunks[1].geometry.iloc[0].x, 85.32)
+        self.assertEqual(chunks[0]["remarks"].tolist(), ["", "a"])
+
+    def test_file_chunks(self):
+        path = os.path.join(self.directory.name, "buildings.geojson")
+        gpd.GeoDataFrame(
+            {"name": [str(i) for i in range(5)]},
+            geometry=[ShapelyPoint(85.3 + i * 0.01, 27.7) for i in range(5)],
+            crs="epsg:4326",
+        ).to_file(path, driver="GeoJSON")
+        chunks = list(read_file_chunks(path, chunk_size=2))
+        self.assertEqual([list(chunk.index) for chunk in chunks], [[0, 1], [2, 3], [4]])
+        self.assertEqual(chunks[2]["name"].tolist(), ["4"])
+
+    def test_chunk_results_are_combined(self):
+        def handler(bounds):
+            return "Point", {"total_bounds": bounds}, f"{bounds[0]}\n"
+
+        self.assertEqual(
+            handle_in_chunks(handler, [[0, 0, 1, 1], [-1, 2, 0, 3]]),
+            ("Point", {"total_bounds": [-1.0, 0.0, 1.0, 3.0]}, "0\n-1\n"),
+        )
+        self.assertEqual(
+            handle_in_chunks(lambda chunk: chunk, ["missing keys"]), "missing keys"
+        )
+        with self.assertRaises(ValueError):
+            handle_in_chunks(handler, [])
+
+
+class ZippedShapefileTest(TestCase):
+    """
+    A zipped shapefile is read in place, without extracting the archive.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def zip_files(self, *paths):
+        archive = os.path.join(self.directory.name, "upload.zip")
+        with zipfile.ZipFile(archive, "w") as zip_ref:
+            for path in paths:
+                zip_ref.write(path, os.path.basename(path))
+        return archive
+
+    def test_shapefile_is_read_from_the_archive(self):
+        path = os.path.join(self.directory.name, "roads.shp")
+        gpd.GeoDataFrame(
+            {"road_id": [1, 2]},
+            geometry=[
+                ShapelyLineString([(85.3, 27.7), (85.31, 27.7)]),
+                ShapelyLineString([(85.31, 27.7), (85.32, 27.71)]),
+            ],
+            crs="epsg:4326",
+        ).to_file(path)
+        parts = [
+            os.path.join(self.directory.name, f"roads.{extension}")
+            for extension in ("shp", "shx", "dbf", "prj")
+        ]
+        archive = self.zip_files(*parts)
+        shapefile = zipped_shapefile(archive)
+        self.assertEqual(shapefile, f"zip://{archive}!roads.shp")
+        chunks = list(read_file_chunks(shapefile))
+        self.assertEqual(chunks[0]["road_id"].tolist(), [1, 2])
+
+    def test_archive_without_shapefile(self):
+        path = os.path.join(self.directory.name, "readme.txt")
+        with open(path, "w") as file:
+            file.write("no features")
+        self.assertIsNone(zipped_shapefile(self.zip_files(path)))
@@ -0,0 +1,156 @@
+from django.contrib.gis.geos import Polygon
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Building, BuildingCategoryChoice, BuildingGeometry, HistoryLog
+from core.utils.history import queue_record
+from api.test.fixtures import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChoiceRegistryTest(TestCase):
+    """
+    Building choices are read from the registry instead of queried per instance.
+    """
+
+    def test_instantiation_costs_no_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BuildingCategoryChoice.objects.create(alias_name="RCC", type="roof_type")
+        Building()
+        with self.assertNumQueries(0):
+            building = Building(roof_type="rcc")
+        self.assertEqual(building.get_roof_type_display(), "RCC")
+
+    def test_saved_choice_is_registered(self):
+        Building()
+        with self.captureOnCommitCallbacks(execute=True):
+            BuildingCategoryChoice.objects.create(alias_name="Tin", type="roof_type")
+        self.assertEqual(Building(roof_type="tin").get_roof_type_display(), "Tin")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HistoryLogQueueTest(TestCase):
+    """
+    History logs are queued during an edit and written together on commit.
+    """
+
+    def test_logs_of_one_edit_are_related(self):
+        geometry = BuildingGeometry.objects.create(geom=Polygon.from_bbox((0, 0, 1, 1)))
+        building = Building.objects.create(feature=geometry)
+        timestamp = "2023-01-01T00:00:00.000000Z"
+        with self.captureOnCommitCallbacks(execute=True):
+            geometry.geom = Polygon.from_bbox((0, 0, 2, 2))
+            geometry.timestamp = timestamp
+            geometry.save()
+            building.building_id = 5
+            building.timestamp = timestamp
+            building.save()
+            self.assertFalse(HistoryLog.objects.exists())
+        logs = list(HistoryLog.objects.order_by("id"))
+        self.assertEqual(len(logs), 2)
+        self.assertEqual({log.related_id for log in logs}, {logs[0].id})
+        self.assertEqual({log.association_id for log in logs}, {building.id})
+
+    def test_rolled_back_savepoint_drops_its_records(self):
+        written = []
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_record("outer", written.extend)
+            try:
+                with transaction.atomic():
+                    queue_record("rolled back", written.extend)
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                queue_record("released", written.extend)
+            queue_record("after", written.extend)
+        self.assertEqual(sorted(written), ["after", "outer", "released"])
+
+    def test_logs_of_rolled_back_edit_are_dropped(self):
+        geometry = BuildingGeometry.objects.create(geom=Polygon.from_bbox((0, 0, 1, 1)))
+        geometry = BuildingGeometry.objects.get(pk=geometry.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    geometry.geom = Polygon.from_bbox((0, 0, 2, 2))
+                    geometry.timestamp = "2023-01-01T00:00:00.000000Z"
+                    geometry.save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(HistoryLog.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DirtyFieldsTest(TestCase):
+    """
+    Loaded instances report their changed fields and only save those columns.
+    """
+
+    def test_save_updates_changed_columns(self):
+        building = Building.objects.create(remarks="old", owner_name="owner")
+        building = Building.objects.get(pk=building.pk)
+        building.remarks = "new"
+        self.assertEqual(
+            [field.name for field in building.get_dirty_fields()], ["remarks"]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            building.save()
+        update = next(
+            query["sql"] for query in queries if query["sql"].startswith("UPDATE")
+        )
+        self.assertIn('"remarks"', update)
+        self.assertNotIn('"owner_name"', update)
+        self.assertFalse(building.get_dirty_fields())
+
+    def test_refresh_takes_a_new_snapshot(self):
+        building = Building.objects.create(remarks="old")
+        Building.objects.filter(pk=building.pk).update(remarks="new")
+        building.refresh_from_db()
+        self.assertFalse(building.get_dirty_fields())
+        with CaptureQueriesContext(connection) as queries:
+            building.save()
+        self.assertFalse(
+            [query for query in queries if query["sql"].startswith("UPDATE")]
+        )
+
+    def test_refreshed_edit_logs_no_changes(self):
+        building = Building.objects.create(remarks="old")
+        Building.objects.filter(pk=building.pk).update(
+            remarks="new", timestamp="2023-01-01T00:00:00Z"
+        )
+        building.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                building.save()
+        self.assertFalse(HistoryLog.objects.exists())
+        for query in queries:
+            self.assertNotIn('"remarks"', query["sql"])
+
+    def test_geometry_is_compared_by_ewkb(self):
+        geometry = BuildingGeometry.objects.create(geom=Polygon.from_bbox((0, 0, 1, 1)))
+        geometry = BuildingGeometry.objects.get(pk=geometry.pk)
+        geometry.geom = Polygon.from_bbox((0, 0, 1, 1))
+        self.assertFalse(geometry.get_dirty_fields())
+        geometry.geom = Polygon.from_bbox((0, 0, 2, 2))
+        self.assertEqual(geometry.get_changes(), {"geom": geometry.geom.wkt})
+
+    def test_previous_geometry_is_not_queried(self):
+        geometry = BuildingGeometry.objects.create(geom=Polygon.from_bbox((0, 0, 1, 1)))
+        geometry = BuildingGeometry.objects.get(pk=geometry.pk)
+        geometry.geom = Polygon.from_bbox((0, 0, 2, 2))
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks() as callbacks:
+                geometry.save()
+        self.assertFalse(
+            [query for query in queries if query["sql"].startswith("SELECT")]
+        )
+        self.assertEqual(len(callbacks), 1)
+
+    def test_unchanged_geometry_invalidates_no_tile(self):
+        geometry = BuildingGeometry.objects.create(geom=Polygon.from_bbox((0, 0, 1, 1)))
+        geometry = BuildingGeometry.objects.get(pk=geometry.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            geometry.save()
+        self.assertEqual(callbacks, [])
@@ -0,0 +1,135 @@
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.test import TestCase
+
+from core.models import BuildingGeometry, FeatureCollection, RoadGeometry
+from core.tile import MERCATOR_MAX, composite_intersect, tile_edges, tile_range
+
+
+class TileBuildingsTestCase(TestCase):
+    """
+    Twenty small buildings along the bottom edge of ``TILE``.
+    """
+
+    TILE = (14, 12076, 6874)
+
+    def setUp(self):
+        w, s, e, n = tile_edges(x=self.TILE[1], y=self.TILE[2], z=self.TILE[0])
+        step = (e - w) / 20
+        BuildingGeometry.objects.bulk_create(
+            [
+                BuildingGeometry(
+                    geom=Polygon.from_bbox(
+                        (w + i * step, s, w + i * step + step / 2, s + step / 2)
+                    )
+                )
+                for i in range(20)
+            ]
+        )
+
+
+class MVTQueryIndexTest(TileBuildingsTestCase):
+    """
+    The tile query must filter on the untransformed geometry column so that the
+    GiST index on it can be used.
+    """
+
+    def explain(self, manager):
+        query, parameters = manager._build_query(tile=self.TILE)
+        with connection.cursor() as cursor:
+            # the planner prefers a sequential scan on tiny tables, forbidding it
+            # shows whether an index scan is possible at all
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + query, parameters + ["ALL", 0])
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_geometry_column_is_not_transformed_in_where_clause(self):
+        query, _ = BuildingGeometry.vector_tiles._build_query(tile=self.TILE)
+        where_clause = query.split("WHERE")[1]
+        self.assertIn("core_buildinggeometry.geom && ST_Transform(", where_clause)
+        self.assertNotIn("ST_Transform(core_buildinggeometry.geom", where_clause)
+
+    def test_tile_query_uses_spatial_index(self):
+        plan = self.explain(BuildingGeometry.vector_tiles)
+        self.assertIn("Index Scan", plan)
+        self.assertNotIn("Seq Scan on core_buildinggeometry", plan)
+
+    def test_envelope_is_transformed_to_column_srid(self):
+        query, _ = FeatureCollection.vector_tiles._build_query(tile=self.TILE)
+        self.assertIn("3857), 4236)", query.split("WHERE")[1])
+
+    def test_tile_query_returns_features(self):
+        mvt = BuildingGeometry.vector_tiles.intersect(tile=self.TILE)
+        self.assertTrue(bytes(mvt))
+
+    def test_tile_range_covers_tile(self):
+        w, s, e, n = tile_edges(x=self.TILE[1], y=self.TILE[2], z=self.TILE[0])
+        center = ((w + e) / 2, (s + n) / 2)
+        self.assertEqual(tile_range(*center, *center, self.TILE[0]), [self.TILE[1:]])
+
+
+class MVTProfileTest(TestCase):
+    """
+    Tile profiles prune attributes and simplify geometries at low zoom levels.
+    """
+
+    def test_low_zoom_query_uses_profile(self):
+        query, _ = BuildingGeometry.vector_tiles._build_query(tile=(12, 3019, 1718))
+        self.assertIn("ST_SnapToGrid(ST_Simplify(", query)
+        self.assertIn('SELECT "id", mvt_geom FROM', query)
+
+    def test_high_zoom_query_keeps_full_detail(self):
+        query, _ = BuildingGeometry.vector_tiles._build_query(tile=(18, 193230, 110000))
+        self.assertNotIn("ST_Simplify(", query)
+        self.assertIn("created_by_id", query)
+
+    def test_simplify_tolerance_is_one_pixel(self):
+        profile = BuildingGeometry.vector_tiles._get_profile(13)
+        geometry = BuildingGeometry.vector_tiles._create_geometry_expression(
+            "core_buildinggeometry", profile, 13
+        )
+        self.assertIn(f"{2 * MERCATOR_MAX / 2**13 / 256}", geometry)
+
+
+class MVTClusterTest(TileBuildingsTestCase):
+    """
+    Buildings are served as clusters up to TILE_CLUSTER_MAX_ZOOM.
+    """
+
+    LOW_ZOOM_TILE = (12, 3019, 1718)
+
+    def test_low_zoom_tile_is_clustered(self):
+        manager = BuildingGeometry.vector_tiles
+        self.assertTrue(manager._use_clusters(self.LOW_ZOOM_TILE))
+        self.assertFalse(manager._use_clusters(self.TILE))
+        self.assertFalse(manager._use_clusters(self.LOW_ZOOM_TILE, cluster=False))
+        self.assertTrue(bytes(manager.intersect(tile=self.LOW_ZOOM_TILE)))
+
+    def test_cluster_query_groups_on_grid(self):
+        query, _ = BuildingGeometry.vector_tiles._build_cluster_query(
+            tile=self.LOW_ZOOM_TILE
+        )
+        self.assertIn("count(*) AS count", query)
+        self.assertIn("GROUP BY floor(ST_X(point.centroid)", query)
+
+
+class CompositeTileTest(TileBuildingsTestCase):
+    """
+    Several models are rendered as named layers of one tile in a single query.
+    """
+
+    def test_layer_name_is_used(self):
+        query, _ = BuildingGeometry.vector_tiles._build_query(
+            tile=self.TILE, layer_name="building"
+        )
+        self.assertIn("ST_AsMVT(q, 'building'", query)
+
+    def test_composite_tile_contains_every_layer(self):
+        mvt = bytes(
+            composite_intersect(
+                {"building": BuildingGeometry, "road": RoadGeometry}, *self.TILE
+            )
+        )
+        self.assertIn(b"building", mvt)
+        self.assertNotIn(b"road", mvt)
+        self.assertNotIn(b"default", mvt)
@@ -0,0 +1,63 @@
+import tempfile
+
+from django.contrib.gis.geos import Polygon
+from django.test import TestCase, override_settings
+
+from core.models import BuildingGeometry
+from core.tile import tile_edges
+from core.utils.tile_archive import export_tile_archive, get_archived_tile
+from dmaps.models import MunicipalityGeometry
+from api.test.fixtures import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TileArchiveTest(TestCase):
+    """
+    Exported tiles are served from the archive, the others from the database.
+    """
+
+    TILE = (14, 12076, 6874)
+    OTHER_TILE = (14, 12076, 6875)
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        w, s, e, n = tile_edges(x=self.TILE[1], y=self.TILE[2], z=self.TILE[0])
+        self.extent = (
+            w + (e - w) / 4,
+            s + (n - s) / 4,
+            e - (e - w) / 4,
+            n - (n - s) / 4,
+        )
+        BuildingGeometry.objects.create(geom=Polygon.from_bbox(self.extent))
+
+    def test_archives_are_disabled_by_default(self):
+        with override_settings(TILE_ARCHIVE_ROOT=None):
+            self.assertIsNone(get_archived_tile(BuildingGeometry, *self.TILE))
+            with self.assertRaises(ValueError):
+                export_tile_archive(BuildingGeometry, [self.extent], 14, 14)
+
+    def test_export_writes_tiles(self):
+        for archive_format in ("mbtiles", "directory"):
+            with self.subTest(archive_format), override_settings(
+                TILE_ARCHIVE_ROOT=f"{self.root.name}/{archive_format}"
+            ):
+                counts = export_tile_archive(
+                    BuildingGeometry,
+                    [self.extent],
+                    14,
+                    14,
+                    archive_format=archive_format,
+                )
+                self.assertEqual(counts, {"tiles": 1, "empty": 0})
+                self.assertTrue(get_archived_tile(BuildingGeometry, *self.TILE))
+                self.assertIsNone(get_archived_tile(BuildingGeometry, *self.OTHER_TILE))
+
+    def test_missing_tile_falls_back_to_database(self):
+        url = "/api/v1/dmaps/municipality-boundary/{}/{}/{}/"
+        with override_settings(TILE_ARCHIVE_ROOT=self.root.name):
+            export_tile_archive(MunicipalityGeometry, [self.extent], 14, 14)
+            response = self.client.get(url.format(*self.TILE))
+            self.assertEqual(response["tile-cache"], "archive")
+            response = self.client.get(url.format(*self.OTHER_TILE))
+            self.assertNotEqual(response["tile-cache"], "archive")
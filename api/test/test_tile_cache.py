@@ -0,0 +1,154 @@
+import time
+
+from django.contrib.gis.geos import LineString, Polygon
+from django.test import TestCase, override_settings
+
+from core.models import Building, BuildingGeometry, Road, RoadGeometry
+from core.tile import tile_edges
+from core.utils.tile_cache import (
+    invalidate_layer,
+    invalidate_tiles,
+    tile_cache_key,
+    tile_generations,
+)
+from api.test.fixtures import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TileCacheKeyTest(TestCase):
+    """
+    Equivalent requests of one tile share a cache key.
+    """
+
+    TILE = (14, 12076, 6874)
+
+    def test_params_are_canonical(self):
+        generations = [1]
+        self.assertEqual(
+            tile_cache_key(
+                [BuildingGeometry],
+                *self.TILE,
+                params={"ward_no": 3, "road_id": "7"},
+                generations=generations,
+            ),
+            tile_cache_key(
+                ["core.buildinggeometry"],
+                *self.TILE,
+                params={"road_id": 7, "ward_no": "3"},
+                generations=generations,
+            ),
+        )
+
+    def test_key_depends_on_tile_params_and_generation(self):
+        key = tile_cache_key([BuildingGeometry], *self.TILE, generations=[1])
+        self.assertNotEqual(
+            key, tile_cache_key([BuildingGeometry], 14, 12076, 6875, generations=[1])
+        )
+        self.assertNotEqual(
+            key,
+            tile_cache_key(
+                [BuildingGeometry], *self.TILE, params={"ward_no": 3}, generations=[1]
+            ),
+        )
+        self.assertNotEqual(
+            key, tile_cache_key([BuildingGeometry], *self.TILE, generations=[2])
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TileInvalidationTest(TestCase):
+    """
+    An edit only invalidates the tiles intersecting it.
+    """
+
+    TILE = (14, 12076, 6874)
+    OTHER_TILE = (14, 12000, 6800)
+
+    def test_only_intersecting_tiles_are_invalidated(self):
+        w, s, e, n = tile_edges(x=self.TILE[1], y=self.TILE[2], z=self.TILE[0])
+        before = tile_generations([BuildingGeometry], *self.TILE)
+        other_before = tile_generations([BuildingGeometry], *self.OTHER_TILE)
+        time.sleep(0.01)
+        invalidate_tiles(
+            [BuildingGeometry],
+            (w + (e - w) / 4, s + (n - s) / 4, e - (e - w) / 4, n - (n - s) / 4),
+        )
+        self.assertGreater(
+            tile_generations([BuildingGeometry], *self.TILE)[0], before[0]
+        )
+        self.assertEqual(
+            tile_generations([BuildingGeometry], *self.OTHER_TILE), other_before
+        )
+
+    def test_layer_invalidation_covers_every_tile(self):
+        before = tile_generations([BuildingGeometry], *self.OTHER_TILE)
+        time.sleep(0.01)
+        invalidate_layer([BuildingGeometry])
+        self.assertGreater(
+            tile_generations([BuildingGeometry], *self.OTHER_TILE)[0], before[0]
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ModelTileInvalidationTest(TestCase):
+    """
+    Saving or deleting a building or road invalidates the tiles it covers once the
+    transaction commits.
+    """
+
+    TILE = (14, 12076, 6874)
+    OTHER_TILE = (14, 12000, 6800)
+
+    def setUp(self):
+        w, s, e, n = tile_edges(x=self.TILE[1], y=self.TILE[2], z=self.TILE[0])
+        self.step = ((e - w) / 8, (n - s) / 8)
+        self.origin = (w + self.step[0], s + self.step[1])
+
+    def box(self, offset=0):
+        x, y = self.origin[0] + offset * self.step[0], self.origin[1]
+        return Polygon.from_bbox((x, y, x + self.step[0], y + self.step[1]))
+
+    def line(self, offset=0):
+        x, y = self.origin[0] + offset * self.step[0], self.origin[1]
+        return LineString((x, y), (x + self.step[0], y + self.step[1]), srid=4326)
+
+    def assertInvalidates(self, layer, edit):
+        before = tile_generations([layer], *self.TILE)
+        other_before = tile_generations([layer], *self.OTHER_TILE)
+        time.sleep(0.01)
+        with self.captureOnCommitCallbacks(execute=True):
+            edit()
+        self.assertGreater(tile_generations([layer], *self.TILE)[0], before[0])
+        self.assertEqual(tile_generations([layer], *self.OTHER_TILE), other_before)
+
+    def test_building_geometry_edits(self):
+        self.assertInvalidates(
+            BuildingGeometry, lambda: BuildingGeometry.objects.create(geom=self.box())
+        )
+        geometry = BuildingGeometry.objects.get()
+        geometry.geom = self.box(offset=2)
+        self.assertInvalidates(BuildingGeometry, geometry.save)
+        self.assertInvalidates(BuildingGeometry, geometry.delete)
+
+    def test_road_geometry_edits(self):
+        self.assertInvalidates(
+            RoadGeometry, lambda: RoadGeometry.objects.create(geom=self.line())
+        )
+        geometry = RoadGeometry.objects.get()
+        geometry.geom = self.line(offset=2)
+        self.assertInvalidates(RoadGeometry, geometry.save)
+        self.assertInvalidates(RoadGeometry, geometry.delete)
+
+    def test_building_save(self):
+        building = Building.objects.create(
+            feature=BuildingGeometry.objects.create(geom=self.box())
+        )
+        building.remarks = "edited"
+        self.assertInvalidates(Building, building.save)
+
+    def test_road_save(self):
+        road = Road.objects.create(
+            feature=RoadGeometry.objects.create(geom=self.line())
+        )
+        road.road_name_en = "edited"
+        self.assertInvalidates(Road, road.save)
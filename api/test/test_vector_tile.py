@@ -0,0 +1,23 @@
+import requests
+import pytest
+from api.test.helpers import *
+
+
+def test_composite_vector_tile(base_url):
+    response = requests.get(f"{base_url}composite-vector-tile/14/12076/6874/")
+    assert response.status_code in (200, 204)
+    assert response.headers["Content-Type"] == "application/vnd.mapbox-vector-tile"
+
+
+def test_composite_vector_tile_layers(base_url):
+    response = requests.get(
+        f"{base_url}composite-vector-tile/14/12076/6874/?layers=building,road"
+    )
+    assert response.status_code in (200, 204)
+
+
+def test_composite_vector_tile_unknown_layer(base_url):
+    response = requests.get(
+        f"{base_url}composite-vector-tile/14/12076/6874/?layers=building,river"
+    )
+    assert_status_code(response, 400)
@@ -1,5 +1,12 @@
 from django.urls import include, path, re_path
-from api.viewsets import core_viewsets, dashboard_viewsets, publicpage_viewsets
+from api.viewsets import (
+    bulk_update_viewsets,
+    core_viewsets,
+    dashboard_viewsets,
+    ingestion_viewsets,
+    publicpage_viewsets,
+    tile_viewsets,
+)
 from rest_framework import routers
 
 router = routers.DefaultRouter()
@@ -76,6 +83,11 @@ urlpatterns = [
         dashboard_viewsets.BuildingFilterViewSet.as_view(),
         name="building_filter",
     ),
+    path(
+        "building-bulk-update/",
+        bulk_update_viewsets.BuildingBulkUpdate.as_view(),
+        name="building_bulk_update",
+    ),
     path(
         "building-unique-values/",
         dashboard_viewsets.BuildingUniqueValuesViewSet.as_view(),
@@ -116,6 +128,11 @@ urlpatterns = [
         core_viewsets.MapPopUpViewSet.as_view({"get": "retrieve"}),
         name="map-popup-detail",
     ),
+    path(
+        "composite-vector-tile/<int:z>/<int:x>/<int:y>/",
+        tile_viewsets.CompositeVectorTile.as_view(),
+        name="composite_vector_tile",
+    ),
     path(
         "palika-boundary/<int:z>/<int:x>/<int:y>/",
         core_viewsets.PalikaBoundaryVectorTile.as_view(),
@@ -186,6 +203,11 @@ urlpatterns = [
         core_viewsets.get_upload_task_response,
         name="task_response",
     ),
+    path(
+        "ingestion-task-response/",
+        ingestion_viewsets.get_ingestion_task_response,
+        name="ingestion_task_response",
+    ),
     path(
         "building-advance-filtering/",
         core_viewsets.building_advance_filter,
@@ -0,0 +1,101 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.db.models import Extent
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Building, BuildingGeometry, HistoryLog, Road
+from core.utils.renumbering import renumber_building_on_commit
+from core.utils.tile_cache import invalidate_tiles
+
+# attribute fields field teams correct for many buildings at once
+BUILDING_BULK_UPDATE_FIELDS = [
+    "tole_name",
+    "reg_type",
+    "road_id",
+    "roof_type",
+    "association_type",
+    "temporary_type",
+    "floor",
+    "road_type",
+    "road_lane",
+    "road_width",
+    "building_structure",
+    "remarks",
+    "owner_name",
+    "owner_status",
+    "building_use",
+]
+
+
+def bulk_update_buildings(queryset, changes, user=None):
+    """
+    Applies the same field changes to every building of ``queryset`` with a single
+    UPDATE and logs them as one edit, in one transaction. The UPDATE bypasses
+    Building.save, so the buildings moved to another road are queued for
+    renumbering here.
+
+    Args:
+        queryset (QuerySet): Buildings to update.
+        changes (dict): New value of every changed field, already validated.
+        user (User): User making the change.
+    Returns:
+        dict:
+        The number of buildings matched and updated, and the related_id shared by
+        the history logs of the edit.
+    """
+    changes = dict(changes)
+    if "road_id" in changes:
+        changes["associate_road_name"] = (
+            Road.objects.filter(road_id=changes["road_id"])
+            .values_list("road_name_en", flat=True)
+            .first()
+        )
+    fields = list(changes)
+    timestamp = timezone.now()
+    content_type = ContentType.objects.get_for_model(Building)
+
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values("id", *fields))
+        logs = []
+        for row in rows:
+            row_changes = {
+                field: {"old": row[field], "new": changes[field]}
+                for field in fields
+                if row[field] != changes[field]
+            }
+            if row_changes:
+                logs.append(
+                    HistoryLog(
+                        user=user,
+                        action="update",
+                        content_type=content_type,
+                        object_id=row["id"],
+                        timestamp=timestamp,
+                        changes=row_changes,
+                    )
+                )
+
+        updated_ids = [log.object_id for log in logs]
+        if updated_ids:
+            Building.objects.filter(id__in=updated_ids).update(
+                **changes,
+                updated_by=user,
+                updated_date=timestamp,
+                timestamp=timestamp,
+            )
+            HistoryLog.write_logs(logs)
+            for log in logs:
+                if "road_id" in log.changes:
+                    renumber_building_on_commit(log.object_id)
+            extent = BuildingGeometry.objects.filter(
+                building_geometry__id__in=updated_ids
+            ).aggregate(extent=Extent("geom"))["extent"]
+            transaction.on_commit(
+                lambda: invalidate_tiles([BuildingGeometry, Building], extent)
+            )
+
+    return {
+        "matched": len(rows),
+        "updated": len(updated_ids),
+        "related_id": logs[0].related_id if logs else None,
+    }
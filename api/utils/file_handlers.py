@@ -1,150 +1,597 @@
+import csv
+import json
+import logging
+import multiprocessing
+import tempfile
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import fiona
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from django.contrib.gis.db.models import Q
+from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.geos.prototypes.io import wkt_w
-from django.db import models
-from math import atan2, degrees
-from shapely.geometry import Point, LineString, MultiLineString
+from django.db import connection, models, transaction
+from shapely import wkb
+from shapely.geometry import Point
 
 from core.models import PalikaGeometry, PalikaGeometryFile, PalikaWardGeometry, Road
 from core.utils import pluscode
+from core.utils.tile_cache import invalidate_layer
 from user.models import User
 
+INGESTION_BATCH_SIZE = getattr(settings, "INGESTION_BATCH_SIZE", 2000)
+INGESTION_CHUNK_SIZE = getattr(settings, "INGESTION_CHUNK_SIZE", 50000)
+INGESTION_WORKERS = getattr(settings, "INGESTION_WORKERS", 1)
 
-def handle_road_file(gdf, user_id, road_geometry_model, road_model):
-    if any(col.lower() == "id" for col in gdf.columns):
-        gdf.drop(
-            columns=[col for col in gdf.columns if col.lower() == "id"], inplace=True
-        )
-    geometry_type = gdf["geometry"].iloc[0].geom_type
-    total_bounds = gdf.total_bounds
-    bound_dict = {"total_bounds": total_bounds.tolist()}
-    user_instance = User.objects.get(id=user_id)
+logger = logging.getLogger(__name__)
 
-    required_fields = [
-        "road_id",
-        "road_name",
-        # "road_lane",
-        "width",
-        "road_cat",
-        "road_class",
-        "road_type",
+
+def get_ward_geodataframe():
+    """
+    Returns the ward polygons as a GeoDataFrame with a ``ward_no`` column, for
+    spatial joins against uploaded features.
+    """
+    wards = PalikaWardGeometry.objects.values_list("ward_no", "geom")
+    return gpd.GeoDataFrame(
+        {"ward_no": [ward_no for ward_no, _ in wards]},
+        geometry=[wkb.loads(bytes(geom.wkb)) for _, geom in wards],
+        crs="epsg:4326",
+    )
+
+
+def to_ewkb(geometries, srid=4326):
+    """
+    Returns hex EWKB of ``geometries`` with the z coordinate dropped.
+    """
+    return [
+        wkb.dumps(geom, hex=True, srid=srid, output_dimension=2) for geom in geometries
     ]
-    for index, row in gdf.iterrows():
-        try:
-            attr_data = row.drop(["geometry"]).to_dict()
 
-            attr_data = {
-                key: None if pd.isna(value) else value
-                for key, value in attr_data.items()
-            }
 
-            if "updated_date" in attr_data:
-                attr_data["updated_date"] = str(attr_data["updated_date"])
+def open_collection(shape):
+    """
+    Opens ``shape``, a path or an uploaded file, as a Fiona collection. Zipped
+    shapefiles are read in place through the zip:// scheme.
+    """
+    if isinstance(shape, str):
+        return fiona.open(f"zip://{shape}" if shape.lower().endswith(".zip") else shape)
+    try:
+        return fiona.open(shape.path)
+    except (AttributeError, NotImplementedError):
+        # storages without local paths, the upload has to be read into memory
+        shape.open("rb")
+        return fiona.BytesCollection(shape.read())
 
-            attr_data_keys = attr_data.keys()
 
-            print("the attribute keys", attr_data_keys)
+def read_file_chunks(shape, chunk_size=None):
+    """
+    Yields the features of ``shape`` as GeoDataFrames of at most ``chunk_size``
+    (INGESTION_CHUNK_SIZE by default) rows, so that only one chunk of a file is in
+    memory at a time. Rows are indexed by their position in the file.
+    """
+    chunk_size = chunk_size or INGESTION_CHUNK_SIZE
+    with open_collection(shape) as source:
+        columns = list(source.schema["properties"]) + ["geometry"]
+        features = iter(source)
+        start = 0
+        while True:
+            chunk = list(islice(features, chunk_size))
+            if not chunk:
+                break
+            gdf = gpd.GeoDataFrame.from_features(
+                chunk, crs="epsg:4326", columns=columns
+            )
+            gdf.index = pd.RangeIndex(start, start + len(gdf))
+            start += len(gdf)
+            yield gdf
 
-            missing_keys = [key for key in required_fields if key not in attr_data_keys]
-            print("the missing keys", missing_keys)
 
-            if missing_keys:
-                raise KeyError(
-                    f"The following required keys are missing in 'attr_data': {', '.join(missing_keys)}"
-                )
-            attr_data = row.drop(["geometry"]).to_dict()
-            road_id = attr_data.pop("road_id")
-            road_name_en = attr_data.pop("road_name")
-            # road_lane = attr_data.pop("road_lane")
-            road_width = attr_data.pop("width")
-            road_category = attr_data.pop("road_cat")
-            road_class = attr_data.pop("road_class")
-            road_type = attr_data.pop("road_type")
-            geom = GEOSGeometry(str(row["geometry"]))
-            wkt = wkt_w(dim=2).write(geom).decode()
-            geom = GEOSGeometry(wkt, srid=4326)
-
-            # Handle LineString and MultiLineString geometries
-            if geom.geom_type == "LineString":
-                line_string = LineString(geom.coords)
-                start_point = line_string.coords[0]
-                end_point = line_string.coords[-1]
-                start_point = GEOSGeometry(Point(start_point).wkt)
-                end_point = GEOSGeometry(Point(end_point).wkt)
-                geometry = geom.transform(32645, clone=True)
-                road_length = geometry.length
-
-            elif geom.geom_type == "MultiLineString":
-                multi_line_string = MultiLineString(
-                    [LineString(line.coords) for line in geom]
-                )
-                start_point = multi_line_string.geoms[0].coords[0]
-                end_point = multi_line_string.geoms[-1].coords[-1]
-                start_point = GEOSGeometry(Point(start_point).wkt)
-                end_point = GEOSGeometry(Point(end_point).wkt)
-                geometry = geom.transform(32645, clone=True)
-                road_length = sum(line.length for line in geometry)
-
-            angle_degrees = degrees(
-                atan2(end_point[1] - start_point[1], end_point[0] - start_point[0])
+def read_csv_chunks(shape, chunk_size=None):
+    """
+    Yields the rows of a CSV file with longitude and latitude columns as point
+    GeoDataFrames of at most ``chunk_size`` rows.
+    """
+    chunk_size = chunk_size or INGESTION_CHUNK_SIZE
+    for df in pd.read_csv(shape, keep_default_na=False, chunksize=chunk_size):
+        yield gpd.GeoDataFrame(
+            df,
+            geometry=gpd.points_from_xy(df["longitude"], df["latitude"]),
+            crs="epsg:4326",
+        )
+
+
+class IngestionReport:
+    """
+    Counts the rows read, inserted and skipped while a file is imported, and the
+    time spent in every stage, and passes the counts to ``callback`` after every
+    read chunk and written batch, e.g. to publish them as the progress of a
+    celery task. The indexes of the first skipped rows are kept per reason.
+    """
+
+    MAX_SKIPPED_ROWS = 100
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.started = time.perf_counter()
+        self.rows_read = 0
+        self.rows_inserted = 0
+        self.skipped = {}
+        self.skipped_rows = {}
+        self.stage_seconds = {}
+
+    def read(self, count, errors=None):
+        self.rows_read += count
+        self.skip(errors, publish=False)
+        self.publish()
+
+    def skip(self, errors, publish=True):
+        """
+        Counts the rows of ``errors``, reasons by row index, as skipped.
+        """
+        for index, reason in sorted((errors or {}).items()):
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            rows = self.skipped_rows.setdefault(reason, [])
+            if len(rows) < self.MAX_SKIPPED_ROWS:
+                rows.append(int(index))
+        if publish:
+            self.publish()
+
+    def inserted(self, count):
+        self.rows_inserted += count
+        self.publish()
+
+    def timed(self, timings):
+        """
+        Adds the seconds spent in every stage of ``timings``.
+        """
+        for stage, seconds in timings.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+
+    def publish(self):
+        if self.callback is not None:
+            self.callback(self.as_dict())
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows_read": self.rows_read,
+            "rows_inserted": self.rows_inserted,
+            "rows_skipped": sum(self.skipped.values()),
+            "skipped_reasons": dict(self.skipped),
+            "skipped_rows": {
+                reason: list(rows) for reason, rows in self.skipped_rows.items()
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(self.rows_inserted / elapsed if elapsed else 0),
+            "stage_seconds": {
+                stage: round(seconds, 2)
+                for stage, seconds in self.stage_seconds.items()
+            },
+        }
+
+
+def prepare_chunks(prepare, chunks, workers=None, *args):
+    """
+    Yields ``prepare(chunk, *args)`` for every chunk, in the order of ``chunks``.
+
+    With more than one worker the chunks are prepared in a pool of ``workers``
+    processes while the caller writes the results, so the database is only
+    written from one process. At most two chunks per worker are read ahead.
+    Daemonic processes, such as the children of a celery prefork worker, cannot
+    start a pool and prepare the chunks themselves.
+    """
+    workers = workers or INGESTION_WORKERS
+    if workers > 1 and multiprocessing.current_process().daemon:
+        logger.info("preparing chunks in this daemonic process instead of a pool")
+        workers = 1
+    if workers <= 1:
+        for chunk in chunks:
+            yield prepare(chunk, *args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(prepare, chunk, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def handle_in_chunks(handler, chunks, *args, **kwargs):
+    """
+    Runs ``handler`` on every item of ``chunks`` and combines the results into the
+    result of a single call: the geometry type of the first chunk, the bounds of
+    all chunks, and the messages of every chunk when ``handler`` returns one. An
+    error returned for a chunk is returned as is, the chunks before it stay
+    imported.
+    """
+    geometry_type, messages = None, []
+    bounds = [np.inf, np.inf, -np.inf, -np.inf]
+    for chunk in chunks:
+        result = handler(chunk, *args, **kwargs)
+        if not isinstance(result, tuple) or result[0] is None:
+            return result
+        geometry_type = geometry_type or result[0]
+        xmin, ymin, xmax, ymax = result[1]["total_bounds"]
+        bounds = [
+            min(bounds[0], xmin),
+            min(bounds[1], ymin),
+            max(bounds[2], xmax),
+            max(bounds[3], ymax),
+        ]
+        messages.append(result[2] if len(result) > 2 else None)
+    if geometry_type is None:
+        raise ValueError("The uploaded file does not contain any features")
+    bound_dict = {"total_bounds": [float(value) for value in bounds]}
+    if messages[0] is None:
+        return geometry_type, bound_dict
+    return geometry_type, bound_dict, "".join(messages)
+
+
+def clean_attributes(gdf):
+    """
+    Returns the attributes of ``gdf`` as python objects with NaN replaced by None
+    and ``updated_date`` as a string.
+    """
+    attributes = gdf.drop(columns=["geometry"]).astype(object)
+    attributes = attributes.where(pd.notna(attributes), None)
+    if "updated_date" in attributes:
+        attributes["updated_date"] = attributes["updated_date"].map(
+            lambda value: str(value) if value is not None else None
+        )
+    return attributes
+
+
+def convert_numeric_attributes(attributes, fields):
+    """
+    Converts the columns of ``attributes`` named in ``fields`` to the int or
+    float of the model field they are written to, e.g. a road_id read as text.
+    Blank values become None.
+
+    Returns:
+        tuple:
+        The attributes of the rows whose values all converted, and the reason
+        every other row is skipped for by row index.
+    """
+    attributes = attributes.copy()
+    errors = {}
+    for column, kind in fields.items():
+        if column not in attributes:
+            continue
+        values = attributes[column].map(
+            lambda value: (
+                None
+                if value is None or (isinstance(value, str) and not value.strip())
+                else value
             )
-            # Determine the direction based on the angle
-            direction = ""
-            if 45 <= angle_degrees < 135:
-                direction = "north to south"
-            elif 135 <= angle_degrees < 225:
-                direction = "west to east"
-            elif 225 <= angle_degrees < 315:
-                direction = "south to north"
-            else:
-                direction = "east to west"
-
-            wards = PalikaWardGeometry.objects.filter(
-                Q(geom__crosses=geom) | Q(geom__contains=geom)
-            ).values_list("ward_no", flat=True)
-            ward_no = list(wards)
-            feature_instance = road_geometry_model.objects.create(geom=geom)
-            road_model.objects.create(
-                attr_data=attr_data,
-                road_id=road_id,
-                feature=feature_instance,
-                road_name_en=road_name_en,
-                # road_lane=road_lane,
-                road_class=road_class,
-                road_width=road_width,
-                road_category=road_category,
-                road_type=road_type,
-                road_length=road_length,
-                direction=direction,
-                ward_no=ward_no,
-                start_point=start_point,
-                end_point=end_point,
-                created_by=user_instance,
+        )
+        numbers = pd.to_numeric(values, errors="coerce")
+        invalid = values.notna() & numbers.isna()
+        if kind is int:
+            invalid |= numbers.notna() & (numbers % 1 != 0)
+        for index in attributes.index[invalid]:
+            errors.setdefault(index, f"invalid {column}")
+        attributes[column] = pd.Series(
+            [None if pd.isna(number) else kind(number) for number in numbers],
+            index=attributes.index,
+            dtype=object,
+        )
+    return attributes[~attributes.index.isin(list(errors))], errors
+
+
+def write_in_batches(write, attributes, computed, batch_size, report):
+    """
+    Calls ``write`` with the (attributes, computed values) pairs of every batch of
+    ``batch_size`` rows, in one transaction per batch. The rows of a batch that
+    fails are written again one at a time, so only the failing rows are skipped.
+
+    Returns:
+        tuple:
+        The number of rows written and the reason every failing row was skipped
+        for by row index.
+    """
+    created, failed = 0, {}
+    for offset in range(0, len(attributes), batch_size):
+        batch = attributes.iloc[offset : offset + batch_size]
+        rows = list(
+            zip(
+                batch.index,
+                batch.to_dict("records"),
+                computed.iloc[offset : offset + batch_size].to_dict("records"),
             )
-        except KeyError as key_error:
-            print("error:", str(key_error))
-            return str(key_error)
+        )
+        try:
+            with transaction.atomic():
+                write([(row, values) for _, row, values in rows])
+            written = len(rows)
+        except Exception:
+            written, batch_failed = 0, {}
+            for index, row, values in rows:
+                try:
+                    with transaction.atomic():
+                        write([(row, values)])
+                    written += 1
+                except Exception as e:
+                    batch_failed[index] = f"insert failed ({type(e).__name__})"
+            failed.update(batch_failed)
+            report.skip(batch_failed)
+        created += written
+        report.inserted(written)
+    return created, failed
+
+
+def row_errors_message(errors):
+    """
+    Returns one line per reason listing the indexes of the rows skipped for it,
+    in the order of the rows.
+    """
+    indexes_by_reason = {}
+    for index, reason in sorted(errors.items()):
+        indexes_by_reason.setdefault(reason, []).append(index)
+    return "".join(
+        f"Skipped rows for IDs: {indexes} ({reason}) (Count: {len(indexes)})\n"
+        for reason, indexes in indexes_by_reason.items()
+    )
 
-        except Exception as e:
-            print("error:", str(e))
-            return str(e)
-    return geometry_type, bound_dict
+
+def line_endpoints(geom):
+    """
+    Returns the first point of the first line and the last point of the last
+    line of a LineString or MultiLineString, in 2D.
+    """
+    lines = geom.geoms if geom.geom_type == "MultiLineString" else [geom]
+    return lines[0].coords[0][:2], lines[-1].coords[-1][:2]
+
+
+def road_directions(start_points, end_points):
+    """
+    Returns the direction of every road from the angle between its start and end
+    points.
+    """
+    angle_degrees = np.degrees(
+        np.arctan2(
+            end_points[:, 1] - start_points[:, 1],
+            end_points[:, 0] - start_points[:, 0],
+        )
+    )
+    return np.select(
+        [
+            (angle_degrees >= 45) & (angle_degrees < 135),
+            (angle_degrees >= 135) & (angle_degrees < 225),
+            (angle_degrees >= 225) & (angle_degrees < 315),
+        ],
+        ["north to south", "west to east", "south to north"],
+        default="east to west",
+    )
+
+
+def road_wards(geometries, ward_gdf):
+    """
+    Returns the ward numbers of the wards crossing or containing each road.
+    """
+    roads = gpd.GeoDataFrame(geometry=geometries, crs="epsg:4326")
+    joined = pd.concat(
+        [
+            gpd.sjoin(roads, ward_gdf, how="inner", predicate="crosses"),
+            gpd.sjoin(roads, ward_gdf, how="inner", predicate="within"),
+        ]
+    )
+    ward_nos = joined.groupby(level=0)["ward_no"].agg(
+        lambda values: sorted(set(int(value) for value in values))
+    )
+    return [ward_nos.get(index, []) for index in roads.index]
+
+
+ROAD_REQUIRED_FIELDS = [
+    "road_id",
+    "road_name",
+    # "road_lane",
+    "width",
+    "road_cat",
+    "road_class",
+    "road_type",
+]
+# columns written to the IntegerField and FloatField of Road
+ROAD_NUMERIC_FIELDS = {"road_id": int, "width": float}
+
+
+def prepare_road_chunk(gdf, ward_gdf):
+    """
+    Validates the roads of ``gdf`` and computes their lengths, end points,
+    directions and wards. Does not touch the database, so that chunks can be
+    prepared in worker processes.
+
+    Returns:
+        dict:
+        The geometry type and bounds of the chunk, the missing required fields,
+        the attributes and computed values of the valid rows, the reason every
+        other row was skipped for by row index, and the time spent in each stage.
+    """
+    timings = {}
+    checkpoint = time.perf_counter()
+
+    def timed(stage):
+        nonlocal checkpoint
+        now = time.perf_counter()
+        timings[stage] = now - checkpoint
+        checkpoint = now
+
+    gdf = gdf.drop(columns=[col for col in gdf.columns if col.lower() == "id"])
+    prepared = {
+        "rows": len(gdf),
+        "geometry_type": gdf["geometry"].iloc[0].geom_type,
+        "bound_dict": {"total_bounds": gdf.total_bounds.tolist()},
+        "missing_keys": [key for key in ROAD_REQUIRED_FIELDS if key not in gdf],
+        "errors": {},
+        "timings": timings,
+    }
+    if prepared["missing_keys"]:
+        return prepared
+
+    unsupported = ~gdf.geom_type.isin(["LineString", "MultiLineString"])
+    for index, geom_type in gdf.geom_type[unsupported].items():
+        prepared["errors"][index] = f"unsupported geometry type {geom_type}"
+    gdf = gdf[~unsupported]
+    attributes, invalid = convert_numeric_attributes(
+        clean_attributes(gdf), ROAD_NUMERIC_FIELDS
+    )
+    prepared["errors"].update(invalid)
+    gdf = gdf.loc[attributes.index]
+    prepared["attributes"] = attributes
+    timed("read attributes")
+
+    road_lengths = gdf.geometry.to_crs(32645).length.to_numpy()
+    timed("lengths")
+
+    endpoints = [line_endpoints(geom) for geom in gdf.geometry]
+    start_points = np.array([start for start, _ in endpoints], dtype=float)
+    end_points = np.array([end for _, end in endpoints], dtype=float)
+    directions = road_directions(start_points.reshape(-1, 2), end_points.reshape(-1, 2))
+    timed("directions")
+
+    ward_nos = road_wards(gdf.geometry, ward_gdf)
+    timed("wards")
+
+    prepared["computed"] = pd.DataFrame(
+        {
+            "geom": to_ewkb(gdf.geometry),
+            "road_length": road_lengths,
+            "direction": directions,
+            "ward_no": ward_nos,
+            "start_point": to_ewkb(Point(point) for point in start_points),
+            "end_point": to_ewkb(Point(point) for point in end_points),
+        },
+        index=gdf.index,
+    )
+    timed("geometries")
+    return prepared
+
+
+def handle_prepared_roads(
+    prepared, user_id, road_geometry_model, road_model, batch_size=None, report=None
+):
+    """
+    Writes the roads of a chunk prepared by prepare_road_chunk with
+    ``bulk_create`` in batches of ``batch_size`` (INGESTION_BATCH_SIZE by
+    default). The time spent in every stage and the skipped rows are counted in
+    ``report``.
+
+    Returns:
+        tuple:
+        The geometry type and the bounds of the chunk, or an error message.
+    """
+    if prepared["missing_keys"]:
+        error_message = f"The following required keys are missing in 'attr_data': {', '.join(prepared['missing_keys'])}"
+        logger.error(error_message)
+        return error_message
+
+    started = time.perf_counter()
+    batch_size = batch_size or INGESTION_BATCH_SIZE
+    user_instance = User.objects.get(id=user_id)
+    report = report or IngestionReport()
+    attributes, computed = prepared["attributes"], prepared["computed"]
+    report.read(prepared["rows"], prepared["errors"])
+    columns = [
+        column for column in attributes.columns if column not in ROAD_REQUIRED_FIELDS
+    ]
+
+    def write(rows):
+        features = road_geometry_model.objects.bulk_create(
+            [
+                road_geometry_model(geom=GEOSGeometry(values["geom"]))
+                for _, values in rows
+            ]
+        )
+        road_model.objects.bulk_create(
+            [
+                road_model.for_bulk_create(
+                    attr_data={column: row[column] for column in columns},
+                    road_id=row["road_id"],
+                    feature=feature,
+                    road_name_en=row["road_name"],
+                    # road_lane=row["road_lane"],
+                    road_class=row["road_class"],
+                    road_width=row["width"],
+                    road_category=row["road_cat"],
+                    road_type=row["road_type"],
+                    road_length=values["road_length"],
+                    direction=values["direction"],
+                    ward_no=values["ward_no"],
+                    start_point=GEOSGeometry(values["start_point"]),
+                    end_point=GEOSGeometry(values["end_point"]),
+                    created_by=user_instance,
+                )
+                for feature, (row, values) in zip(features, rows)
+            ]
+        )
+
+    write_in_batches(write, attributes, computed, batch_size, report)
+    invalidate_layer([road_geometry_model, road_model])
+    report.timed(dict(prepared["timings"], insert=time.perf_counter() - started))
+    return prepared["geometry_type"], prepared["bound_dict"]
 
 
-def road_handle_shapefile(shape, road_model, road_geometry_model, user_id):
+def handle_road_file(gdf, user_id, road_geometry_model, road_model, batch_size=None):
+    """
+    Imports the roads of ``gdf``.
+
+    Lengths, end points, directions and wards are computed for the whole frame at
+    once and rows are written with ``bulk_create``, see prepare_road_chunk and
+    handle_prepared_roads.
+
+    Returns:
+        tuple:
+        The geometry type and the bounds of the file, or an error message.
+    """
+    return handle_prepared_roads(
+        prepare_road_chunk(gdf, get_ward_geodataframe()),
+        user_id,
+        road_geometry_model,
+        road_model,
+        batch_size,
+    )
+
+
+def handle_road_chunks(
+    chunks, user_id, road_geometry_model, road_model, workers, report
+):
+    return handle_in_chunks(
+        handle_prepared_roads,
+        prepare_chunks(prepare_road_chunk, chunks, workers, get_ward_geodataframe()),
+        user_id,
+        road_geometry_model,
+        road_model,
+        report=report,
+    )
+
+
+def road_handle_shapefile(
+    shape, road_model, road_geometry_model, user_id, workers=None, report=None
+):
     """
     Handle the processing of a shapefile.
 
     This function reads the shapefile, extracts the geometry type, total bounds, and attribute data from each feature,
     and creates corresponding feature collection instances in the database.
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    gdf = gpd.read_file(shape)
-    crs = "epsg:4326"
-    gdf.crs = crs
-    return handle_road_file(gdf, user_id, road_geometry_model, road_model)
+    return handle_road_chunks(
+        read_file_chunks(shape),
+        user_id,
+        road_geometry_model,
+        road_model,
+        workers,
+        report,
+    )
 
 
 def road_handle_geojson(
@@ -152,18 +599,26 @@ def road_handle_geojson(
     road_model,
     road_geometry_model,
     user_id,
+    workers=None,
+    report=None,
 ):
     """
     Handle the processing of a GeoJSON file.
 
     This function reads the GeoJSON file, extracts the CRS information, total bounds, and attribute data from each feature,
     and creates corresponding feature collection instances in the database.
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    gdf = gpd.read_file(shape)
-    crs = "epsg:4326"
-    gdf.crs = crs
-    return handle_road_file(gdf, user_id, road_geometry_model, road_model)
+    return handle_road_chunks(
+        read_file_chunks(shape),
+        user_id,
+        road_geometry_model,
+        road_model,
+        workers,
+        report,
+    )
 
 
 def road_handle_csv(
@@ -171,6 +626,8 @@ def road_handle_csv(
     road_model,
     road_geometry_model,
     user_id,
+    workers=None,
+    report=None,
 ):
     """
     Handle the processing of a CSV file.
@@ -178,16 +635,18 @@ def road_handle_csv(
     This function reads the CSV file, creates a GeoDataFrame by converting latitude and longitude columns to geometry,
     extracts the geometry type, total bounds, and attribute data from each row,
     and creates corresponding feature collection instances in the database.
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    df = pd.read_csv(shape, keep_default_na=False)
-    gdf = gpd.GeoDataFrame(
-        df, geometry=gpd.points_from_xy(df["longitude"], df["latitude"])
+    return handle_road_chunks(
+        read_csv_chunks(shape),
+        user_id,
+        road_geometry_model,
+        road_model,
+        workers,
+        report,
     )
-    crs = "epsg:4326"
-    gdf = gpd.GeoDataFrame(df, crs=crs)
-    gdf.fillna("")
-    return handle_road_file(gdf, user_id, road_geometry_model, road_model)
 
 
 def get_char_fields_max_lengths(model_class):
@@ -198,165 +657,274 @@ def get_char_fields_max_lengths(model_class):
     return char_fields_max_length
 
 
-def handle_building_file(gdf, user_id, building_geometry_model, building_model):
-    if any(col.lower() == "id" for col in gdf.columns):
-        gdf.drop(
-            columns=[col for col in gdf.columns if col.lower() == "id"], inplace=True
+BUILDING_REQUIRED_FIELDS = [
+    # "updated_date",
+    "house_no",
+    "build_id",
+    "main_b_id",
+    "road_id",
+    "structure",
+    "ownr_stat",
+    "temp_type",
+    "reg_type",
+    "b_use_cat",
+    "owner_name",
+    "roof_type",
+    "tole_name",
+    "floor",
+    "b_use_spc",
+    "road_type",
+    "road_lane",
+    "road_wd",
+    "road_name",
+    "assoc_type",
+]
+# columns written to the IntegerFields and FloatFields of Building
+BUILDING_NUMERIC_FIELDS = {
+    "build_id": int,
+    "main_b_id": int,
+    "road_id": int,
+    "floor": float,
+    "road_wd": float,
+}
+
+
+def prepare_building_chunk(gdf, ward_gdf, char_fields_max_length):
+    """
+    Validates the buildings of ``gdf`` and computes their 2D geometries,
+    centroids, plus codes and wards. Does not touch the database, so that chunks
+    can be prepared in worker processes.
+
+    Returns:
+        dict:
+        The geometry type and bounds of the chunk, the missing required fields,
+        the attributes and computed values of the valid rows, the reason every
+        other row was skipped for by row index, and the row indexes of the char
+        fields that were too long for the model.
+    """
+    started = time.perf_counter()
+    gdf = gdf.drop(columns=[col for col in gdf.columns if col.lower() == "id"])
+    prepared = {
+        "rows": len(gdf),
+        "geometry_type": gdf["geometry"].iloc[0].geom_type,
+        "bound_dict": {"total_bounds": gdf.total_bounds.tolist()},
+        "missing_keys": [key for key in BUILDING_REQUIRED_FIELDS if key not in gdf],
+        "errors": {},
+        "skipped_fields": {},
+        "timings": {},
+    }
+    if prepared["missing_keys"]:
+        return prepared
+
+    no_geometry = gdf.geometry.isna()
+    prepared["errors"].update(dict.fromkeys(gdf.index[no_geometry], "no geometry"))
+    gdf = gdf[~no_geometry].drop(columns=["updated_by"], errors="ignore")
+    attributes, invalid = convert_numeric_attributes(
+        clean_attributes(gdf), BUILDING_NUMERIC_FIELDS
+    )
+    prepared["errors"].update(invalid)
+    gdf = gdf.loc[attributes.index]
+
+    for char_field, max_length in char_fields_max_length.items():
+        if char_field not in attributes:
+            continue
+        too_long = attributes[char_field].map(
+            lambda value: value is not None and len(str(value)) > max_length
         )
-    geometry_type = gdf["geometry"].iloc[0].geom_type
-    total_bounds = gdf.total_bounds
-    bound_dict = {"total_bounds": total_bounds.tolist()}
+        if too_long.any():
+            attributes.loc[too_long, char_field] = None
+            prepared["skipped_fields"][char_field] = too_long[too_long].index.tolist()
+
+    with warnings.catch_warnings():
+        # centroids are taken in EPSG:4326 like before, the geographic CRS warning
+        # of geopandas does not apply
+        warnings.simplefilter("ignore", UserWarning)
+        centroids = gdf.geometry.centroid
+
+    wards = gpd.sjoin(
+        gpd.GeoDataFrame(geometry=centroids, crs="epsg:4326"),
+        ward_gdf,
+        how="left",
+        predicate="within",
+    )
+    wards = wards[~wards.index.duplicated(keep="first")]["ward_no"]
+    outside = wards.isna()
+    prepared["errors"].update(
+        dict.fromkeys(gdf.index[outside], "centroid outside every ward")
+    )
+
+    centroids = centroids[~outside]
+    prepared["attributes"] = attributes[~outside]
+    prepared["computed"] = pd.DataFrame(
+        {
+            "geom": to_ewkb(gdf.geometry[~outside]),
+            "centroid": to_ewkb(centroids),
+            "plus_code": [
+                pluscode.encode(lat, lon) for lat, lon in zip(centroids.y, centroids.x)
+            ],
+            "ward_no": wards[~outside].astype(int),
+        },
+        index=centroids.index,
+    )
+    prepared["timings"] = {"prepare": time.perf_counter() - started}
+    return prepared
+
+
+def handle_prepared_buildings(
+    prepared,
+    user_id,
+    building_geometry_model,
+    building_model,
+    batch_size=None,
+    report=None,
+):
+    """
+    Writes the buildings of a chunk prepared by prepare_building_chunk with
+    ``bulk_create`` in batches of ``batch_size`` (INGESTION_BATCH_SIZE by
+    default). Buildings whose road_id matches no road, and rows that fail to
+    insert, are skipped.
+
+    Returns:
+        tuple:
+        The geometry type, the bounds of the chunk, and a message listing the
+        char fields that were too long for the model and the skipped rows.
+    """
+    if prepared["missing_keys"]:
+        error_message = f"The following required keys are missing in 'attr_data': {', '.join(prepared['missing_keys'])}"
+        return None, None, error_message
+
+    started = time.perf_counter()
+    batch_size = batch_size or INGESTION_BATCH_SIZE
     user_instance = User.objects.get(id=user_id)
+    attributes, computed = prepared["attributes"], prepared["computed"]
+    errors = dict(prepared["errors"])
 
-    required_fields = [
-        # "updated_date",
-        "house_no",
-        "build_id",
-        "main_b_id",
-        "road_id",
-        "structure",
-        "ownr_stat",
-        "temp_type",
-        "reg_type",
-        "b_use_cat",
-        "owner_name",
-        "roof_type",
-        "tole_name",
-        "floor",
-        "b_use_spc",
-        "road_type",
-        "road_lane",
-        "road_wd",
-        "road_name",
-        "assoc_type",
+    road_ids = attributes["road_id"].dropna().unique().tolist()
+    road_names = dict(
+        Road.objects.filter(road_id__in=road_ids).values_list("road_id", "road_name_en")
+    )
+    unknown_road = attributes["road_id"].map(
+        lambda road_id: road_id is not None and road_id not in road_names
+    )
+    errors.update(dict.fromkeys(attributes.index[unknown_road], "unknown road_id"))
+    attributes, computed = attributes[~unknown_road], computed[~unknown_road]
+    report = report or IngestionReport()
+    report.read(prepared["rows"], errors)
+
+    # road_name is required but, like the other attributes, kept in attr_data
+    columns = [
+        column
+        for column in attributes.columns
+        if column == "road_name" or column not in BUILDING_REQUIRED_FIELDS
     ]
 
-    for index, row in gdf.iterrows():
-        try:
-            attr_data = row.drop(["geometry"]).to_dict()
-
-            attr_data = {
-                key: None if pd.isna(value) else value
-                for key, value in attr_data.items()
-            }
-
-            if "updated_date" in attr_data:
-                attr_data["updated_date"] = str(attr_data["updated_date"])
-
-            if "updated_by" in attr_data:
-                del attr_data["updated_by"]
-
-            attr_data_keys = attr_data.keys()
-
-            missing_keys = [key for key in required_fields if key not in attr_data_keys]
-
-            if missing_keys:
-                # raise KeyError(
-                #     f"The following required keys are missing in 'attr_data': {', '.join(missing_keys)}"
-                # )
-                geometry_type = None
-                bound_dict = None
-                error_message = f"The following required keys are missing in 'attr_data': {', '.join(missing_keys)}"
-                return geometry_type, bound_dict, error_message
-
-            char_fields_max_length = get_char_fields_max_lengths(building_model)
-
-            skipped_fields_info = {}
-            for char_field, max_length in char_fields_max_length.items():
-                if (
-                    char_field in attr_data
-                    and len(str(attr_data[char_field])) > max_length
-                ):
-                    attr_data[char_field] = None
-
-                    # Store skipped field information
-                    skipped_fields_info.setdefault(char_field, {"ids": [], "count": 0})
-                    skipped_fields_info[char_field]["ids"].append(index)
-                    skipped_fields_info[char_field]["count"] += 1
-
-            house_no = attr_data.pop("house_no")
-            building_id = attr_data.pop("build_id")
-            main_building_id = attr_data.pop("main_b_id")
-            road_id = attr_data.pop("road_id")
-            if road_id:
-                road_inst = Road.objects.get(road_id=road_id)
-                associate_road_name = road_inst.road_name_en
-            building_structure = attr_data.pop("structure")
-            owner_status = attr_data.pop("ownr_stat")
-            temporary_type = attr_data.pop("temp_type")
-            reg_type = attr_data.pop("reg_type")
-            building_use = attr_data.pop("b_use_cat")
-            owner_name = attr_data.pop("owner_name")
-            roof_type = attr_data.pop("roof_type")
-            tole_name = attr_data.pop("tole_name")
-            floor = attr_data.pop("floor")
-            building_sp_use_raw = attr_data.pop("b_use_spc")
-            if pd.notna(building_sp_use_raw):
-                building_sp_use = [
-                    use.strip() for use in building_sp_use_raw.split(",")
-                ]
-            else:
-                building_sp_use = []
-            road_type = attr_data.pop("road_type")
-            road_lane = attr_data.pop("road_lane")
-            road_width = attr_data.pop("road_wd")
-            association_type = attr_data.pop("assoc_type")
-            geom = GEOSGeometry(str(row["geometry"]))
-            wkt = wkt_w(dim=2).write(geom).decode()
-            geom = GEOSGeometry(wkt)
-            centroid = geom.centroid
-            centroid_lat = centroid.y
-            centroid_lon = centroid.x
-            ref_centroid = geom.centroid
-            plus_code = pluscode.encode(centroid_lat, centroid_lon)
-            ward_geometry = PalikaWardGeometry.objects.get(geom__contains=centroid)
-            ward_no = ward_geometry.ward_no
-
-            feature_instance = building_geometry_model.objects.create(
-                geom=geom, created_by=user_instance
-            )
-            building_model.objects.create(
-                feature=feature_instance,
-                house_no=house_no,
-                building_id=building_id,
-                main_building_id=main_building_id,
-                tole_name=tole_name,
-                floor=floor,
-                centroid=centroid,
-                ref_centroid=ref_centroid,
-                plus_code=plus_code,
-                building_structure=building_structure,
-                owner_status=owner_status,
-                temporary_type=temporary_type,
-                reg_type=reg_type,
-                building_use=building_use,
-                owner_name=owner_name,
-                roof_type=roof_type,
-                building_sp_use=building_sp_use,
-                road_type=road_type,
-                road_lane=road_lane,
-                road_width=road_width,
-                associate_road_name=associate_road_name,
-                association_type=association_type,
-                attr_data=attr_data,
-                created_by=user_instance,
-                road_id=road_id,
-                ward_no=ward_no,
+    def write(rows):
+        features = building_geometry_model.objects.bulk_create(
+            [
+                building_geometry_model(
+                    geom=GEOSGeometry(values["geom"]), created_by=user_instance
+                )
+                for _, values in rows
+            ]
+        )
+        buildings = []
+        for feature, (row, values) in zip(features, rows):
+            building_sp_use_raw = row["b_use_spc"]
+            centroid = GEOSGeometry(values["centroid"])
+            buildings.append(
+                building_model.for_bulk_create(
+                    feature=feature,
+                    house_no=row["house_no"],
+                    building_id=row["build_id"],
+                    main_building_id=row["main_b_id"],
+                    tole_name=row["tole_name"],
+                    floor=row["floor"],
+                    centroid=centroid,
+                    ref_centroid=centroid,
+                    plus_code=values["plus_code"],
+                    building_structure=row["structure"],
+                    owner_status=row["ownr_stat"],
+                    temporary_type=row["temp_type"],
+                    reg_type=row["reg_type"],
+                    building_use=row["b_use_cat"],
+                    owner_name=row["owner_name"],
+                    roof_type=row["roof_type"],
+                    building_sp_use=(
+                        [use.strip() for use in building_sp_use_raw.split(",")]
+                        if building_sp_use_raw is not None
+                        else []
+                    ),
+                    road_type=row["road_type"],
+                    road_lane=row["road_lane"],
+                    road_width=row["road_wd"],
+                    associate_road_name=road_names.get(row["road_id"]),
+                    association_type=row["assoc_type"],
+                    attr_data={column: row[column] for column in columns},
+                    created_by=user_instance,
+                    road_id=row["road_id"],
+                    ward_no=values["ward_no"],
+                )
             )
-        # except KeyError as key_error:
-        #     print("error:", str(key_error))
-        #     return str(key_error)
+        building_model.objects.bulk_create(buildings)
 
-        except Exception as e:
-            continue
+    _, failed = write_in_batches(write, attributes, computed, batch_size, report)
+    errors.update(failed)
+    invalidate_layer([building_geometry_model, building_model])
+    report.timed(dict(prepared["timings"], insert=time.perf_counter() - started))
 
     error_message = ""
-    for char_field, info in skipped_fields_info.items():
-        error_message += (
-            f"Skipped {char_field} for IDs: {info['ids']} (Count: {info['count']})\n"
-        )
+    for char_field, ids in prepared["skipped_fields"].items():
+        error_message += f"Skipped {char_field} for IDs: {ids} (Count: {len(ids)})\n"
+    error_message += row_errors_message(errors)
+
+    return prepared["geometry_type"], prepared["bound_dict"], error_message
+
+
+def handle_building_file(
+    gdf, user_id, building_geometry_model, building_model, batch_size=None
+):
+    """
+    Imports the buildings of ``gdf``.
+
+    Road names, wards, centroids and plus codes are computed for the whole frame
+    at once and rows are written with ``bulk_create``, see prepare_building_chunk
+    and handle_prepared_buildings.
 
-    return geometry_type, bound_dict, error_message
+    Returns:
+        tuple:
+        The geometry type, the bounds of the file, and a message listing the
+        char fields that were too long for the model and the skipped rows.
+    """
+    return handle_prepared_buildings(
+        prepare_building_chunk(
+            gdf,
+            get_ward_geodataframe(),
+            get_char_fields_max_lengths(building_model),
+        ),
+        user_id,
+        building_geometry_model,
+        building_model,
+        batch_size,
+    )
+
+
+def handle_building_chunks(
+    chunks, user_id, building_geometry_model, building_model, workers, report
+):
+    return handle_in_chunks(
+        handle_prepared_buildings,
+        prepare_chunks(
+            prepare_building_chunk,
+            chunks,
+            workers,
+            get_ward_geodataframe(),
+            get_char_fields_max_lengths(building_model),
+        ),
+        user_id,
+        building_geometry_model,
+        building_model,
+        report=report,
+    )
 
 
 def building_handle_shapefile(
@@ -364,18 +932,26 @@ def building_handle_shapefile(
     building_model,
     building_geometry_model,
     user_id,
+    workers=None,
+    report=None,
 ):
     """
     Handle the processing of a shapefile.
 
     This function reads the shapefile, extracts the geometry type, total bounds, and attribute data from each feature,
     and creates corresponding feature collection instances in the database..
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    gdf = gpd.read_file(shape)
-    crs = "epsg:4326"
-    gdf.crs = crs
-    return handle_building_file(gdf, user_id, building_geometry_model, building_model)
+    return handle_building_chunks(
+        read_file_chunks(shape),
+        user_id,
+        building_geometry_model,
+        building_model,
+        workers,
+        report,
+    )
 
 
 def building_handle_geojson(
@@ -383,18 +959,26 @@ def building_handle_geojson(
     building_model,
     building_geometry_model,
     user_id,
+    workers=None,
+    report=None,
 ):
     """
     Handle the processing of a GeoJSON file.
 
     This function reads the GeoJSON file, extracts the CRS information, total bounds, and attribute data from each feature,
     and creates corresponding feature collection instances in the database.
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    gdf = gpd.read_file(shape)
-    crs = "epsg:4326"
-    gdf.crs = crs
-    return handle_building_file(gdf, user_id, building_geometry_model, building_model)
+    return handle_building_chunks(
+        read_file_chunks(shape),
+        user_id,
+        building_geometry_model,
+        building_model,
+        workers,
+        report,
+    )
 
 
 def building_handle_csv(
@@ -402,6 +986,8 @@ def building_handle_csv(
     building_model,
     building_geometry_model,
     user_id,
+    workers=None,
+    report=None,
 ):
     """
     Handle the processing of a CSV file.
@@ -409,16 +995,18 @@ def building_handle_csv(
     This function reads the CSV file, creates a GeoDataFrame by converting latitude and longitude columns to geometry,
     extracts the geometry type, total bounds, and attribute data from each row,
     and creates corresponding feature collection instances in the database.
+    Chunks of the file are prepared in ``workers`` processes and the progress is
+    counted in ``report``, an IngestionReport.
 
     """
-    df = pd.read_csv(shape, keep_default_na=False)
-    gdf = gpd.GeoDataFrame(
-        df, geometry=gpd.points_from_xy(df["longitude"], df["latitude"])
+    return handle_building_chunks(
+        read_csv_chunks(shape),
+        user_id,
+        building_geometry_model,
+        building_model,
+        workers,
+        report,
     )
-    crs = "epsg:4326"
-    gdf.crs = crs
-    gdf.fillna("")
-    return handle_building_file(gdf, user_id, building_geometry_model, building_model)
 
 
 def handlepalikageometryfile(id):
@@ -448,38 +1036,123 @@ def handlepalikageometryfile(id):
     return "success"
 
 
+def copy_feature_collection(gdf, vector_layer_id, user_id, feature_collection_model):
+    """
+    Loads the features of ``gdf`` into ``feature_collection_model`` with COPY.
+
+    The features are written as CSV rows of hex EWKB and JSON attributes into a
+    temporary staging table, which is merged into the feature table with one
+    INSERT ... SELECT, all in one transaction. Only works on PostgreSQL.
+
+    Returns:
+        int:
+        The number of features inserted.
+    """
+    table = feature_collection_model._meta.db_table
+    srid = feature_collection_model._meta.get_field("geom").srid
+    attributes = gdf.drop(columns=["geometry"]).astype(object)
+    attributes = attributes.where(pd.notna(attributes), None)
+
+    # keeps small layers in memory and spills large ones to disk
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024, mode="w+") as rows:
+        writer = csv.writer(rows)
+        for geom, attr_data in zip(gdf.geometry, attributes.to_dict("records")):
+            writer.writerow(
+                [
+                    (
+                        wkb.dumps(geom, hex=True, srid=srid, output_dimension=2)
+                        if geom is not None
+                        else None
+                    ),
+                    json.dumps(attr_data, default=str),
+                ]
+            )
+        rows.seek(0)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS feature_collection_staging")
+            cursor.execute(
+                "CREATE TEMPORARY TABLE feature_collection_staging "
+                "(geom text, attr_data text) ON COMMIT DROP"
+            )
+            cursor.copy_expert(
+                "COPY feature_collection_staging (geom, attr_data) "
+                "FROM STDIN WITH (FORMAT csv)",
+                rows,
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {table}
+                    (vector_layer_id, attr_data, geom, created_by_id, updated_date,
+                     is_deleted)
+                SELECT %s, attr_data::jsonb, ST_GeomFromEWKB(decode(geom, 'hex')), %s,
+                       now(), false
+                FROM feature_collection_staging
+                """,
+                [vector_layer_id, user_id],
+            )
+            return cursor.rowcount
+
+
+def handle_vector_features(gdf, vector_layer_id, user_id, feature_collection_model):
+    """
+    Creates the feature collection instances of the features of ``gdf``. On
+    PostgreSQL the features are loaded with COPY, see copy_feature_collection.
+    """
+    if any(col.lower() == "id" for col in gdf.columns):
+        gdf.drop(
+            columns=[col for col in gdf.columns if col.lower() == "id"],
+            inplace=True,
+        )
+    geometry_type = gdf["geometry"].iloc[0].geom_type
+    total_bounds = gdf.total_bounds
+    bound_dict = {"total_bounds": total_bounds.tolist()}
+    if connection.vendor == "postgresql":
+        started = time.perf_counter()
+        created = copy_feature_collection(
+            gdf, vector_layer_id, user_id, feature_collection_model
+        )
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Copied %s features in %.2fs (%.0f rows/s)",
+            created,
+            elapsed,
+            created / elapsed if elapsed else 0,
+        )
+        return geometry_type, bound_dict
+
+    user_instance = User.objects.get(id=user_id)
+    for index, row in gdf.iterrows():
+        dropped_geometry = row.drop(["geometry"])
+        geom = GEOSGeometry(str(row["geometry"]))
+        wkt = wkt_w(dim=2).write(geom).decode()
+        geom = GEOSGeometry(wkt)
+        attr_data = dropped_geometry.to_dict()
+        feature_collection_model.objects.create(
+            vector_layer_id=vector_layer_id,
+            attr_data=attr_data,
+            geom=geom,
+            created_by=user_instance,
+        )
+    return geometry_type, bound_dict
+
+
 def handle_vector_layer(shape, vector_layer_id, user_id, feature_collection_model):
     """
     Handle the processing of a vector layer in shapefile.
 
-    This function reads the shapefile, extracts the geometry type, total bounds, and attribute data from each feature,
+    This function reads the shapefile in chunks, extracts the geometry type, total bounds, and attribute data from each feature,
     and creates corresponding feature collection instances in the database.
 
     """
     try:
-        gdf = gpd.read_file(shape)
-        if any(col.lower() == "id" for col in gdf.columns):
-            gdf.drop(
-                columns=[col for col in gdf.columns if col.lower() == "id"],
-                inplace=True,
-            )
-        geometry_type = gdf["geometry"].iloc[0].geom_type
-        total_bounds = gdf.total_bounds
-        bound_dict = {"total_bounds": total_bounds.tolist()}
-        user_instance = User.objects.get(id=user_id)
-        for index, row in gdf.iterrows():
-            dropped_geometry = row.drop(["geometry"])
-            geom = GEOSGeometry(str(row["geometry"]))
-            wkt = wkt_w(dim=2).write(geom).decode()
-            geom = GEOSGeometry(wkt)
-            attr_data = dropped_geometry.to_dict()
-            feature_collection_model.objects.create(
-                vector_layer_id=vector_layer_id,
-                attr_data=attr_data,
-                geom=geom,
-                created_by=user_instance,
-            )
-        return geometry_type, bound_dict
+        return handle_in_chunks(
+            handle_vector_features,
+            read_file_chunks(shape),
+            vector_layer_id,
+            user_id,
+            feature_collection_model,
+        )
     except Exception as e:
         return e
 
@@ -0,0 +1,44 @@
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from api.filters import BuildingFilter
+from api.serializers.core_serializers import BuildingBulkUpdateSerializer
+from api.utils.bulk_update import bulk_update_buildings
+from core.models import Building
+
+
+class BuildingBulkUpdate(APIView):
+    """
+    Applies the same attribute changes, e.g. tole_name, reg_type or road_id, to the
+    buildings selected by ids or by the building filter params, and records them
+    as one edit in the history logs.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Bulk update buildings",
+        request_body=BuildingBulkUpdateSerializer,
+        tags=["building"],
+    )
+    def post(self, request):
+        serializer = BuildingBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        queryset = Building.objects.filter(is_deleted=False)
+        if data.get("ids"):
+            queryset = queryset.filter(id__in=data["ids"])
+        if data.get("filter"):
+            building_filter = BuildingFilter(data=data["filter"], queryset=queryset)
+            if not building_filter.is_valid():
+                return Response(
+                    data={"filter": building_filter.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            queryset = building_filter.qs
+
+        result = bulk_update_buildings(queryset, data["changes"], user=request.user)
+        return Response(data=result, status=status.HTTP_200_OK)
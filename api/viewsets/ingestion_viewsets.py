@@ -0,0 +1,37 @@
+from celery.result import AsyncResult
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from api.utils.swagger_params import celery_params
+
+
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Progress of a building or road upload task",
+    manual_parameters=celery_params,
+    tags=["upload"],
+)
+@api_view(["GET"])
+def get_ingestion_task_response(request):
+    """
+    Returns the state of an upload task. While the file is imported the progress
+    holds the rows read, inserted and skipped with the skip reasons, and the rows
+    per second so far. The final report is also stored on the upload as
+    ``ingestion_report``.
+    """
+    task_id = request.query_params.get("task_id")
+    if not task_id:
+        return Response(
+            data={"message": "task_id is required"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    result = AsyncResult(task_id)
+    data = {"task_id": task_id, "state": result.state}
+    if result.state == "PROGRESS":
+        data["progress"] = result.info
+    elif result.successful():
+        data["result"] = result.result
+    elif result.failed():
+        data["result"] = str(result.result)
+    return Response(data=data, status=status.HTTP_200_OK)
@@ -0,0 +1,56 @@
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.views import APIView
+from core.models import (
+    BuildingGeometry,
+    RoadGeometry,
+    PalikaWardGeometry,
+    PalikaGeometry,
+)
+from core.tile import BinaryRenderer, BaseCompositeMVTView
+
+
+class CompositeVectorTile(APIView):
+    """
+    Building, road, ward boundary and palika boundary tiles in a single request,
+    each as its own named layer of the vector tile.
+    """
+
+    renderer_classes = (BinaryRenderer,)
+    layers = {
+        "palika": PalikaGeometry,
+        "ward": PalikaWardGeometry,
+        "road": RoadGeometry,
+        "building": BuildingGeometry,
+    }
+
+    @swagger_auto_schema(
+        operation_summary="Composite vector-tile",
+        manual_parameters=[
+            openapi.Parameter(
+                name="layers",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated layers to include: "
+                "palika, ward, road, building. Defaults to all.",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="cluster",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                description="Serve buildings as clusters, by default only at low zoom",
+                required=False,
+            ),
+        ],
+        tags=["vector-tile"],
+    )
+    def get(self, request, *args, **kwargs):
+        return BaseCompositeMVTView.get(
+            self,
+            request=request,
+            z=kwargs.get("z"),
+            x=kwargs.get("x"),
+            y=kwargs.get("y"),
+            layers=self.layers,
+        )
@@ -0,0 +1,334 @@
+"""
+Batch house numbering of whole wards.
+
+``core.script.main_house_address_generator`` numbers one main building at a time.
+The batch engine loads every main building of a ward at once, projects the gate
+points (ref_centroid) of all of them on their roads in EPSG:32645 with vectorized
+geopandas/numpy operations, derives the side of the road and the rounded distance
+the same way and writes ``house_no``, ``metric_address``, ``direction`` and
+``associate_road_name`` with ``bulk_update``. The road chains come from a
+``core.road_network.RoadNetwork`` shared by every ward of a run.
+"""
+
+import heapq
+import time
+from collections import Counter
+
+import geopandas as gpd
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core.models import Building, BuildingGeometry
+from core.road_network import RoadNetwork
+from core.script import house_numbering
+from core.utils.house_number_index import HouseNumberIndex, join_house_no
+from core.utils.tile_cache import invalidate_layer
+
+NUMBERING_BATCH_SIZE = getattr(settings, "INGESTION_BATCH_SIZE", 2000)
+# the gate must be within this distance, in meters, of the building centroid
+MAX_GATE_DISTANCE = 10
+NUMBERED_FIELDS = ["house_no", "metric_address", "direction", "associate_road_name"]
+
+
+def left_round(distances):
+    """
+    Rounds distances to the odd numbers of the left side, as LeftDirRound.
+    """
+    answer = np.round(distances)
+    up = np.abs(answer + 1 - distances) > np.abs(answer - 1 - distances)
+    return np.where(answer % 2 == 1, answer, np.where(up, answer + 1, answer - 1))
+
+
+def right_round(distances):
+    """
+    Rounds distances to the even numbers of the right side, as RightDirRound.
+    """
+    answer = np.round(distances)
+    up = np.abs(answer + 1 - distances) < np.abs(answer - 1 - distances)
+    return np.where(answer % 2 == 0, answer, np.where(up, answer + 1, answer - 1))
+
+
+def gate_sides(roads, gates, distances):
+    """
+    Returns, as get_direction, "Left" or "Right" for every gate depending on the
+    side of its road it lies on.
+
+    Args:
+        roads (GeoSeries): Road of every gate.
+        gates (GeoSeries): Gate points.
+        distances (ndarray): Distances of the gates projected along their roads.
+    """
+    ip = roads.interpolate(distances)
+    prev_ip = roads.interpolate(np.maximum(distances - 1, 0))
+    azimuth_a = np.arctan2(
+        ip.x.to_numpy() - gates.x.to_numpy(), ip.y.to_numpy() - gates.y.to_numpy()
+    )
+    azimuth_b = np.arctan2(
+        ip.x.to_numpy() - prev_ip.x.to_numpy(), ip.y.to_numpy() - prev_ip.y.to_numpy()
+    )
+    right = ((azimuth_b > azimuth_a) & (azimuth_b - azimuth_a < np.pi)) | (
+        (azimuth_a > azimuth_b) & (azimuth_a - azimuth_b > np.pi)
+    )
+    return np.where(right, "Right", "Left")
+
+
+def house_numbers(roads, gates):
+    """
+    Returns the rounded distance along its road and the side of every gate.
+    """
+    distances = roads.project(gates).to_numpy()
+    directions = gate_sides(roads, gates, distances)
+    left = directions == "Left"
+    numbers = np.where(
+        distances == 0,
+        np.where(left, 1, 2),
+        np.where(left, left_round(distances), right_round(distances)),
+    )
+    return numbers.astype(int), directions
+
+
+def _projected_points(points):
+    return gpd.GeoSeries(
+        gpd.points_from_xy(
+            [point.x for point in points], [point.y for point in points]
+        ),
+        crs="epsg:4326",
+    ).to_crs(epsg=32645)
+
+
+def number_buildings(buildings, network, index=None, batch_size=None):
+    """
+    Numbers the main buildings of ``buildings``.
+
+    Args:
+        buildings (QuerySet): Buildings to number, only main buildings are.
+        network (RoadNetwork): Roads of the run.
+        index (HouseNumberIndex): Numbers taken in the run, seeded from the
+                                  buildings on the roads of ``buildings`` when
+                                  omitted.
+        batch_size (int): Rows per UPDATE, INGESTION_BATCH_SIZE by default.
+    Returns:
+        dict:
+        The number of buildings numbered and skipped, the skip reasons and the
+        time taken.
+    """
+    start = time.time()
+    skipped = Counter()
+    rows = []
+    # in id order, so that the same building is bumped on a collision every run
+    for pk, road_id, centroid, ref_centroid in (
+        buildings.filter(association_type="main")
+        .order_by("id")
+        .values_list("id", "road_id", "centroid", "ref_centroid")
+    ):
+        road = network.road(road_id) if road_id else None
+        if centroid is None or ref_centroid is None:
+            skipped["centroid or ref_centroid missing"] += 1
+            continue
+        if road is None:
+            skipped["road not found"] += 1
+            continue
+        road_ids = (network.get_road_ids(road) + "/" + str(road.road_id))[1:]
+        if road_ids.split("/")[0] == "none":
+            skipped["road not connected"] += 1
+            continue
+        rows.append((pk, road, road_ids, centroid, ref_centroid))
+
+    updates = []
+    if rows:
+        gates = _projected_points([row[4] for row in rows])
+        too_far = (
+            _projected_points([row[3] for row in rows]).distance(gates).to_numpy()
+            > MAX_GATE_DISTANCE
+        )
+        roads = gpd.GeoSeries(
+            [network.projected_geometry(row[1]) for row in rows], crs="epsg:32645"
+        )
+        numbers, directions = house_numbers(roads, gates)
+
+        if index is None:
+            index = HouseNumberIndex.from_buildings(
+                Building.objects.filter(road_id__in={row[1].road_id for row in rows})
+            )
+        if too_far.any():
+            skipped["ref_centroid more than 10m away from centroid"] += int(
+                too_far.sum()
+            )
+        renumbered = [
+            (row, number, direction)
+            for row, number, direction, far in zip(rows, numbers, directions, too_far)
+            if not far
+        ]
+        # the renumbered buildings give up their previous numbers first, skipped
+        # ones keep theirs
+        for row, _, _ in renumbered:
+            index.release(row[0])
+
+        for (pk, road, road_ids, _, _), number, direction in renumbered:
+            metric_address = network.get_metric_address(road_ids)
+            prefix = network.get_distance(road)[1:]
+            number = index.assign(
+                pk, road.road_id, prefix, int(number), 1 if direction == "Left" else 2
+            )
+            house_no = join_house_no(prefix, number)
+            updates.append(
+                Building.for_bulk_create(
+                    id=pk,
+                    house_no=house_no,
+                    metric_address=metric_address,
+                    direction=str(direction),
+                    associate_road_name=(
+                        metric_address
+                        if road.road_category == "subsidiary"
+                        else road.road_name_en
+                    ),
+                )
+            )
+
+    if updates:
+        with transaction.atomic():
+            Building.objects.bulk_update(
+                updates, NUMBERED_FIELDS, batch_size=batch_size or NUMBERING_BATCH_SIZE
+            )
+            transaction.on_commit(
+                lambda: invalidate_layer([BuildingGeometry, Building])
+            )
+
+    return {
+        "numbered": len(updates),
+        "skipped": sum(skipped.values()),
+        "skipped_reasons": dict(skipped),
+        "elapsed_seconds": round(time.time() - start, 3),
+    }
+
+
+def number_ward(ward_no, network=None, index=None):
+    """
+    Numbers the main buildings of ward ``ward_no``, see ``number_buildings``.
+    """
+    if network is None:
+        network = RoadNetwork.load()
+    return number_buildings(Building.objects.filter(ward_no=ward_no), network, index)
+
+
+def renumber_affected(road_ids=(), geometries=(), building_ids=(), network=None):
+    """
+    Renumbers only the houses whose number an edit may have changed.
+
+    Args:
+        road_ids (list): Edited roads, whose houses are renumbered together with
+                         the houses of the roads branching off them.
+        geometries (list): WKT geometries, in EPSG:4326, of edited roads before
+                           and after the edit. The roads starting around them may
+                           have changed parent and are renumbered too.
+        building_ids (list): Buildings whose gate moved.
+        network (RoadNetwork): Roads after the edit, loaded when omitted.
+    Returns:
+        dict:
+        The report of number_buildings for the main buildings, with the number
+        of roads and of associate and dissociate buildings renumbered.
+    """
+    start = time.time()
+    if network is None:
+        network = RoadNetwork.load()
+    seeds = {road_id for road_id in road_ids if road_id is not None}
+    if geometries:
+        for geometry in gpd.GeoSeries.from_wkt(
+            list(geometries), crs="epsg:4326"
+        ).to_crs(epsg=32645):
+            seeds |= network.roads_starting_near(geometry)
+    affected_roads = network.descendants(seeds)
+
+    buildings = Building.objects.filter(
+        Q(road_id__in=affected_roads) | Q(id__in=building_ids)
+    )
+    report = number_buildings(buildings, network)
+
+    # associate and dissociate buildings take the number of their main one
+    main_building_ids = buildings.filter(
+        association_type="main", building_id__isnull=False
+    ).values_list("building_id", flat=True)
+    data_ids = list(
+        Building.objects.filter(
+            Q(main_building_id__in=main_building_ids) | Q(id__in=building_ids),
+            association_type__in=["associate", "dissociate"],
+        ).values_list("id", flat=True)
+    )
+    for data_id in data_ids:
+        house_numbering(data_id, network)
+
+    report.update(
+        {
+            "roads": len(affected_roads),
+            "associated": len(data_ids),
+            "elapsed_seconds": round(time.time() - start, 3),
+        }
+    )
+    return report
+
+
+def number_associated_buildings(network, index):
+    """
+    Numbers the associate and dissociate buildings after their main buildings,
+    which they take their number from.
+    """
+    data_ids = list(
+        Building.objects.filter(
+            association_type__in=["associate", "dissociate"]
+        ).values_list("id", flat=True)
+    )
+    for data_id in data_ids:
+        house_numbering(data_id, network, index)
+    return len(data_ids)
+
+
+def partition_components(network, partitions):
+    """
+    Splits the road components of ``network`` into at most ``partitions`` lists
+    of road_ids holding about the same number of main buildings.
+    """
+    counts = dict(
+        Building.objects.filter(association_type="main", road_id__isnull=False)
+        .values_list("road_id")
+        .annotate(count=Count("id"))
+    )
+    components = sorted(
+        (
+            (sum(counts.get(road_id, 0) for road_id in component), component)
+            for component in network.components()
+        ),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+    bins = [(0, position, []) for position in range(max(partitions, 1))]
+    for count, component in components:
+        if not count:
+            continue
+        size, position, road_ids = heapq.heappop(bins)
+        road_ids.extend(component)
+        heapq.heappush(bins, (size + count, position, road_ids))
+    return [road_ids for _, _, road_ids in sorted(bins, key=lambda b: b[1]) if road_ids]
+
+
+def merge_reports(reports):
+    """
+    Returns the combined counts and timings of the reports of number_buildings,
+    and the errors of the partitions that failed.
+    """
+    skipped_reasons = Counter()
+    for report in reports:
+        skipped_reasons.update(report["skipped_reasons"])
+    elapsed = [report["elapsed_seconds"] for report in reports]
+    return {
+        "partitions": len(reports),
+        "errors": [
+            report["message"] for report in reports if report.get("stat") == "error"
+        ],
+        "numbered": sum(report["numbered"] for report in reports),
+        "skipped": sum(report["skipped"] for report in reports),
+        "skipped_reasons": dict(skipped_reasons),
+        "partition_seconds_total": round(sum(elapsed), 3),
+        "partition_seconds_max": max(elapsed, default=0),
+    }
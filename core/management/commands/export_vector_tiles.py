@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from core.tasks import TILE_EXPORT_LAYERS, export_vector_tiles_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render building and road vector tiles over the palika or ward extents "
+        "into archives served by the tile endpoints"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--layer",
+            action="append",
+            choices=sorted(TILE_EXPORT_LAYERS),
+            help="Layer to export, can be repeated. Defaults to every layer.",
+        )
+        parser.add_argument("--min-zoom", type=int, default=12)
+        parser.add_argument("--max-zoom", type=int, default=18)
+        parser.add_argument(
+            "--ward",
+            type=int,
+            action="append",
+            help="Ward number whose extent is exported, can be repeated.",
+        )
+        parser.add_argument(
+            "--palika",
+            type=int,
+            action="append",
+            help="PalikaGeometry id whose extent is exported, can be repeated.",
+        )
+        parser.add_argument(
+            "--format", choices=["mbtiles", "directory"], default="mbtiles"
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="run_async",
+            help="Queue the export on celery instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        kwargs = {
+            "layers": options["layer"] or sorted(TILE_EXPORT_LAYERS),
+            "min_zoom": options["min_zoom"],
+            "max_zoom": options["max_zoom"],
+            "ward_nos": options["ward"],
+            "palika_ids": options["palika"],
+            "archive_format": options["format"],
+        }
+        if options["run_async"]:
+            task = export_vector_tiles_task.delay(**kwargs)
+            self.stdout.write(self.style.SUCCESS(f"Queued tile export task {task.id}"))
+            return
+
+        result = export_vector_tiles_task(**kwargs)
+        if result.get("stat") == "error":
+            self.stdout.write(self.style.ERROR(result["message"]))
+            return
+        for layer, counts in result["data"].items():
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Exported {counts['tiles']} {layer} tiles "
+                    f"({counts['empty']} empty)"
+                )
+            )
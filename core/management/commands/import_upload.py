@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from core.tasks import process_building_file, process_road_file
+
+UPLOAD_TASKS = {"building": process_building_file, "road": process_road_file}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import an uploaded building or road file, preparing its chunks in "
+        "parallel worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("layer", choices=sorted(UPLOAD_TASKS))
+        parser.add_argument(
+            "upload_id", type=int, help="BuildingUpload or RoadUpload id."
+        )
+        parser.add_argument(
+            "--user", type=int, required=True, help="Id of the importing user."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of processes preparing chunks of the file. Defaults to "
+            "INGESTION_WORKERS.",
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="run_async",
+            help="Queue the import on celery instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        task = UPLOAD_TASKS[options["layer"]]
+        kwargs = {
+            "file_id": options["upload_id"],
+            "user_id": options["user"],
+            "workers": options["workers"],
+        }
+        if options["run_async"]:
+            result = task.delay(**kwargs)
+            self.stdout.write(self.style.SUCCESS(f"Queued import task {result.id}"))
+            return
+
+        result = task(**kwargs)
+        if isinstance(result, str):
+            self.stdout.write(self.style.ERROR(result))
+        elif isinstance(result, tuple):
+            # the rows or fields that were skipped
+            self.stdout.write(self.style.WARNING(result[2]))
+        else:
+            self.stdout.write(self.style.SUCCESS("Import finished"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.tasks import generate_house_numbers_task
+
+
+class Command(BaseCommand):
+    help = "Queue the numbering of every house on celery"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fan-out",
+            choices=["component"],
+            help="Number the main buildings in parallel sub-tasks per group of "
+            "road components instead of ward by ward in one task.",
+        )
+
+    def handle(self, *args, **options):
+        task = generate_house_numbers_task.delay(fan_out=options["fan_out"])
+        self.stdout.write(self.style.SUCCESS(f"Queued house numbering task {task.id}"))
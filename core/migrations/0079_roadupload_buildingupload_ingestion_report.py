@@ -0,0 +1,22 @@
+# Generated by Django 4.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0078_buildingcategorychoice_alias_name_ne_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildingupload",
+            name="ingestion_report",
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+        migrations.AddField(
+            model_name="roadupload",
+            name="ingestion_report",
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+    ]
@@ -1,9 +1,11 @@
+import copy
 import math
 from django.db import models
 from django.contrib.gis.db import models
 from user.models import User
 from django.db.models import JSONField, Manager as GeoManager
 from core.utils.managers import LayerManager
+from core.utils.choice_registry import apply_choices, get_choices, invalidate_choices
 from django.utils.translation import gettext_lazy as _
 from .tile import MVTManager
 from multiselectfield import MultiSelectField
@@ -30,8 +32,12 @@ from core.utils.constants import (
     SPECIFIC_USE_CHOICES,
     BuildingFieldChoicesType,
     RoadfieldChoicesType,
+    BUILDING_TILE_PROFILES,
+    ROAD_TILE_PROFILES,
+    BUILDING_ATTRIBUTE_TILE_PROFILES,
+    ROAD_ATTRIBUTE_TILE_PROFILES,
+    BUILDING_TILE_CLUSTERS,
 )
-from django.forms.models import model_to_dict
 from shapely.geometry import mapping, shape
 from django.contrib.gis.geos import GEOSGeometry, WKTWriter
 import json
@@ -43,10 +49,44 @@ import ast
 from django.db import transaction
 from datetime import datetime
 from django.core.exceptions import ValidationError
+from core.utils.tile_cache import geometry_extent, invalidate_tiles
+from core.utils.history import queue_record
+from core.utils.renumbering import (
+    renumber_building_on_commit,
+    renumber_road_geometry_on_commit,
+    renumber_road_on_commit,
+)
 
 # from .tile import MVTManager
 
 
+def stored_geometry(instance, field="geom"):
+    """
+    Returns the geometry currently stored in the database for ``instance``, from
+    the values it was loaded with when there are, otherwise from the database.
+    """
+    if not instance.pk:
+        return None
+    loaded_values = getattr(instance, "_loaded_values", {})
+    if field in loaded_values:
+        return loaded_values[field]
+    return (
+        type(instance)
+        .objects.filter(pk=instance.pk)
+        .values_list(field, flat=True)
+        .first()
+    )
+
+
+def invalidate_tiles_on_commit(layers, *geoms):
+    """
+    Invalidates the cached vector tiles of ``layers`` covering ``geoms`` once the
+    surrounding transaction commits, so no request can cache the old state again.
+    """
+    extents = [geometry_extent(geom) for geom in geoms]
+    transaction.on_commit(lambda: invalidate_tiles(layers, *extents))
+
+
 class AuditableModel(models.Model):
     created_by = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, related_name="+"
@@ -60,6 +100,116 @@ class AuditableModel(models.Model):
     class Meta:
         abstract = True
 
+    @classmethod
+    def for_bulk_create(cls, **kwargs):
+        """
+        Returns an unsaved instance without running the ``__init__`` of the model
+        itself, like the choice lookups of Road and Building, which only validation
+        needs and which are too slow to repeat for every row of a bulk import.
+        """
+        instance = cls.__new__(cls)
+        models.Model.__init__(instance, **kwargs)
+        return instance
+
+
+def _field_snapshot(value):
+    if isinstance(value, GEOSGeometry):
+        return value.clone()
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _field_key(value):
+    # geometries are compared by their EWKB so that srid and coordinates count
+    if isinstance(value, GEOSGeometry):
+        return bytes(value.ewkb)
+    return value
+
+
+class DirtyFieldsMixin:
+    """
+    Tracks the fields changed since an instance was loaded from the database, so
+    changes are detected without loading the row again and saving an instance
+    only writes the changed columns.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    def snapshot_fields(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: _field_snapshot(field.value_from_object(self))
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+        }
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or not self.has_loaded_values():
+            self.snapshot_fields()
+            return
+        # fields that were not refreshed keep their changes
+        for name in fields:
+            field = self._meta.get_field(name)
+            self._loaded_values[field.attname] = _field_snapshot(
+                field.value_from_object(self)
+            )
+
+    def has_loaded_values(self):
+        return hasattr(self, "_loaded_values")
+
+    def get_dirty_fields(self, previous_instance=None):
+        """
+        Args:
+            previous_instance (Model): Instance to compare with instead of the
+                                       values loaded from the database.
+        Returns:
+            dict:
+            The previous value of every concrete field that changed, by field.
+        """
+        deferred = self.get_deferred_fields()
+        loaded_values = getattr(self, "_loaded_values", {})
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if previous_instance is not None:
+                previous = field.value_from_object(previous_instance)
+            elif field.attname in loaded_values:
+                previous = loaded_values[field.attname]
+            else:
+                # not loaded with the instance, e.g. a deferred field that was set
+                dirty[field] = None
+                continue
+            if _field_key(field.value_from_object(self)) != _field_key(previous):
+                dirty[field] = previous
+        return dirty
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and not self._state.adding
+            and self.has_loaded_values()
+        ):
+            update_fields = [field.name for field in self.get_dirty_fields()]
+            if update_fields:
+                update_fields += [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if getattr(field, "auto_now", False)
+                    and field.name not in update_fields
+                ]
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        self.snapshot_fields()
+
 
 class PalikaProfile(AuditableModel, models.Model):
     name_en = models.CharField(max_length=255, null=True, blank=True)
@@ -89,7 +239,7 @@ class PalikaGeometry(models.Model):
     geom = models.GeometryField(srid=4326, blank=True, null=True)
 
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True)
 
     def __str__(self):
         return str(self.id)
@@ -105,7 +255,7 @@ class PalikaWardGeometry(models.Model):
     geom = models.GeometryField(srid=4326, blank=True, null=True)
 
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True)
 
     def __str__(self):
         return str(self.id)
@@ -114,15 +264,17 @@ class PalikaWardGeometry(models.Model):
 class RoadUpload(models.Model):
     file_type = models.CharField(max_length=20, choices=FILE_FORMAT_CHOICES, null=True)
     file_upload = models.FileField(upload_to="Files")
+    # rows read, inserted and skipped and the throughput of the last import
+    ingestion_report = JSONField(default=dict, null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
 
 
-class RoadGeometry(models.Model):
+class RoadGeometry(DirtyFieldsMixin, models.Model):
     geom = models.GeometryField(srid=4326, blank=True, null=True)
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True, profiles=ROAD_TILE_PROFILES)
 
     created_by = models.ForeignKey(
         User,
@@ -144,26 +296,13 @@ class RoadGeometry(models.Model):
     def __str__(self):
         return str(self.id)
 
-    def get_changes(self, previous_instance):
+    def get_changes(self, previous_instance=None):
         changes = {}
+        dirty_fields = self.get_dirty_fields(previous_instance)
+        self.timestamp = self.serialize_timestamp(self.timestamp, self)
 
-        current_dict = model_to_dict(self)
-        previous_dict = model_to_dict(previous_instance)
-
-        for field, value in current_dict.items():
-            if field == "timestamp":
-                previous_timestamp = self.serialize_timestamp(
-                    previous_dict.get(field), previous_instance
-                )
-                current_timestamp = self.serialize_timestamp(value, self)
-                self.timestamp = current_timestamp
-
-            elif field == "geom":
-                current_geom = self.serialize_geom(value)
-                previous_geom = self.serialize_geom(previous_dict.get(field))
-
-                if current_geom != previous_geom:
-                    changes[field] = current_geom
+        if any(field.name == "geom" for field in dirty_fields):
+            changes["geom"] = self.serialize_geom(self.geom)
 
         return changes
 
@@ -210,11 +349,23 @@ class RoadGeometry(models.Model):
                             timestamp=self.timestamp,
                         )
 
+                if is_new:
+                    invalidate_tiles_on_commit([RoadGeometry, Road], self.geom)
+                elif any(field.name == "geom" for field in self.get_dirty_fields()):
+                    previous_geom = stored_geometry(self)
+                    invalidate_tiles_on_commit(
+                        [RoadGeometry, Road], previous_geom, self.geom
+                    )
+                    renumber_road_geometry_on_commit(self.pk, previous_geom, self.geom)
                 super().save(*args, **kwargs)
 
             except Exception as e:
                 raise ValidationError(f"Error while saving RoadGeometry: {str(e)}")
 
+    def delete(self, *args, **kwargs):
+        invalidate_tiles_on_commit([RoadGeometry, Road], stored_geometry(self))
+        return super().delete(*args, **kwargs)
+
     def __str__(self):
         return str(self.id)
 
@@ -236,9 +387,14 @@ class RoadCategoryChoice(models.Model):
         if self.alias_name:
             self.attribute_name = self.alias_name.lower().replace(" ", "_")
         super().save(*args, **kwargs)
+        invalidate_choices(type(self))
+
+    def delete(self, *args, **kwargs):
+        invalidate_choices(type(self))
+        return super().delete(*args, **kwargs)
 
 
-class Road(AuditableModel, models.Model):
+class Road(DirtyFieldsMixin, AuditableModel, models.Model):
     feature = models.OneToOneField(
         RoadGeometry,
         on_delete=models.CASCADE,
@@ -266,43 +422,33 @@ class Road(AuditableModel, models.Model):
     bbox = JSONField(default=dict, null=True, blank=True)
     timestamp = models.DateTimeField(null=True, blank=True)
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True, profiles=ROAD_ATTRIBUTE_TILE_PROFILES)
 
     ROAD_CHOICES_FIELDS = ["road_type", "road_category", "road_class", "road_lane"]
 
     def __init__(self, *args, **kwargs):
         super(Road, self).__init__(*args, **kwargs)
-        for field_name in self.ROAD_CHOICES_FIELDS:
-            field = self._meta.get_field(field_name)
-            field.choices = self.get_other_model_choices(field_name)
+        apply_choices(Road, RoadCategoryChoice, self.ROAD_CHOICES_FIELDS)
 
     def get_other_model_choices(self, type):
-        other_model_choices = RoadCategoryChoice.objects.filter(type=type).values_list(
-            "attribute_name", "alias_name"
-        )
-        return other_model_choices
-
-    def get_changes(self, previous_instance):
-        current_dict = model_to_dict(self)
-        previous_dict = model_to_dict(previous_instance)
+        return get_choices(RoadCategoryChoice).get(type, [])
 
+    def get_changes(self, previous_instance=None):
         changes = {}
-
-        for field, value in current_dict.items():
-            if field == "timestamp":
-                previous_timestamp = self.serialize_timestamp(
-                    previous_dict.get(field), previous_instance
-                )
-                current_timestamp = self.serialize_timestamp(value, self)
-                self.timestamp = current_timestamp
-
-            else:
-                if field == "start_point" or "end_point":
-                    current_point = getattr(self, field)
-                    setattr(self, field, current_point)
-
-                elif value != previous_dict.get(field):
-                    changes[field] = {"old": previous_dict.get(field), "new": value}
+        dirty_fields = self.get_dirty_fields(previous_instance)
+        self.timestamp = self.serialize_timestamp(self.timestamp, self)
+
+        for field, previous_value in dirty_fields.items():
+            if not field.editable or field.name in (
+                "timestamp",
+                "start_point",
+                "end_point",
+            ):
+                continue
+            changes[field.name] = {
+                "old": previous_value,
+                "new": field.value_from_object(self),
+            }
 
         return changes
 
@@ -341,6 +487,14 @@ class Road(AuditableModel, models.Model):
                         field_value = getattr(self, field.attname)
                         if isinstance(field_value, float) and math.isnan(field_value):
                             setattr(self, field.attname, None)
+                if self.feature_id:
+                    invalidate_tiles_on_commit([RoadGeometry, Road], self.feature.geom)
+                if not is_new and any(
+                    field.name == "road_category" for field in self.get_dirty_fields()
+                ):
+                    renumber_road_on_commit(
+                        self.road_id, self.feature.geom if self.feature_id else None
+                    )
                 super().save(*args, **kwargs)
 
             except Exception as e:
@@ -362,6 +516,8 @@ class Road(AuditableModel, models.Model):
 class BuildingUpload(models.Model):
     file_type = models.CharField(max_length=20, choices=FILE_FORMAT_CHOICES, null=True)
     file_upload = models.FileField(upload_to="Files")
+    # rows read, inserted and skipped and the throughput of the last import
+    ingestion_report = JSONField(default=dict, null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
@@ -384,12 +540,19 @@ class BuildingCategoryChoice(models.Model):
         if self.alias_name:
             self.attribute_name = self.alias_name.lower().replace(" ", "_")
         super().save(*args, **kwargs)
+        invalidate_choices(type(self))
+
+    def delete(self, *args, **kwargs):
+        invalidate_choices(type(self))
+        return super().delete(*args, **kwargs)
 
 
-class BuildingGeometry(models.Model):
+class BuildingGeometry(DirtyFieldsMixin, models.Model):
     geom = models.GeometryField(srid=4326, blank=True, null=True)
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(
+        cache=True, profiles=BUILDING_TILE_PROFILES, clusters=BUILDING_TILE_CLUSTERS
+    )
     created_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -409,26 +572,13 @@ class BuildingGeometry(models.Model):
     def __str__(self):
         return str(self.id)
 
-    def get_changes(self, previous_instance):
+    def get_changes(self, previous_instance=None):
         changes = {}
+        dirty_fields = self.get_dirty_fields(previous_instance)
+        self.timestamp = self.serialize_timestamp(self.timestamp, self)
 
-        current_dict = model_to_dict(self)
-        previous_dict = model_to_dict(previous_instance)
-
-        for field, value in current_dict.items():
-            if field == "timestamp":
-                previous_timestamp = self.serialize_timestamp(
-                    previous_dict.get(field), previous_instance
-                )
-                current_timestamp = self.serialize_timestamp(value, self)
-                self.timestamp = current_timestamp
-
-            elif field == "geom":
-                current_geom = self.serialize_geom(value)
-                previous_geom = self.serialize_geom(previous_dict.get(field))
-
-                if current_geom != previous_geom:
-                    changes[field] = current_geom
+        if any(field.name == "geom" for field in dirty_fields):
+            changes["geom"] = self.serialize_geom(self.geom)
 
         return changes
 
@@ -474,13 +624,23 @@ class BuildingGeometry(models.Model):
                         timestamp=self.timestamp,
                     )
 
+            if is_new:
+                invalidate_tiles_on_commit([BuildingGeometry, Building], self.geom)
+            elif any(field.name == "geom" for field in self.get_dirty_fields()):
+                invalidate_tiles_on_commit(
+                    [BuildingGeometry, Building], stored_geometry(self), self.geom
+                )
             super().save(*args, **kwargs)
 
         except Exception as e:
             raise ValidationError(f"Error while saving BuildingGeometry: {str(e)}")
 
+    def delete(self, *args, **kwargs):
+        invalidate_tiles_on_commit([BuildingGeometry, Building], stored_geometry(self))
+        return super().delete(*args, **kwargs)
+
 
-class Building(AuditableModel, models.Model):
+class Building(DirtyFieldsMixin, AuditableModel, models.Model):
     feature = models.OneToOneField(
         BuildingGeometry,
         on_delete=models.CASCADE,
@@ -540,7 +700,7 @@ class Building(AuditableModel, models.Model):
     timestamp = models.DateTimeField(null=True, blank=True)
 
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True, profiles=BUILDING_ATTRIBUTE_TILE_PROFILES)
 
     BUILDING_CHOICES_FIELDS = [
         "owner_status",
@@ -557,46 +717,24 @@ class Building(AuditableModel, models.Model):
 
     def __init__(self, *args, **kwargs):
         super(Building, self).__init__(*args, **kwargs)
-        for field_name in self.BUILDING_CHOICES_FIELDS:
-            field = self._meta.get_field(field_name)
-            field.choices = self.get_other_model_choices(field_name)
+        apply_choices(Building, BuildingCategoryChoice, self.BUILDING_CHOICES_FIELDS)
 
     def get_other_model_choices(self, type):
-        other_model_choices = BuildingCategoryChoice.objects.filter(
-            type=type
-        ).values_list("attribute_name", "alias_name")
-        return other_model_choices
-
-    def get_changes(self, previous_instance):
-        current_dict = model_to_dict(self)
-        previous_dict = model_to_dict(previous_instance)
+        return get_choices(BuildingCategoryChoice).get(type, [])
 
+    def get_changes(self, previous_instance=None):
         changes = {}
-
-        for field, value in current_dict.items():
-            current_ref_centroid = previous_ref_centroid = None
-
-            if field == "timestamp":
-                previous_timestamp = self.serialize_timestamp(
-                    previous_dict.get(field), previous_instance
-                )
-                current_timestamp = self.serialize_timestamp(value, self)
-                self.timestamp = current_timestamp
-
-            elif field == "ref_centroid":
-                current_ref_centroid = self.serialize_ref_centroid(value, self)
-                previous_ref_centroid = self.serialize_ref_centroid(
-                    previous_dict.get(field), previous_instance
-                )
-
-                if current_ref_centroid != previous_ref_centroid:
-                    changes[field] = {
-                        "old": previous_ref_centroid,
-                        "new": current_ref_centroid,
-                    }
-            else:
-                if value != previous_dict.get(field):
-                    changes[field] = {"old": previous_dict.get(field), "new": value}
+        dirty_fields = self.get_dirty_fields(previous_instance)
+        self.timestamp = self.serialize_timestamp(self.timestamp, self)
+
+        for field, previous_value in dirty_fields.items():
+            if not field.editable or field.name == "timestamp":
+                continue
+            value = field.value_from_object(self)
+            if isinstance(field, models.GeometryField):
+                previous_value = self.serialize_ref_centroid(previous_value, self)
+                value = self.serialize_ref_centroid(value, self)
+            changes[field.name] = {"old": previous_value, "new": value}
 
         return changes
 
@@ -644,6 +782,14 @@ class Building(AuditableModel, models.Model):
                             timestamp=self.timestamp,
                         )
 
+                if self.feature_id:
+                    invalidate_tiles_on_commit(
+                        [BuildingGeometry, Building], self.feature.geom
+                    )
+                if not is_new and any(
+                    field.name == "ref_centroid" for field in self.get_dirty_fields()
+                ):
+                    renumber_building_on_commit(self.pk)
                 super().save(*args, **kwargs)
 
             except Exception as e:
@@ -842,63 +988,92 @@ class HistoryLog(models.Model):
         return f"{self.action} by {self.user} at {self.timestamp}"
 
     @classmethod
-    def create_log(cls, action, user, instance, timestamp):
-        content_type = ContentType.objects.get_for_model(instance)
-        object_id = instance.pk
-
-        previous_instance = instance.__class__.objects.get(pk=instance.pk)
+    def create_log(cls, action, user, instance, timestamp, previous_instance=None):
+        """
+        Diffs ``instance`` with ``previous_instance``, or with the values it was
+        loaded with when omitted, and queues the log of its changes, which is
+        written with the other logs of the transaction once it commits.
+        """
+        if previous_instance is None and not instance.has_loaded_values():
+            previous_instance = instance.__class__.objects.get(pk=instance.pk)
         changes = instance.get_changes(previous_instance)
-        for change in changes:
-            if change is not {}:
-                related_logs = None
-                related_id = None
-
-                if isinstance(instance, (Building, BuildingGeometry)):
-                    if isinstance(instance, BuildingGeometry):
-                        building_instance = Building.objects.get(feature=object_id)
-                        association_id = building_instance.id
-                    else:
-                        association_id = object_id
-                    related_logs = cls.objects.filter(
-                        timestamp=timestamp,
-                        content_type__in=[
-                            ContentType.objects.get_for_model(Building),
-                            ContentType.objects.get_for_model(BuildingGeometry),
-                        ],
-                    ).exclude(object_id=object_id)
-
-                if isinstance(instance, (Road, RoadGeometry)):
-                    if isinstance(instance, RoadGeometry):
-                        road_instance = Road.objects.get(feature=object_id)
-                        association_id = road_instance.id
-                    else:
-                        association_id = object_id
-                    related_logs = cls.objects.filter(
-                        timestamp=timestamp,
-                        content_type__in=[
-                            ContentType.objects.get_for_model(Road),
-                            ContentType.objects.get_for_model(RoadGeometry),
-                        ],
-                    ).exclude(object_id=object_id)
-
-                if related_logs.exists():
-                    related_id = related_logs.first().related_id
-                    if related_id is None:
-                        related_id = related_logs.first().id
-
-                log = cls.objects.create(
-                    user=user,
-                    action=action,
-                    content_type=content_type,
-                    object_id=object_id,
-                    content_object=instance,
-                    timestamp=timestamp,
-                    related_id=related_id,
-                    association_id=association_id,
-                    changes=changes,
-                )
-                if related_id is None:
-                    log.related_id = log.id
-                    log.save()
+        if not changes:
+            return None
+
+        log = cls(
+            user=user,
+            action=action,
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+            timestamp=cls._meta.get_field("timestamp").to_python(timestamp),
+            changes=changes,
+        )
+        queue_record(log, cls.write_logs)
+        return log
 
-            return log
+    @classmethod
+    def write_logs(cls, logs):
+        """
+        Inserts queued logs, linking every log to its Building or Road through
+        association_id and the logs of one edit, which share the timestamp of the
+        edit, through the related_id of the first of them.
+        """
+        families = {}
+        for family, family_models in (
+            ("building", (Building, BuildingGeometry)),
+            ("road", (Road, RoadGeometry)),
+        ):
+            for model in family_models:
+                families[ContentType.objects.get_for_model(model).id] = family
+
+        associations = {}
+        for feature_model, model in (
+            (Building, BuildingGeometry),
+            (Road, RoadGeometry),
+        ):
+            content_type_id = ContentType.objects.get_for_model(model).id
+            feature_ids = [
+                log.object_id for log in logs if log.content_type_id == content_type_id
+            ]
+            if feature_ids:
+                associations[content_type_id] = dict(
+                    feature_model.objects.filter(
+                        feature_id__in=feature_ids
+                    ).values_list("feature_id", "id")
+                )
+        for log in logs:
+            if log.content_type_id in associations:
+                log.association_id = associations[log.content_type_id].get(
+                    log.object_id
+                )
+            else:
+                log.association_id = log.object_id
+
+        related_ids = {}
+        previous_logs = (
+            cls.objects.filter(
+                timestamp__in={log.timestamp for log in logs},
+                content_type__in=families,
+            )
+            .order_by("id")
+            .values_list("content_type", "timestamp", "id", "related_id")
+        )
+        for content_type_id, timestamp, log_id, related_id in previous_logs:
+            related_ids.setdefault(
+                (families[content_type_id], timestamp), related_id or log_id
+            )
+
+        new_edits = []
+        for log in logs:
+            key = (families.get(log.content_type_id), log.timestamp)
+            log.related_id = related_ids.get(key)
+            if log.related_id is None:
+                new_edits.append((key, log))
+
+        cls.objects.bulk_create(logs)
+
+        # the first log of a new edit is related to itself and the others to it
+        for key, log in new_edits:
+            log.related_id = related_ids.setdefault(key, log.id)
+        if new_edits:
+            cls.objects.bulk_update([log for key, log in new_edits], ["related_id"])
@@ -0,0 +1,284 @@
+"""
+Road network graph used to number houses.
+
+House numbers are built from the chain of roads a house is reached through: a
+subsidiary road branches off the road found around its start point, its parent,
+up to a major or minor road. ``core.script`` resolves that chain with buffer
+queries for every hop and again for every house. ``RoadNetwork`` loads the roads
+once, projected to EPSG:32645, finds the parent of every subsidiary road with a
+spatial index and memoizes per road the chain of road ids and the metric prefix of
+its house numbers, so numbering a house only needs one projection on its road.
+"""
+
+import geopandas as gpd
+from shapely import wkb
+from shapely.geometry import Point
+
+from api.utils.file_handlers import line_endpoints
+from core.models import Road
+from core.script import LeftDirRound, RightDirRound, get_direction
+
+# radius of the first search around the start point of a road and its growth
+PARENT_SEARCH_RADIUS = 5
+PARENT_SEARCH_ATTEMPTS = 3
+# depth of the road chain followed by get_road_ids, as in core.script
+MAX_CHAIN_DEPTH = 5
+
+
+def select_parent_road(candidates):
+    """
+    Args:
+        candidates (list): (distance, road_category, road_id) of the roads around
+                           the start point of a road, in database order.
+    Returns:
+        The road_id of the road the road branches off, preferring major over minor
+        over subsidiary roads, like ``core.script.getIntersectedRoad``.
+    """
+    d = PARENT_SEARCH_RADIUS
+    connected_road_id = None
+    main_road = False
+    minor_road = False
+    for dist, road_type, road_id in candidates:
+        if road_type == "major":
+            if main_road == False:
+                main_road = True
+                d = dist
+                connected_road_id = road_id
+            elif dist < d:
+                d = dist
+                connected_road_id = road_id
+        if road_type == "minor":
+            if main_road == False and minor_road == False:
+                d = dist
+                connected_road_id = road_id
+                minor_road = True
+            elif dist < d:
+                d = dist
+                connected_road_id = road_id
+        if road_type == "subsidiary":
+            if main_road == False and minor_road == False:
+                d = dist
+                connected_road_id = road_id
+            elif dist < d:
+                d = dist
+                connected_road_id = road_id
+    return connected_road_id
+
+
+class RoadNetwork:
+    """
+    Roads are the nodes of the graph and every subsidiary road has an edge to its
+    parent, holding the rounded distance of its start point along the parent and
+    the side of the parent it lies on.
+    """
+
+    def __init__(self, roads):
+        self.roads = {
+            road.id: road
+            for road in sorted(roads, key=lambda road: road.id)
+            if road.feature_id and road.feature.geom
+        }
+        self.by_road_id = {}
+        for road in self.roads.values():
+            self.by_road_id.setdefault(road.road_id, road)
+
+        pks = list(self.roads)
+        gdf = gpd.GeoDataFrame(
+            {"pk": pks},
+            geometry=[wkb.loads(bytes(self.roads[pk].feature.geom.wkb)) for pk in pks],
+            crs="epsg:4326",
+        ).to_crs(epsg=32645)
+        self.geometries = dict(zip(pks, gdf.geometry))
+        self.sindex = gdf.sindex
+        self.pks = pks
+
+        self.edges = {}
+        for pk, road in self.roads.items():
+            if road.road_category not in ("major", "minor"):
+                self.edges[pk] = self._connect(road)
+
+        self._road_ids = {}
+        self._prefixes = {}
+
+    @classmethod
+    def load(cls, queryset=None):
+        """
+        Builds the network of ``queryset``, every road by default.
+        """
+        if queryset is None:
+            queryset = Road.objects.all()
+        return cls(queryset.select_related("feature"))
+
+    def _connect(self, road):
+        geometry = self.geometries[road.id]
+        start_point = Point(line_endpoints(geometry)[0])
+        candidates = []
+        for attempt in range(PARENT_SEARCH_ATTEMPTS):
+            buffer = start_point.buffer(PARENT_SEARCH_RADIUS * (attempt + 1))
+            positions = sorted(self.sindex.query(buffer, predicate="intersects"))
+            candidates = [
+                self.roads[self.pks[position]]
+                for position in positions
+                if self.roads[self.pks[position]].road_id is not None
+                and self.roads[self.pks[position]].road_id != road.road_id
+            ]
+            if candidates:
+                break
+
+        parent_road_id = select_parent_road(
+            [
+                (
+                    start_point.distance(self.geometries[candidate.id]),
+                    candidate.road_category,
+                    candidate.road_id,
+                )
+                for candidate in candidates
+            ]
+        )
+        parent = self.by_road_id.get(parent_road_id)
+        if parent is None:
+            return None
+
+        parent_geometry = self.geometries[parent.id]
+        dist = parent_geometry.project(start_point)
+        direction = get_direction(geometry.centroid, parent_geometry)
+        dist = LeftDirRound(dist) if direction == "Left" else RightDirRound(dist)
+        return parent.id, dist, direction
+
+    def road(self, road_id):
+        """
+        Returns the road with ``road_id``, or None when it is not in the network.
+        """
+        return self.by_road_id.get(road_id)
+
+    def projected_geometry(self, road):
+        """
+        Returns the shapely geometry of ``road`` in EPSG:32645.
+        """
+        return self.geometries[road.id]
+
+    def get_parent(self, road):
+        edge = self.edges.get(road.id)
+        return self.roads[edge[0]] if edge else None
+
+    def get_road_ids(self, road, depth=MAX_CHAIN_DEPTH):
+        """
+        Returns the road ids of the chain of parents of ``road``, as
+        ``core.script.get_road_ids``: empty for major and minor roads, and ending
+        in "/none" when the chain breaks or is deeper than ``depth``.
+        """
+        key = (road.id, depth)
+        if key not in self._road_ids:
+            if depth <= 1:
+                road_ids = "/none"
+            elif road.road_category in ("major", "minor"):
+                road_ids = ""
+            else:
+                parent = self.get_parent(road)
+                if parent is None:
+                    road_ids = "/none"
+                else:
+                    road_ids = (
+                        self.get_road_ids(parent, depth - 1) + "/" + str(parent.road_id)
+                    )
+            self._road_ids[key] = road_ids
+        return self._road_ids[key]
+
+    def get_distance(self, road, depth=MAX_CHAIN_DEPTH):
+        """
+        Returns the metric prefix of the house numbers of ``road``, the distances of
+        every road of its chain along its parent, as ``core.script.get_distance``.
+        """
+        key = (road.id, depth)
+        if key not in self._prefixes:
+            if road.road_category in ("major", "minor"):
+                prefix = ""
+            elif depth <= 1 or road.id not in self.edges or not self.edges[road.id]:
+                prefix = "/none"
+            else:
+                parent_pk, dist, direction = self.edges[road.id]
+                prefix = (
+                    self.get_distance(self.roads[parent_pk], depth - 1)
+                    + "/"
+                    + str(dist)
+                )
+            self._prefixes[key] = prefix
+        return self._prefixes[key]
+
+    def components(self):
+        """
+        Returns the road_ids of every connected part of the network, a major or
+        minor road with the subsidiary roads branching off it, directly or not.
+        Houses of different components never share a road chain.
+        """
+        parents = {road.road_id: road.road_id for road in self.roads.values()}
+
+        def find(road_id):
+            while parents[road_id] != road_id:
+                parents[road_id] = parents[parents[road_id]]
+                road_id = parents[road_id]
+            return road_id
+
+        for pk, edge in self.edges.items():
+            if edge:
+                parents[find(self.roads[pk].road_id)] = find(
+                    self.roads[edge[0]].road_id
+                )
+
+        components = {}
+        for road_id in parents:
+            components.setdefault(find(road_id), []).append(road_id)
+        return list(components.values())
+
+    def roads_starting_near(self, geometry):
+        """
+        Returns the road_ids of the roads whose start point is close enough to
+        ``geometry``, a shapely geometry in EPSG:32645, for it to be their parent.
+        """
+        radius = PARENT_SEARCH_RADIUS * PARENT_SEARCH_ATTEMPTS
+        road_ids = set()
+        for position in self.sindex.query(geometry.buffer(radius)):
+            pk = self.pks[position]
+            start_point = Point(line_endpoints(self.geometries[pk])[0])
+            if start_point.distance(geometry) <= radius:
+                road_ids.add(self.roads[pk].road_id)
+        return road_ids
+
+    def descendants(self, road_ids):
+        """
+        Returns ``road_ids`` with the road_ids of every road branching off them,
+        directly or not, whose house numbers depend on them.
+        """
+        children = {}
+        for pk, edge in self.edges.items():
+            if edge:
+                children.setdefault(self.roads[edge[0]].road_id, []).append(
+                    self.roads[pk].road_id
+                )
+
+        found = set()
+        pending = list(road_ids)
+        while pending:
+            road_id = pending.pop()
+            if road_id in found:
+                continue
+            found.add(road_id)
+            pending.extend(children.get(road_id, []))
+        return found
+
+    def get_metric_address(self, road_ids):
+        """
+        Returns the name of the first road of ``road_ids``, the road the chain
+        starts from.
+        """
+        if not road_ids:
+            return None
+        road = self.by_road_id.get(_as_road_id(road_ids.split("/")[0]))
+        return road.road_name_en if road else None
+
+
+def _as_road_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -13,6 +13,7 @@ from sqlalchemy import create_engine
 
 from core.models import Building, Road
 from api.utils.file_handlers import calculate_and_save_geometry
+from core.utils.house_number_index import HouseNumberIndex
 
 
 db_connection_url = f"postgresql://{os.environ.get('POSTGRES_USER', '')}:{os.environ.get('POSTGRES_PASSWORD', '')}@{os.environ.get('POSTGRES_HOST', 'localhost')}:{os.environ.get('POSTGRES_PORT', '5432')}/{os.environ.get('POSTGRES_DB', 'postgres')}"
@@ -410,7 +411,16 @@ def get_metric_address(road_ids, metric_road_qs):
     return road_address
 
 
-def main_house_address_generator(house, road_inst, metric_road_qs):
+def main_house_address_generator(
+    house, road_inst, metric_road_qs, network=None, index=None
+):
+    """
+    Numbers a main house on ``road_inst``. The chain of roads is read from
+    ``network``, a ``core.road_network.RoadNetwork``, when one is given instead of
+    being resolved with buffer queries. Numbers already taken on the road are
+    looked up in ``index``, a ``HouseNumberIndex`` of the run, or in one seeded
+    from the buildings of the road.
+    """
     # polygon_wkt = house.feature.geom
     # polygon = GEOSGeometry(polygon_wkt)
 
@@ -437,28 +447,31 @@ def main_house_address_generator(house, road_inst, metric_road_qs):
         x2, y2 = proj.transform(gate_lat, gate_lon)
         gate_location = Point(x2, y2)
 
-        instance = road_inst.feature.geom
-        converted_geometry = instance.transform(32645, clone=True)
+        if network is not None:
+            road_geom_proj = network.projected_geometry(road_inst)
+        else:
+            instance = road_inst.feature.geom
+            converted_geometry = instance.transform(32645, clone=True)
 
-        if converted_geometry.geom_type == "MultiLineString":
-            road_geom_proj = shapely.geometry.MultiLineString(
-                shapely.wkt.loads(converted_geometry.wkt)
-            )
+            if converted_geometry.geom_type == "MultiLineString":
+                road_geom_proj = shapely.geometry.MultiLineString(
+                    shapely.wkt.loads(converted_geometry.wkt)
+                )
 
-        elif converted_geometry.geom_type == "LineString":
-            road_geom_proj = shapely.geometry.LineString(
-                shapely.wkt.loads(converted_geometry.wkt)
-            )
+            elif converted_geometry.geom_type == "LineString":
+                road_geom_proj = shapely.geometry.LineString(
+                    shapely.wkt.loads(converted_geometry.wkt)
+                )
 
         """house to nearest road distance"""
         house_road_dist = road_geom_proj.project(gate_location)
 
         """get road ids"""
-        road_ids = (
-            str(get_road_ids(road_inst, metric_road_qs, max_interation=5))
-            + "/"
-            + str(road_inst.road_id)
-        )
+        if network is not None:
+            parent_road_ids = network.get_road_ids(road_inst)
+        else:
+            parent_road_ids = get_road_ids(road_inst, metric_road_qs, max_interation=5)
+        road_ids = str(parent_road_ids) + "/" + str(road_inst.road_id)
         # removing initial slash
         road_ids = road_ids[1:] if road_ids else None
         road_ids_list = road_ids.split("/")
@@ -468,9 +481,6 @@ def main_house_address_generator(house, road_inst, metric_road_qs):
         """get direction of road with respect to road"""
         direction = get_direction(gate_location, road_geom_proj)
 
-        relevant_houses = Building.objects.filter(association_type="main")
-        existing_house_nums = set(relevant_houses.values_list("house_no", flat=True))
-
         # Determine the increment based on direction
         increment = 1 if direction == "Left" else 2
 
@@ -483,21 +493,28 @@ def main_house_address_generator(house, road_inst, metric_road_qs):
                 else RightDirRound(house_road_dist)
             )
 
-        # Ensure unique house_num
-        while house_num in existing_house_nums:
-            house_num += increment
-
         """get final house number"""
-        house_num_final = (
-            str(get_distance(road_inst, metric_road_qs)) + "/" + str(house_num)
+        if network is not None:
+            prefix = network.get_distance(road_inst)
+            metric_address = network.get_metric_address(road_ids)
+        else:
+            prefix = get_distance(road_inst, metric_road_qs)
+            metric_address = get_metric_address(road_ids, metric_road_qs)
+
+        # Ensure unique house_num on the road
+        if index is None:
+            index = HouseNumberIndex.from_buildings(
+                Building.objects.filter(road_id=road_inst.road_id)
+            )
+        house_num = index.assign(
+            house.id, road_inst.road_id, str(prefix)[1:], house_num, increment
         )
+        house_num_final = str(prefix) + "/" + str(house_num)
         if road_inst.road_category == "subsidiary":
-            associate_road_name = get_metric_address(road_ids, metric_road_qs)
-            house.associate_road_name = associate_road_name
+            house.associate_road_name = metric_address
         else:
             house.associate_road_name = road_inst.road_name_en
         house_num_final = house_num_final[1:] if house_num_final else None
-        metric_address = get_metric_address(road_ids, metric_road_qs)
         house.road_ids = road_ids
         house.metric_address = metric_address
         house.house_no = house_num_final
@@ -513,7 +530,13 @@ def main_house_address_generator(house, road_inst, metric_road_qs):
         )
 
 
-def house_numbering(data_id):
+def house_numbering(data_id, network=None, index=None):
+    """
+    Numbers the house ``data_id``, or every house when it is None. Runs numbering
+    many houses should pass a ``core.road_network.RoadNetwork`` and a
+    ``HouseNumberIndex`` built once for the run. The network is then also used
+    to find the road of every house.
+    """
     try:
         """metric road layer information"""
         metric_road_qs = Road.objects.all()
@@ -525,14 +548,21 @@ def house_numbering(data_id):
             try:
                 if house_association_type == "main":
                     house_road_id = house.road_id
-                    if house_road_id:
+                    if house_road_id and network is not None:
+                        road_inst = network.road(house_road_id)
+                        if road_inst:
+                            house.associate_road_name = road_inst.road_name_en
+                            main_house_address_generator(
+                                house, road_inst, metric_road_qs, network, index
+                            )
+                    elif house_road_id:
                         for road in metric_road_qs:
                             road_id = road.road_id
                             if house_road_id == road_id:
                                 road_inst = Road.objects.get(road_id=house_road_id)
                                 house.associate_road_name = road_inst.road_name_en
                                 main_house_address_generator(
-                                    house, road_inst, metric_road_qs
+                                    house, road_inst, metric_road_qs, index=index
                                 )
                                 break
 
@@ -562,15 +592,23 @@ def house_numbering(data_id):
                                 f"data_id:{house.id} building_id:{house.building_id}  error:latitude or longitude or road_id is missing"
                             )
 
-                        for road in metric_road_qs:
-                            road_id = road.road_id
-                            if house_road_id == road_id:
+                        if network is not None:
+                            road_inst = network.road(house_road_id)
+                            if road_inst:
                                 road_found = True
-                                road_inst = Road.objects.get(road_id=house_road_id)
                                 main_house_address_generator(
-                                    house, road_inst, metric_road_qs
+                                    house, road_inst, metric_road_qs, network, index
                                 )
-                                break
+                        else:
+                            for road in metric_road_qs:
+                                road_id = road.road_id
+                                if house_road_id == road_id:
+                                    road_found = True
+                                    road_inst = Road.objects.get(road_id=house_road_id)
+                                    main_house_address_generator(
+                                        house, road_inst, metric_road_qs, index=index
+                                    )
+                                    break
                         if road_found == False:
                             print(
                                 f"Road not found for building id {house.building_id} or data_id {house.id}"
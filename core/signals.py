@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.models import PalikaGeometry, PalikaWardGeometry
+from core.utils.tile_cache import invalidate_layer
+
+
+@receiver([post_save, post_delete], sender=PalikaGeometry)
+@receiver([post_save, post_delete], sender=PalikaWardGeometry)
+def bump_boundary_layer_version(sender, **kwargs):
+    # boundaries are small layers, any edit invalidates their tiles and GeoJSON
+    transaction.on_commit(lambda: invalidate_layer([sender]))
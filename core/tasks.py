@@ -1,11 +1,12 @@
 # tasks.py
+import logging
 import os
-import shutil
-import glob
+import time
 from rest_framework import status
 from rest_framework.response import Response
 from django.core.exceptions import ObjectDoesNotExist
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
 from .models import (
     Road,
     RoadUpload,
@@ -18,6 +19,8 @@ from .models import (
     RasterLayer,
     RasterLayerMetadata,
     VectorLayerStyle,
+    PalikaGeometry,
+    PalikaWardGeometry,
 )
 from api.utils.file_handlers import (
     road_handle_shapefile,
@@ -27,17 +30,55 @@ from api.utils.file_handlers import (
     building_handle_geojson,
     building_handle_shapefile,
     handle_vector_layer,
+    IngestionReport,
 )
 import zipfile
-from django.conf import settings
 from core.raster.raster_tiler import generate_raster_tiles
 from core.raster.generate_tiles import metadata_generator, sld2colormap
 from api.serializers.core_serializers import RoadPostSerializer, BuildingPostSerializer
 from core.script import house_numbering
+from core.road_network import RoadNetwork
+from core.batch_numbering import (
+    merge_reports,
+    number_associated_buildings,
+    number_buildings,
+    number_ward,
+    partition_components,
+    renumber_affected,
+)
+from core.utils.house_number_index import HouseNumberIndex
+from core.utils.tile_archive import export_tile_archive
+
+TILE_EXPORT_LAYERS = {"building": BuildingGeometry, "road": RoadGeometry}
+
+logger = logging.getLogger(__name__)
+
+
+def zipped_shapefile(file):
+    """
+    Returns the first shapefile inside the ``file`` zip archive as a path that is
+    read in place, without extracting the archive, or None when there is none.
+    """
+    with zipfile.ZipFile(file, "r") as zip_ref:
+        for name in zip_ref.namelist():
+            if name.lower().endswith(".shp"):
+                return f"zip://{file}!{name}"
+    return None
+
+
+def task_progress(task):
+    """
+    Returns a callback publishing an ingestion report as the PROGRESS state of
+    ``task``, or None when the task is called directly instead of by a worker.
+    """
+    if not task.request.id:
+        return None
+    return lambda report: task.update_state(state="PROGRESS", meta=report)
 
-dir = f"{settings.MEDIA_ROOT}/Files/"
-if not os.path.exists(dir):
-    os.makedirs(dir)
+
+def save_ingestion_report(layer, report):
+    layer.ingestion_report = report.as_dict()
+    layer.save(update_fields=["ingestion_report"])
 
 
 def vector_style(geometry_type):
@@ -64,12 +105,15 @@ def update_layer_fields(layer, geometry_type, bound_dict, layer_type):
     layer.save()
 
 
-@shared_task
+@shared_task(bind=True)
 def process_road_file(
+    self,
     file_id,
     user_id,
+    workers=None,
 ):
     layer = RoadUpload.objects.get(id=file_id)
+    report = IngestionReport(task_progress(self))
     file = str(layer.file_upload.path)
     split_tup = os.path.splitext(file)
     file_extension = split_tup[1]
@@ -77,18 +121,17 @@ def process_road_file(
     uploaded_file = layer.file_upload
     try:
         if file_extension.lower() == ".zip":
-            with zipfile.ZipFile(file, "r") as zip_ref:
-                zip_ref.extractall(dir)
-            shape_files = glob.glob(f"{dir}/**/*.shp", recursive=True)
-            if shape_files:
+            shapefile = zipped_shapefile(file)
+            if shapefile:
                 try:
-                    shapefile = file
                     try:
                         geometry_type, bound_dict = road_handle_shapefile(
                             shapefile,
                             Road,
                             RoadGeometry,
                             user_id,
+                            workers=workers,
+                            report=report,
                         )
                         return update_layer_fields(
                             layer, geometry_type, bound_dict, "Shapefile"
@@ -106,6 +149,8 @@ def process_road_file(
                     Road,
                     RoadGeometry,
                     user_id,
+                    workers=workers,
+                    report=report,
                 )
                 return update_layer_fields(layer, geometry_type, bound_dict, "CSV")
             except Exception as e:
@@ -118,6 +163,8 @@ def process_road_file(
                     Road,
                     RoadGeometry,
                     user_id,
+                    workers=workers,
+                    report=report,
                 )
                 return update_layer_fields(layer, geometry_type, bound_dict, "Geojson")
             except Exception as e:
@@ -127,9 +174,6 @@ def process_road_file(
         serializer_post.data["bbox"] = layer.bbox
         serializer_post.data["geometry_type"] = layer.geometry_type
 
-        """clearing the directory"""
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         return Response(
             data={
                 "message": "RoadLayer created successfully",
@@ -138,18 +182,19 @@ def process_road_file(
             status=status.HTTP_201_CREATED,
         )
     except ObjectDoesNotExist:
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         Road.objects.get(id=road_file_id).delete()
         return Response(
             data={"message": "RoadLayer does not exist."},
             status=status.HTTP_404_NOT_FOUND,
         )
+    finally:
+        save_ingestion_report(layer, report)
 
 
-@shared_task
-def process_building_file(file_id, user_id):
+@shared_task(bind=True)
+def process_building_file(self, file_id, user_id, workers=None):
     layer = BuildingUpload.objects.get(id=file_id)
+    report = IngestionReport(task_progress(self))
     file = str(layer.file_upload.path)
     split_tup = os.path.splitext(file)
     file_extension = split_tup[1]
@@ -157,24 +202,25 @@ def process_building_file(file_id, user_id):
     uploaded_file = layer.file_upload
     try:
         if file_extension.lower() == ".zip":
-            with zipfile.ZipFile(file, "r") as zip_ref:
-                zip_ref.extractall(dir)
-            shape_files = glob.glob(f"{dir}/**/*.shp", recursive=True)
-            if shape_files:
+            shapefile = zipped_shapefile(file)
+            if shapefile:
                 try:
-                    shapefile = file
                     try:
                         geometry_type = None
                         bound_dict = None
                         error_message = None
 
-                        geometry_type,
-                        bound_dict,
-                        error_message = building_handle_shapefile(
+                        (
+                            geometry_type,
+                            bound_dict,
+                            error_message,
+                        ) = building_handle_shapefile(
                             shapefile,
                             Building,
                             BuildingGeometry,
                             user_id,
+                            workers=workers,
+                            report=report,
                         )
                         if error_message:
                             return None, "success", error_message, 200
@@ -193,24 +239,32 @@ def process_building_file(file_id, user_id):
                     )
         elif file_extension.lower() == ".csv":
             try:
-                geometry_type, bound_dict = building_handle_csv(
+                geometry_type, bound_dict, error_message = building_handle_csv(
                     uploaded_file,
                     Building,
                     BuildingGeometry,
                     user_id,
+                    workers=workers,
+                    report=report,
                 )
+                if error_message:
+                    return None, "success", error_message, 200
                 return update_layer_fields(layer, geometry_type, bound_dict, "CSV")
             except Exception as e:
                 return str(e)
 
         elif file_extension.lower() == ".geojson":
             try:
-                geometry_type, bound_dict = building_handle_geojson(
+                geometry_type, bound_dict, error_message = building_handle_geojson(
                     uploaded_file,
                     Building,
                     BuildingGeometry,
                     user_id,
+                    workers=workers,
+                    report=report,
                 )
+                if error_message:
+                    return None, "success", error_message, 200
                 return update_layer_fields(layer, geometry_type, bound_dict, "Geojson")
             except Exception as e:
                 return str(e)
@@ -219,9 +273,6 @@ def process_building_file(file_id, user_id):
         serializer_post.data["bbox"] = layer.bbox
         serializer_post.data["geometry_type"] = layer.geometry_type
 
-        """clearing the directory"""
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         return Response(
             data={
                 "message": "BuildingLayer created successfully",
@@ -230,13 +281,13 @@ def process_building_file(file_id, user_id):
             status=status.HTTP_201_CREATED,
         )
     except ObjectDoesNotExist:
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         Building.objects.get(id=building_id).delete()
         return Response(
             data={"message": "BuildingLayer does not exist."},
             status=status.HTTP_404_NOT_FOUND,
         )
+    finally:
+        save_ingestion_report(layer, report)
 
 
 @shared_task
@@ -247,12 +298,9 @@ def process_vector_layer(vector_layer_id, user_id):
     file_extension = split_tup[1]
     try:
         if file_extension.lower() == ".zip":
-            with zipfile.ZipFile(file, "r") as zip_ref:
-                zip_ref.extractall(dir)
-            shape_files = glob.glob(f"{dir}/**/*.shp", recursive=True)
-            if shape_files:
+            shapefile = zipped_shapefile(file)
+            if shapefile:
                 try:
-                    shapefile = file
                     try:
                         geometry_type, bound_dict = handle_vector_layer(
                             shapefile,
@@ -276,9 +324,6 @@ def process_vector_layer(vector_layer_id, user_id):
         serializer_post.data["bbox"] = layer.bbox
         serializer_post.data["geometry_type"] = layer.geometry_type
 
-        """clearing the directory"""
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         return Response(
             data={
                 "message": "VectorLayer created successfully",
@@ -287,8 +332,6 @@ def process_vector_layer(vector_layer_id, user_id):
             status=status.HTTP_201_CREATED,
         )
     except ObjectDoesNotExist:
-        if os.path.isdir(dir):
-            shutil.rmtree(dir)
         VectorLayer.objects.get(id=vector_layer_id).delete()
         return Response(
             data={"message": "VectorLayer does not exist."},
@@ -335,17 +378,36 @@ def get_raster_tile(raster_id, file, output_folder, zoom):
 
 
 @shared_task(bind=True)
-def generate_house_numbers_task(self, data_id=None):
+def generate_house_numbers_task(self, data_id=None, fan_out=None):
     try:
+        if data_id is None and fan_out:
+            return dispatch_house_numbering(fan_out)
         if data_id is None:
-            all_data_ids = Building.objects.values_list("id", flat=True)
-            for data_id in all_data_ids:
-                house_numbering(data_id)
+            # the road chains are resolved once for the whole run and the main
+            # buildings numbered a ward at a time
+            network = RoadNetwork.load()
+            index = HouseNumberIndex.from_buildings(Building.objects.all())
+            ward_numbers = list(
+                Building.objects.filter(association_type="main")
+                .order_by("ward_no")
+                .values_list("ward_no", flat=True)
+                .distinct()
+            )
+            wards = {}
+            for position, ward_no in enumerate(ward_numbers):
+                wards[str(ward_no)] = number_ward(ward_no, network, index)
                 self.update_state(
                     state="PROGRESS",
-                    meta={"current": data_id, "total": len(all_data_ids)},
+                    meta={
+                        "current": position + 1,
+                        "total": len(ward_numbers),
+                        "ward_no": ward_no,
+                    },
                 )
 
+            # associate and dissociate buildings take the number of their main one
+            number_associated_buildings(network, index)
+
             count_with_house_no = Building.objects.filter(
                 house_no__isnull=False
             ).count()
@@ -353,6 +415,7 @@ def generate_house_numbers_task(self, data_id=None):
             response_dt = {
                 "stat": "success",
                 "count": count_with_house_no,
+                "wards": wards,
             }
 
             return {
@@ -382,3 +445,163 @@ def generate_house_numbers_task(self, data_id=None):
             "stat": "error",
             "message": str(e),
         }
+
+
+def dispatch_house_numbering(fan_out):
+    """
+    Numbers every house with one sub-task per group of connected road components,
+    fan_out="component", in a chord whose callback numbers the associate and
+    dissociate buildings once every main building is numbered. Components never
+    share a road, so the sub-tasks cannot give two houses of a road the same
+    number. Wards are not partitions as their roads cross ward borders.
+    """
+    if fan_out != "component":
+        raise ValueError(f"Unknown fan_out {fan_out}, use component")
+    partitions = partition_components(
+        RoadNetwork.load(), settings.HOUSE_NUMBERING_PARTITIONS
+    )
+
+    result = chord(number_house_partition_task.s(road_ids) for road_ids in partitions)(
+        finalize_house_numbers_task.s(time.time())
+    )
+    return {
+        "message": f"House numbering dispatched in {len(partitions)} partitions",
+        "data": {
+            "stat": "dispatched",
+            "task_id": result.id,
+            "partitions": len(partitions),
+        },
+        "code": 202,
+    }
+
+
+@shared_task
+def number_house_partition_task(road_ids):
+    """
+    Numbers the main buildings of the roads of a group of components. A failure
+    is returned as an empty report with the error, so that the chord callback
+    still runs and reports it.
+    """
+    start = time.time()
+    try:
+        network = RoadNetwork.load()
+        return number_buildings(Building.objects.filter(road_id__in=road_ids), network)
+    except Exception as e:
+        logger.exception("error numbering houses of roads %s", road_ids)
+        return {
+            "stat": "error",
+            "message": str(e),
+            "numbered": 0,
+            "skipped": 0,
+            "skipped_reasons": {},
+            "elapsed_seconds": round(time.time() - start, 3),
+        }
+
+
+@shared_task
+def finalize_house_numbers_task(reports, started_at):
+    """
+    Numbers the associate and dissociate buildings and combines the reports of
+    the partitions.
+    """
+    network = RoadNetwork.load()
+    index = HouseNumberIndex.from_buildings(Building.objects.all())
+    associated_start = time.time()
+    associated = number_associated_buildings(network, index)
+
+    response_dt = merge_reports(reports)
+    response_dt.update(
+        {
+            "stat": "error" if response_dt["errors"] else "success",
+            "count": Building.objects.filter(house_no__isnull=False).count(),
+            "associated": associated,
+            "associated_seconds": round(time.time() - associated_start, 3),
+            "elapsed_seconds": round(time.time() - started_at, 3),
+        }
+    )
+    if response_dt["errors"]:
+        message = f"House numbering failed in {len(response_dt['errors'])} partitions"
+    else:
+        message = "House numbers generated for all data IDs"
+    return {
+        "message": message,
+        "data": response_dt,
+        "code": 200,
+    }
+
+
+@shared_task
+def renumber_buildings_task(
+    road_ids=None, geometries=None, building_ids=None, feature_ids=None
+):
+    """
+    Renumbers the houses affected by the road and gate edits of a transaction.
+    """
+    try:
+        road_ids = list(road_ids or [])
+        if feature_ids:
+            road_ids += Road.objects.filter(feature_id__in=feature_ids).values_list(
+                "road_id", flat=True
+            )
+        response_dt = renumber_affected(road_ids, geometries or [], building_ids or [])
+        response_dt["stat"] = "success"
+        return {
+            "message": "House numbers regenerated for the affected buildings",
+            "data": response_dt,
+            "code": 200,
+        }
+    except Exception as e:
+        return {
+            "stat": "error",
+            "message": str(e),
+        }
+
+
+def get_export_bounds(ward_nos=None, palika_ids=None):
+    """
+    Returns the bbox of the requested wards, or of the palikas when no ward is given.
+    """
+    if ward_nos:
+        queryset = PalikaWardGeometry.objects.filter(ward_no__in=ward_nos)
+    else:
+        queryset = PalikaGeometry.objects.all()
+        if palika_ids:
+            queryset = queryset.filter(id__in=palika_ids)
+    return [bbox for bbox in queryset.values_list("bbox", flat=True) if bbox]
+
+
+@shared_task
+def export_vector_tiles_task(
+    layers,
+    min_zoom,
+    max_zoom,
+    ward_nos=None,
+    palika_ids=None,
+    archive_format="mbtiles",
+):
+    try:
+        bounds = get_export_bounds(ward_nos=ward_nos, palika_ids=palika_ids)
+        if not bounds:
+            return {
+                "stat": "error",
+                "message": "No palika or ward extent found to export",
+            }
+        response_dt = {}
+        for layer in layers:
+            response_dt[layer] = export_tile_archive(
+                TILE_EXPORT_LAYERS[layer],
+                bounds,
+                min_zoom,
+                max_zoom,
+                archive_format=archive_format,
+            )
+        return {
+            "message": "Vector tiles exported",
+            "data": response_dt,
+            "code": 200,
+        }
+    except Exception as e:
+        return {
+            "stat": "error",
+            "message": str(e),
+        }
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.core.exceptions import FieldError
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import Polygon
@@ -5,9 +6,26 @@ from rest_framework.serializers import ValidationError
 from rest_framework.renderers import BaseRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from math import atan, degrees, pi
+from math import asinh, atan, degrees, floor, pi, radians, tan
 from math import pow as math_pow
 from math import sinh
+from core.utils.tile_archive import get_archived_tile
+from core.utils.http_cache import (
+    add_validators,
+    content_etag,
+    generations_last_modified,
+    is_public_request,
+    key_etag,
+    not_modified,
+)
+from core.utils.tile_cache import (
+    get_cached_tile,
+    set_cached_tile,
+    tile_cache_key,
+    tile_generations,
+)
+
+TILE_CLUSTER_MAX_ZOOM = getattr(settings, "TILE_CLUSTER_MAX_ZOOM", 13)
 
 
 def split_on_last_occurrence(sentence, word):
@@ -27,14 +45,54 @@ class MVTManager(models.Manager):
         geom_col (str): Column name with the geometry. The default is "geom".
         source_name (str): Connection source to use.  If not provided the app's default
                            connection is used.
+        cache (bool): Whether tiles of the model are stored in the server side tile
+                      cache.  Only enable it for models that invalidate their tiles on
+                      save and delete.  The default is False.
+        profiles (list): Optional tile profiles, dicts applying to the zoom levels up to
+                         and including their "max_zoom".  "properties" lists the
+                         feature attributes kept in the tile, "simplify" and "snap"
+                         are ST_Simplify and ST_SnapToGrid tolerances in pixels of a
+                         256px tile.  Zoom levels above every profile get all columns
+                         at full resolution.
+        clusters (dict): Optional clustering of the features into grid cells up to
+                         "max_zoom" (TILE_CLUSTER_MAX_ZOOM by default).  Each cell is a
+                         point with the number of features as "count".  "cell_size"
+                         is in pixels of a 256px tile, "from_statement" and
+                         "where_statement" can join and filter related tables and
+                         "aggregates" lists extra aggregate SQL columns of a cell.
+        layer_name (str): Name of the layer inside the vector tile.  The default is
+                          "default".
     """
 
-    def __init__(self, *args, geom_col="geom", source_name=None, **kwargs):
+    def __init__(
+        self,
+        *args,
+        geom_col="geom",
+        source_name=None,
+        cache=False,
+        profiles=None,
+        clusters=None,
+        layer_name="default",
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.geom_col = geom_col
         self.source_name = source_name
-
-    def intersect(self, bbox="", limit=-1, offset=0, filters={}, queryset=None):
+        self.cache = cache
+        self.profiles = sorted(profiles or [], key=lambda profile: profile["max_zoom"])
+        self.clusters = clusters
+        self.layer_name = layer_name
+
+    def intersect(
+        self,
+        bbox="",
+        limit=-1,
+        offset=0,
+        filters={},
+        queryset=None,
+        tile=None,
+        cluster=None,
+    ):
         """
         Args:
             bbox (str): A string representing a bounding box, e.g., '-90,29,-89,35'.
@@ -44,6 +102,10 @@ class MVTManager(models.Manager):
                           size.  The default is 0.
             filters (dict): The keys represent column names and the values represent column
                             values to filter on.
+            tile (tuple): Optional (z, x, y) position of the tile.  When given, the exact
+                          web mercator tile envelope is used instead of bbox.
+            cluster (bool): Whether to serve clusters instead of features.  The
+                            default is None, clustering up to the clusters max zoom.
         Returns:
             bytes:
             Bytes representing a Google Protobuf encoded Mapbox Vector Tile.  The
@@ -61,9 +123,11 @@ class MVTManager(models.Manager):
             https://docs.djangoproject.com/en/2.2/topics/db/sql/#performing-raw-queries
         """
         limit = "ALL" if limit == -1 else limit
-        query, parameters = self._build_query(filters=filters, queryset=queryset)
+        query, parameters = self._build_tile_query(
+            filters=filters, queryset=queryset, bbox=bbox, tile=tile, cluster=cluster
+        )
         with self._get_connection().cursor() as cursor:
-            cursor.execute(query, [str(bbox), str(bbox)] + parameters + [limit, offset])
+            cursor.execute(query, parameters + [limit, offset])
             mvt = cursor.fetchall()[-1][-1]  # should always return one tile on success
         return mvt
 
@@ -79,19 +143,198 @@ class MVTManager(models.Manager):
                     columns.append(column_name)
         return columns
 
-    def _build_query(self, filters={}, queryset=None):
+    def _get_geom_srid(self):
+        """
+        Returns the SRID declared on the geometry column, e.g. 4236 for FeatureCollection.
+        """
+        for field in self.model._meta.concrete_fields:
+            if field.column == self.geom_col:
+                return getattr(field, "srid", 4326)
+        return 4326
+
+    def _get_profile(self, z):
+        """
+        Returns the tile profile used at zoom level z, or None for full detail.
+        """
+        if z is None:
+            return None
+        for profile in self.profiles:
+            if z <= profile["max_zoom"]:
+                return profile
+        return None
+
+    def _create_geometry_expression(self, table, profile, z):
+        """
+        Args:
+            table (str): Name of the table holding the geometry column.
+            profile (dict): Tile profile of the zoom level, if any.
+            z (int): Zoom level of the tile.
+        Returns:
+            str:
+            SQL expression of the EPSG:3857 geometry passed to ST_AsMVTGeom,
+            simplified and snapped to the tolerances of the profile.
+        """
+        geometry = f"ST_Transform({table}.{self.geom_col}, 3857)"
+        if profile is None:
+            return geometry
+        # meters covered by one pixel of a 256px tile at this zoom
+        pixel_size = 2 * MERCATOR_MAX / num_tiles(z) / 256
+        if profile.get("simplify"):
+            geometry = (
+                f"ST_Simplify({geometry}, {float(profile['simplify']) * pixel_size})"
+            )
+        if profile.get("snap"):
+            geometry = (
+                f"ST_SnapToGrid({geometry}, {float(profile['snap']) * pixel_size})"
+            )
+        return geometry
+
+    def _use_clusters(self, tile, queryset=None, cluster=None):
+        if not self.clusters or tile is None or queryset is not None:
+            return False
+        if cluster is not None:
+            return cluster
+        return tile[0] <= self.clusters.get("max_zoom", TILE_CLUSTER_MAX_ZOOM)
+
+    def _build_tile_query(
+        self,
+        filters={},
+        queryset=None,
+        bbox="",
+        tile=None,
+        cluster=None,
+        layer_name=None,
+    ):
+        """
+        Returns the features or clusters query of a tile, see _build_query.
+        """
+        if self._use_clusters(tile, queryset, cluster):
+            return self._build_cluster_query(
+                filters=filters, tile=tile, layer_name=layer_name
+            )
+        return self._build_query(
+            filters=filters,
+            queryset=queryset,
+            bbox=bbox,
+            tile=tile,
+            layer_name=layer_name,
+        )
+
+    def _build_cluster_query(self, filters={}, tile=None, layer_name=None):
+        """
+        Args:
+            filters (dict): keys represent column names and values represent column
+                            values to filter on.
+            tile (tuple): (z, x, y) position of the tile.
+            layer_name (str): Name of the layer in the tile, the manager's by default.
+        Returns:
+            tuple:
+            A tuple of length two.  The first element is a parameterized SQL query
+            aggregating the features centroids into grid cells.  The second element
+            is the list of its parameters, without the trailing LIMIT and OFFSET.
+
+        Note:
+            The grid is aligned on web mercator, so a cell never spans two tiles as
+            long as the cell size divides the 256px tile size.
+        """
+        table = self.model._meta.db_table.replace('"', "")
+        layer_name = layer_name or self.layer_name
+        envelope, envelope_params = self._create_envelope(tile=tile)
+        (
+            parameterized_where_clause,
+            where_clause_parameters,
+        ) = self._create_where_clause_with_params(table, filters, envelope)
+        if self.clusters.get("where_statement"):
+            parameterized_where_clause += " AND " + self.clusters["where_statement"]
+        from_statement = self.clusters.get("from_statement", table)
+        aggregates = "".join(
+            f", {aggregate}" for aggregate in self.clusters.get("aggregates", [])
+        )
+        z = tile[0]
+        cell_size = (
+            float(self.clusters.get("cell_size", 32))
+            * 2
+            * MERCATOR_MAX
+            / num_tiles(z)
+            / 256
+        )
+        query = f"""
+        SELECT NULL AS id, ST_AsMVT(q, '{layer_name}', 4096, 'mvt_geom') AS mvt
+            FROM (SELECT count(*) AS count{aggregates},
+                ST_AsMVTGeom(ST_Centroid(ST_Collect(point.centroid)),
+                {envelope}, 4096, 0, false) AS mvt_geom
+            FROM {from_statement}
+            CROSS JOIN LATERAL (
+                SELECT ST_Transform(ST_Centroid({table}.{self.geom_col}), 3857)
+                AS centroid
+            ) AS point
+            WHERE {parameterized_where_clause}
+            GROUP BY floor(ST_X(point.centroid) / {cell_size}),
+                floor(ST_Y(point.centroid) / {cell_size})
+            LIMIT %s
+            OFFSET %s) AS q;
+        """
+        parameters = envelope_params * 3 + list(where_clause_parameters)
+        return (query.strip(), parameters)
+
+    def _create_envelope(self, bbox="", tile=None):
+        """
+        Args:
+            bbox (str): WKT of the tile bounds in EPSG:4326.
+            tile (tuple): Optional (z, x, y) position of the tile.
+        Returns:
+            tuple:
+            A tuple of length two.  The first element is a SQL expression of the tile
+            envelope in EPSG:3857.  The second element is the list of its parameters.
+
+        Note:
+            The envelope of a tile position is built the same way as PostGIS 3
+            ST_TileEnvelope does, with ST_MakeEnvelope so that PostGIS 2.5 keeps working.
+        """
+        if tile is not None:
+            return (
+                "ST_MakeEnvelope(%s, %s, %s, %s, 3857)",
+                list(mercator_tile_edges(*tile)),
+            )
+        return "ST_Transform(ST_SetSRID(ST_GeomFromText(%s), 4326), 3857)", [str(bbox)]
+
+    def _create_envelope_filter(self, table, envelope):
+        """
+        Builds the spatial filter of a tile query.  The envelope is transformed into
+        the SRID of the column, never the other way round, so that the GiST index on
+        the geometry column is used by the && prefilter and ST_Intersects.
+        """
+        srid = self._get_geom_srid()
+        if srid != 3857:
+            envelope = f"ST_Transform({envelope}, {srid})"
+        return (
+            f"{table}.{self.geom_col} && {envelope} "
+            f"AND ST_Intersects({table}.{self.geom_col}, {envelope})"
+        )
+
+    def _build_query(
+        self, filters={}, queryset=None, bbox="", tile=None, layer_name=None
+    ):
         """
         Args:
             filters (dict): keys represent column names and values represent column
                             values to filter on.
+            bbox (str): WKT of the tile bounds in EPSG:4326.
+            tile (tuple): Optional (z, x, y) position of the tile.  Its zoom level
+                          selects the tile profile.
+            layer_name (str): Name of the layer in the tile, the manager's by default.
         Returns:
             tuple:
             A tuple of length two.  The first element is a string representing a
             parameterized SQL query.  The second element is a list of parameters
-            used as inputs to the query's WHERE clause.
+            used as inputs to the query, without the trailing LIMIT and OFFSET.
         """
         # sql, params = queryset.sql_with_params()
         table = self.model._meta.db_table.replace('"', "")
+        layer_name = layer_name or self.layer_name
+        envelope, envelope_params = self._create_envelope(bbox=bbox, tile=tile)
+        z = tile[0] if tile is not None else None
+        profile = self._get_profile(z)
         if queryset is not None:
             select_statement = (
                 queryset["select_statement"] if "select_statement" in queryset else "*"
@@ -102,7 +345,9 @@ class MVTManager(models.Manager):
             where_clause = (
                 queryset["where_statement"] if "where_statement" in queryset else None
             )
-            parameterized_where_clause = self._create_where_clause(table, where_clause)
+            parameterized_where_clause = self._create_where_clause(
+                table, where_clause, envelope
+            )
             where_clause_parameters = (
                 queryset["where_params"] if "where_params" in queryset else []
             )
@@ -114,33 +359,38 @@ class MVTManager(models.Manager):
             (
                 parameterized_where_clause,
                 where_clause_parameters,
-            ) = self._create_where_clause_with_params(table, filters)
-        query = f"""
-        SELECT NULL AS id, ST_AsMVT(q, 'default', 4096, 'mvt_geom')
-            FROM ({select_statement} ,
-                ST_AsMVTGeom(ST_Transform({table}.{self.geom_col}, 3857),
-                ST_Transform(ST_SetSRID(ST_GeomFromText(%s), 4326), 3857), 4096, 0, false) AS mvt_geom
+            ) = self._create_where_clause_with_params(table, filters, envelope)
+        geometry = self._create_geometry_expression(table, profile, z)
+        features = f"""{select_statement} ,
+                ST_AsMVTGeom({geometry},
+                {envelope}, 4096, 0, false) AS mvt_geom
             FROM {from_statement}
             WHERE {parameterized_where_clause}
             LIMIT %s
-            OFFSET %s) AS q;
+            OFFSET %s"""
+        if profile is not None and profile.get("properties"):
+            # ST_AsMVT encodes every column of q, only pass it the profile properties
+            properties = ", ".join(f'"{name}"' for name in profile["properties"])
+            features = f"SELECT {properties}, mvt_geom FROM ({features}) AS features"
+        query = f"""
+        SELECT NULL AS id, ST_AsMVT(q, '{layer_name}', 4096, 'mvt_geom') AS mvt
+            FROM ({features}) AS q;
         """
-        return (query.strip(), where_clause_parameters)
+        # the envelope is used once by ST_AsMVTGeom and twice by the spatial filter
+        parameters = envelope_params * 3 + list(where_clause_parameters)
+        return (query.strip(), parameters)
 
-    def _create_where_clause(self, table, where_clause):
+    def _create_where_clause(self, table, where_clause, envelope):
         extra_wheres = " AND " + where_clause if where_clause is not None else ""
-        where_clause = (
-            f"ST_Intersects(ST_Transform({table}.{self.geom_col}, 4326), "
-            f"ST_SetSRID(ST_GeomFromText(%s), 4326)){extra_wheres}"
-        )
-        return where_clause
+        return self._create_envelope_filter(table, envelope) + extra_wheres
 
-    def _create_where_clause_with_params(self, table, filters):
+    def _create_where_clause_with_params(self, table, filters, envelope):
         """
         Args:
             table (str): A string representing the name of the table to query on.
             filters (dict): keys represent column names and values represent column
                             values to filter on.
+            envelope (str): SQL expression of the tile envelope in EPSG:3857.
         Returns:
             tuple:
             A tuple of length two.  The first element is a string representing a
@@ -158,10 +408,7 @@ class MVTManager(models.Manager):
         except FieldError as error:
             raise ValidationError(str(error)) from error
         extra_wheres = " AND " + sql.split("WHERE")[1].strip() if params else ""
-        where_clause = (
-            f"ST_Intersects(ST_Transform({table}.{self.geom_col}, 4326), "
-            f"ST_SetSRID(ST_GeomFromText(%s), 4326)){extra_wheres}"
-        )
+        where_clause = self._create_envelope_filter(table, envelope) + extra_wheres
         return where_clause, list(params)
 
     def _create_select_statement(self):
@@ -242,6 +489,99 @@ def mercator_to_lat(mercatorY):
     return degrees(atan(sinh(mercatorY)))
 
 
+MERCATOR_MAX = 20037508.342789244
+
+
+def mercator_tile_edges(z, x, y):
+    """
+    Returns the EPSG:3857 bounds of a tile, identical to PostGIS ST_TileEnvelope.
+    """
+    size = 2 * MERCATOR_MAX / num_tiles(z)
+    xmin = -MERCATOR_MAX + x * size
+    ymax = MERCATOR_MAX - y * size
+    return (xmin, ymax - size, xmin + size, ymax)  # w, s, e, n
+
+
+def lon_to_tile_x(lon, z):
+    n = num_tiles(z)
+    return min(max(int(floor((lon + 180) / 360 * n)), 0), int(n) - 1)
+
+
+def lat_to_tile_y(lat, z):
+    n = num_tiles(z)
+    lat = min(max(lat, -85.0511), 85.0511)
+    y = floor((1 - asinh(tan(radians(lat))) / pi) / 2 * n)
+    return min(max(int(y), 0), int(n) - 1)
+
+
+def tile_range(w, s, e, n, z):
+    """
+    Returns the (x, y) positions of all tiles at zoom z covering the given
+    EPSG:4326 bounds.
+    """
+    x1, x2 = lon_to_tile_x(w, z), lon_to_tile_x(e, z)
+    y1, y2 = lat_to_tile_y(n, z), lat_to_tile_y(s, z)
+    return [(x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1)]
+
+
+def parse_cluster_param(value):
+    """
+    Returns the ``cluster`` query param as a bool, or None when it is not given.
+    """
+    if value is None:
+        return None
+    return value.lower() not in ("false", "0")
+
+
+def composite_intersect(layers, z, x, y, cluster=None):
+    """
+    Args:
+        layers (dict): Layer names mapped to models with a ``vector_tiles`` MVTManager.
+        cluster (bool): Passed to the layers supporting clusters, see
+                        ``MVTManager.intersect``.
+    Returns:
+        bytes:
+        A Mapbox Vector Tile holding one named layer per model.  Vector tiles are a
+        list of layers, so the ST_AsMVT output of every layer is concatenated in a
+        single query.
+    """
+    selects, parameters = [], []
+    for index, (name, model) in enumerate(layers.items()):
+        query, layer_parameters = model.vector_tiles._build_tile_query(
+            tile=(z, x, y), cluster=cluster, layer_name=name
+        )
+        selects.append(
+            f"COALESCE((SELECT mvt FROM ({query.rstrip(';')}) AS layer_{index}), "
+            "''::bytea)"
+        )
+        parameters += layer_parameters + ["ALL", 0]
+    query = "SELECT NULL AS id, " + " || ".join(selects) + " AS mvt"
+    manager = next(iter(layers.values())).vector_tiles
+    with manager._get_connection().cursor() as cursor:
+        cursor.execute(query, parameters)
+        mvt = cursor.fetchall()[-1][-1]
+    return mvt
+
+
+def tile_response(
+    mvt, tile_cache, status=None, etag=None, last_modified=None, public=False
+):
+    """
+    Returns the vector tile response, with HTTP validators unless it is an error.
+    """
+    if status is None:
+        status = 200 if mvt else 204
+    response = Response(
+        bytes(mvt),
+        content_type="application/vnd.mapbox-vector-tile",
+        status=status,
+        headers={"tile-cache": tile_cache},
+    )
+    if status < 400:
+        add_validators(response, etag, last_modified, public=public)
+    return response
+
+
 class BaseMVTView(APIView):
     """
     Base view for serving a model as a Mapbox Vector Tile given X/Y/Z tile constraints.
@@ -258,6 +598,7 @@ class BaseMVTView(APIView):
         params = request.GET.dict()
         limit = params.pop("limit", None)
         offset = params.pop("offset", None)
+        cluster = parse_cluster_param(params.pop("cluster", None))
         try:
             if limit is not None and offset is not None:
                 try:
@@ -268,19 +609,121 @@ class BaseMVTView(APIView):
                     ) from value_error
         except ValidationError:
             limit, offset = None, None
+        public = is_public_request(request, filtered=bool(params or queryset))
+
+        if (
+            queryset is None
+            and not params
+            and limit is None
+            and offset is None
+            and cluster is None
+        ):
+            mvt = get_archived_tile(model, z, x, y)
+            if mvt is not None:
+                etag = content_etag(mvt)
+                return not_modified(request, etag, public=public) or tile_response(
+                    mvt, "archive", etag=etag, public=public
+                )
+
+        cache_key = etag = last_modified = None
+        if model.vector_tiles.cache:
+            generations = tile_generations([model], z, x, y)
+            cache_key = tile_cache_key(
+                [model],
+                z,
+                x,
+                y,
+                params=dict(params, limit=limit, offset=offset, cluster=cluster),
+                queryset=queryset,
+                generations=generations,
+            )
+            etag = key_etag(cache_key)
+            last_modified = generations_last_modified(generations)
+            response = not_modified(request, etag, last_modified, public=public)
+            if response is not None:
+                return response
+            mvt = get_cached_tile(cache_key)
+            if mvt is not None:
+                return tile_response(
+                    mvt, "true", etag=etag, last_modified=last_modified, public=public
+                )
 
         bbox = Polygon.from_bbox(tile_edges(x=x, y=y, z=z))
         try:
             mvt = model.vector_tiles.intersect(
-                bbox=bbox, limit=limit, offset=offset, filters=params, queryset=queryset
+                bbox=bbox,
+                limit=limit,
+                offset=offset,
+                filters=params,
+                queryset=queryset,
+                tile=(z, x, y),
+                cluster=cluster,
             )
             status = 200 if mvt else 204
+            set_cached_tile(cache_key, mvt)
         except ValidationError:
             mvt = b""
             status = 400
-        return Response(
-            bytes(mvt),
-            content_type="application/vnd.mapbox-vector-tile",
+        return tile_response(
+            mvt,
+            "false",
             status=status,
-            headers={"tile-cache": "false"},
+            etag=etag,
+            last_modified=last_modified,
+            public=public,
+        )
+
+
+class BaseCompositeMVTView(APIView):
+    """
+    Base view for serving several models as the layers of one Mapbox Vector Tile.
+    The ``layers`` query param selects a comma separated subset of the layers.
+    """
+
+    # pylint: disable=unused-argument
+    def get(self, request, z, x, y, layers):
+        """
+        Args:
+            request (:py:class:`rest_framework.request.Request`): Standard DRF request object
+            layers (dict): Layer names mapped to models with a ``vector_tiles`` MVTManager.
+        Returns:
+            :py:class:`rest_framework.response.Response`:  Standard DRF response object
+        """
+        names = request.GET.get("layers")
+        if names:
+            names = [name.strip() for name in names.split(",") if name.strip()]
+            if not names or any(name not in layers for name in names):
+                return tile_response(b"", "false", status=400)
+            layers = {name: layers[name] for name in names}
+        cluster = parse_cluster_param(request.GET.get("cluster"))
+        # layers and cluster only select how the tile is drawn, not which rows
+        public = is_public_request(request)
+
+        cache_key = etag = last_modified = None
+        models = list(layers.values())
+        if all(model.vector_tiles.cache for model in models):
+            generations = tile_generations(models, z, x, y)
+            cache_key = tile_cache_key(
+                models,
+                z,
+                x,
+                y,
+                params={"layers": ",".join(layers), "cluster": cluster},
+                generations=generations,
+            )
+            etag = key_etag(cache_key)
+            last_modified = generations_last_modified(generations)
+            response = not_modified(request, etag, last_modified, public=public)
+            if response is not None:
+                return response
+            mvt = get_cached_tile(cache_key)
+            if mvt is not None:
+                return tile_response(
+                    mvt, "true", etag=etag, last_modified=last_modified, public=public
+                )
+
+        mvt = composite_intersect(layers, z, x, y, cluster=cluster)
+        set_cached_tile(cache_key, mvt)
+        return tile_response(
+            mvt, "false", etag=etag, last_modified=last_modified, public=public
         )
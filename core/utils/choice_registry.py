@@ -0,0 +1,144 @@
+"""
+Process wide registry of the database driven choices of Building and Road fields.
+
+The options of fields such as ``Building.roof_type`` or ``Road.road_lane`` are rows
+of ``BuildingCategoryChoice`` and ``RoadCategoryChoice``. They are read with one
+query per choice model and kept in process memory, grouped by type, together with
+the version they were read at. Versions are millisecond timestamps stored in the
+``choices`` cache, which the loaded choices are shared through as well.
+
+Saving or deleting a choice moves its model's version forward once the transaction
+commits. Other processes compare their version with the cached one at most every
+``CHOICE_REGISTRY_CHECK_INTERVAL`` seconds and reload the choices when it changed,
+so instantiating a model costs no query at all between two checks.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CHOICE_CACHE_ALIAS = getattr(settings, "CHOICE_CACHE_ALIAS", "choices")
+CHOICE_REGISTRY_CHECK_INTERVAL = getattr(settings, "CHOICE_REGISTRY_CHECK_INTERVAL", 5)
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def get_choice_cache():
+    return caches[CHOICE_CACHE_ALIAS]
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def _version_key(label):
+    return f"choice-version:{label}"
+
+
+def _choices_key(label, version):
+    return f"choices:{label}:{version}"
+
+
+def _load(choice_model):
+    choices = {}
+    rows = choice_model.objects.order_by("order", "id").values_list(
+        "type", "attribute_name", "alias_name"
+    )
+    for type, attribute_name, alias_name in rows:
+        choices.setdefault(type, []).append((attribute_name, alias_name))
+    return choices
+
+
+def _cached_version(label):
+    try:
+        cache = get_choice_cache()
+        version = cache.get(_version_key(label))
+        if version is None:
+            # a model without a version (first read or evicted) starts now
+            cache.add(_version_key(label), _now(), timeout=None)
+            version = cache.get(_version_key(label))
+        return version
+    except Exception:
+        return None
+
+
+def _cached_choices(choice_model, label, version):
+    if version is None:
+        return _load(choice_model)
+    try:
+        choices = get_choice_cache().get(_choices_key(label, version))
+    except Exception:
+        choices = None
+    if choices is None:
+        choices = _load(choice_model)
+        try:
+            get_choice_cache().set(_choices_key(label, version), choices)
+        except Exception:
+            pass
+    return choices
+
+
+def get_choices(choice_model):
+    """
+    Args:
+        choice_model (Model): BuildingCategoryChoice or RoadCategoryChoice.
+    Returns:
+        dict:
+        The (attribute_name, alias_name) choices of every type. The same dict is
+        returned until the choices change, so callers can compare it by identity.
+    """
+    label = choice_model._meta.label_lower
+    entry = _registry.get(label)
+    now = time.monotonic()
+    if entry is not None and now - entry["checked"] < CHOICE_REGISTRY_CHECK_INTERVAL:
+        return entry["choices"]
+
+    with _lock:
+        entry = _registry.get(label)
+        if (
+            entry is not None
+            and now - entry["checked"] < CHOICE_REGISTRY_CHECK_INTERVAL
+        ):
+            return entry["choices"]
+        version = _cached_version(label)
+        if entry is not None and version is not None and entry["version"] == version:
+            entry["checked"] = now
+            return entry["choices"]
+        choices = _cached_choices(choice_model, label, version)
+        _registry[label] = {"version": version, "checked": now, "choices": choices}
+        return choices
+
+
+def apply_choices(model, choice_model, field_names):
+    """
+    Sets the registered choices of ``choice_model`` on the ``field_names`` fields of
+    ``model``. The fields are only touched again once the choices changed.
+    """
+    choices = get_choices(choice_model)
+    if model.__dict__.get("_registered_choices") is choices:
+        return
+    for field_name in field_names:
+        model._meta.get_field(field_name).choices = choices.get(field_name, [])
+    model._registered_choices = choices
+
+
+def _bump(label):
+    _registry.pop(label, None)
+    try:
+        get_choice_cache().set(_version_key(label), _now(), timeout=None)
+    except Exception:
+        pass
+
+
+def invalidate_choices(choice_model):
+    """
+    Drops the registered choices of ``choice_model`` in this process right away and
+    in every other process once the current transaction commits.
+    """
+    label = choice_model._meta.label_lower
+    _registry.pop(label, None)
+    transaction.on_commit(lambda: _bump(label))
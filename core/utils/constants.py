@@ -192,6 +192,75 @@ RoadfieldChoicesType = (
     ("road_lane", "road_lane"),
 )
 
+# Vector tile profiles, see MVTManager.  Tolerances are in pixels of a 256px tile,
+# properties are the feature attributes kept up to and including max_zoom.
+BUILDING_TILE_PROFILES = [
+    {"max_zoom": 13, "properties": ["id"], "simplify": 1, "snap": 0.5},
+    {"max_zoom": 15, "properties": ["id"], "simplify": 0.5},
+]
+
+ROAD_TILE_PROFILES = [
+    {"max_zoom": 11, "properties": ["id"], "simplify": 1.5, "snap": 0.5},
+    {"max_zoom": 14, "properties": ["id", "is_deleted"], "simplify": 0.75},
+]
+
+BUILDING_ATTRIBUTE_TILE_PROFILES = [
+    {
+        "max_zoom": 13,
+        "properties": ["id", "building_use", "ward_no"],
+        "simplify": 1,
+        "snap": 0.5,
+    },
+    {
+        "max_zoom": 15,
+        "properties": [
+            "id",
+            "building_id",
+            "building_use",
+            "ward_no",
+            "house_no",
+            "road_id",
+            "association_type",
+        ],
+        "simplify": 0.5,
+    },
+]
+
+# Building clusters served instead of footprints up to TILE_CLUSTER_MAX_ZOOM, the
+# cell size is in pixels of a 256px tile.
+BUILDING_TILE_CLUSTERS = {
+    "cell_size": 32,
+    "from_statement": (
+        "core_buildinggeometry LEFT JOIN core_building "
+        "ON core_building.feature_id = core_buildinggeometry.id"
+    ),
+    "where_statement": "core_building.is_deleted IS NOT TRUE",
+    "aggregates": [
+        "mode() WITHIN GROUP (ORDER BY core_building.building_use) AS building_use"
+    ],
+}
+
+ROAD_ATTRIBUTE_TILE_PROFILES = [
+    {
+        "max_zoom": 11,
+        "properties": ["id", "road_category"],
+        "simplify": 1.5,
+        "snap": 0.5,
+    },
+    {
+        "max_zoom": 14,
+        "properties": [
+            "id",
+            "road_id",
+            "road_name_en",
+            "road_name_ne",
+            "road_category",
+            "road_type",
+        ],
+        "simplify": 0.75,
+    },
+]
+
 
 """
 Define all mappings between operators and string representations.
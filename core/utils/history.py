@@ -0,0 +1,68 @@
+"""
+Buffer for records written once the current transaction commits.
+
+Edits of buildings, roads and their geometries create a HistoryLog while saving.
+Instead of inserting every log inside the edit, the log is queued here and all the
+logs queued in one transaction are handed to their writer in a single call from an
+``on_commit`` hook, which inserts them with one ``bulk_create``. Records are
+buffered per savepoint, each buffer with its own hook, so that rolling back a
+savepoint (an inner ``atomic()``) drops the records queued in it, like rolling back
+the transaction does.
+"""
+
+import threading
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+class PendingRecords(list):
+    """
+    Records queued in one transaction, together with their writer.
+    """
+
+    def __init__(self, write):
+        super().__init__()
+        self.write = write
+
+    def flush(self):
+        records = list(self)
+        self.clear()
+        if records:
+            self.write(records)
+
+
+def _is_registered(connection, pending):
+    return any(hook[1] == pending.flush for hook in connection.run_on_commit)
+
+
+def queue_record(record, write, using=None):
+    """
+    Args:
+        record: Record to write, e.g. an unsaved model instance.
+        write (callable): Called with the list of records queued in the transaction
+                          once it commits.
+        using (str): Database alias of the transaction.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        write([record])
+        return
+
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    key = (connection.alias, write, tuple(connection.savepoint_ids))
+    pending = buffers.get(key)
+    if pending is None or not _is_registered(connection, pending):
+        # the previous transaction committed or was rolled back
+        for stale in [
+            other
+            for other, buffer in buffers.items()
+            if other[0] == connection.alias and not _is_registered(connection, buffer)
+        ]:
+            del buffers[stale]
+        pending = buffers[key] = PendingRecords(write)
+        transaction.on_commit(pending.flush, using=connection.alias)
+    pending.append(record)
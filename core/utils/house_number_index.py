@@ -0,0 +1,76 @@
+"""
+Index of the house numbers assigned during a numbering run.
+
+A main building gets the next free number on its side of the road when its
+computed number is already taken. Numbers are only unique per road and metric
+prefix, so the index keeps, for every (road_id, prefix), the numbers in use and
+the building holding each. It is seeded once from the database and updated as
+numbers are assigned, and a building renumbered in the run releases its previous
+number first.
+"""
+
+
+def split_house_no(house_no):
+    """
+    Returns the metric prefix and the number of a main house number, e.g.
+    ("494", 15) for "494/15", or None when it is not one.
+    """
+    if not house_no:
+        return None
+    prefix, _, number = house_no.rpartition("/")
+    try:
+        return prefix, int(number)
+    except ValueError:
+        return None
+
+
+def join_house_no(prefix, number):
+    return f"{prefix}/{number}" if prefix else str(number)
+
+
+class HouseNumberIndex:
+    def __init__(self):
+        self._numbers = {}
+        self._assigned = {}
+
+    @classmethod
+    def from_buildings(cls, buildings):
+        """
+        Seeds an index with the house numbers of the main buildings of
+        ``buildings``, a Building queryset.
+        """
+        index = cls()
+        for pk, road_id, house_no in buildings.filter(
+            association_type="main", house_no__isnull=False
+        ).values_list("id", "road_id", "house_no"):
+            parts = split_house_no(house_no)
+            if parts:
+                index._take(pk, (road_id, parts[0]), parts[1])
+        return index
+
+    def _take(self, pk, key, number):
+        self.release(pk)
+        self._numbers.setdefault(key, {})[number] = pk
+        self._assigned[pk] = (key, number)
+
+    def release(self, pk):
+        """
+        Frees the number held by building ``pk``.
+        """
+        key, number = self._assigned.pop(pk, (None, None))
+        if key is not None and self._numbers[key].get(number) == pk:
+            del self._numbers[key][number]
+
+    def assign(self, pk, road_id, prefix, number, increment):
+        """
+        Returns the first number from ``number`` on, stepping by ``increment`` to
+        stay on the same side of the road, that no other building holds on the road
+        and prefix, and assigns it to building ``pk``.
+        """
+        key = (road_id, prefix)
+        self.release(pk)
+        taken = self._numbers.get(key, {})
+        while taken.get(number, pk) != pk:
+            number += increment
+        self._take(pk, key, number)
+        return number
@@ -0,0 +1,124 @@
+"""
+HTTP validators for tile and GeoJSON responses.
+
+Responses are versioned with the generations of ``core.utils.tile_cache``: the ETag
+of a tile is derived from its cache key and the ETag of a layer response from the
+layer generations, so both change exactly when the underlying rows are edited.
+Clients and proxies revalidate with If-None-Match / If-Modified-Since and get a 304
+without the tile or GeoJSON being rendered again.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+
+from core.utils.tile_cache import layer_generations, layer_name
+
+HTTP_CACHE_MAX_AGE = getattr(settings, "HTTP_CACHE_MAX_AGE", 60)
+
+
+def quote_etag(value):
+    return f'"{value}"'
+
+
+def key_etag(cache_key):
+    """
+    Returns the strong ETag of a response stored under ``cache_key``.
+    """
+    if cache_key is None:
+        return None
+    return quote_etag(cache_key.split(":", 1)[-1])
+
+
+def content_etag(content):
+    return quote_etag(hashlib.md5(bytes(content)).hexdigest())
+
+
+def generations_last_modified(generations):
+    """
+    Returns the Last-Modified timestamp, in seconds, of millisecond generations.
+    """
+    if not generations:
+        return None
+    return max(generations) // 1000
+
+
+def layer_validators(layers, params=None):
+    """
+    Args:
+        layers (list): Models or layer names the response is built from.
+        params (dict): Request params changing the response, e.g. a tolerance.
+    Returns:
+        tuple:
+        The ETag and Last-Modified timestamp of the layer response, both None when
+        the tile cache holding the layer generations is unavailable.
+    """
+    generations = layer_generations(layers)
+    if generations is None:
+        return None, None
+    canonical = json.dumps(
+        {
+            "layers": [layer_name(layer) for layer in layers],
+            "params": params or {},
+            "generations": generations,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    etag = quote_etag(hashlib.sha1(canonical.encode()).hexdigest())
+    return etag, generations_last_modified(generations)
+
+
+def is_public_request(request, filtered=False):
+    """
+    Returns whether the response to ``request`` may be stored by shared caches: the
+    request is anonymous and, unlike ``filtered`` ones, returns the same data to
+    everybody.
+    """
+    user = getattr(request, "user", None)
+    return (
+        not filtered
+        and "HTTP_AUTHORIZATION" not in request.META
+        and not (user is not None and user.is_authenticated)
+    )
+
+
+def add_validators(response, etag=None, last_modified=None, max_age=None, public=False):
+    """
+    Sets ETag, Last-Modified and Cache-Control on a response.  Responses without a
+    validator are only marked as cacheable for max_age.  Only ``public`` responses
+    may be stored by shared caches, the others are private to the client.
+    """
+    if etag:
+        response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    cache_control = {"public": True} if public else {"private": True}
+    patch_cache_control(
+        response,
+        max_age=HTTP_CACHE_MAX_AGE if max_age is None else max_age,
+        **cache_control,
+    )
+    if public:
+        patch_vary_headers(response, ("Authorization",))
+    return response
+
+
+def not_modified(request, etag=None, last_modified=None, public=False):
+    """
+    Returns a 304 response when the request's If-None-Match / If-Modified-Since
+    headers match the validators, otherwise None.
+    """
+    if etag is None and last_modified is None:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return add_validators(response, etag, last_modified, public=public)
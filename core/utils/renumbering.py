@@ -0,0 +1,79 @@
+"""
+Houses to renumber once the current transaction commits.
+
+A house number depends on the gate (ref_centroid) of the house, on its road and
+on the chain of roads the road branches off. Saving the geometry or the category
+of a road, or moving the gate of a building, queues the edit here, and all the
+edits of one transaction are renumbered by a single ``renumber_buildings_task``
+once it commits, see ``core.batch_numbering.renumber_affected``.
+"""
+
+import logging
+
+from django.conf import settings
+
+from core.utils.history import queue_record
+
+logger = logging.getLogger(__name__)
+
+
+def _enabled():
+    return getattr(settings, "INCREMENTAL_HOUSE_NUMBERING", True)
+
+
+def renumber_road_on_commit(road_id, *geoms):
+    """
+    Queues the houses of road ``road_id`` and of the roads branching off it, and
+    of the roads starting around ``geoms``, the geometries of the road before and
+    after the edit, which it may have become or stopped being the parent of.
+    """
+    if not _enabled():
+        return
+    if road_id is not None:
+        queue_record(("road_ids", road_id), dispatch_renumbering)
+    _queue_geometries(geoms)
+
+
+def renumber_road_geometry_on_commit(feature_id, *geoms):
+    """
+    Same as ``renumber_road_on_commit`` for the road of RoadGeometry
+    ``feature_id``, which is looked up by the task instead of while saving.
+    """
+    if not _enabled():
+        return
+    queue_record(("feature_ids", feature_id), dispatch_renumbering)
+    _queue_geometries(geoms)
+
+
+def _queue_geometries(geoms):
+    for geom in geoms:
+        if geom:
+            queue_record(("geometries", geom.wkt), dispatch_renumbering)
+
+
+def renumber_building_on_commit(pk):
+    """
+    Queues building ``pk`` and the associate and dissociate buildings taking their
+    number from it.
+    """
+    if _enabled():
+        queue_record(("building_ids", pk), dispatch_renumbering)
+
+
+def dispatch_renumbering(records):
+    from core.tasks import renumber_buildings_task
+
+    kwargs = {
+        "road_ids": set(),
+        "feature_ids": set(),
+        "geometries": set(),
+        "building_ids": set(),
+    }
+    for key, value in records:
+        kwargs[key].add(value)
+    try:
+        renumber_buildings_task.delay(
+            **{key: sorted(values) for key, values in kwargs.items()}
+        )
+    except Exception:
+        logger.exception("error queueing house renumbering")
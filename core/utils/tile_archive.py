@@ -0,0 +1,223 @@
+"""
+Pre-rendered vector tile archives.
+
+A layer can be exported once over a palika or ward extent into an MBTiles file
+(``<TILE_ARCHIVE_ROOT>/<layer>.mbtiles``) or a z/x/y directory
+(``<TILE_ARCHIVE_ROOT>/<layer>/<z>/<x>/<y>.pbf``). Tile views look tiles up in the
+archive first and only fall back to PostGIS for tiles that are missing from it.
+Archives are snapshots that the edit hooks do not invalidate: they are only served
+when ``TILE_ARCHIVE_ROOT`` is set, and must be exported again after editing the
+data of a layer.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+
+from core.utils.tile_cache import layer_name
+
+_connections = threading.local()
+
+
+def archive_root():
+    """
+    Returns TILE_ARCHIVE_ROOT, or None when archives are disabled.
+    """
+    return getattr(settings, "TILE_ARCHIVE_ROOT", None)
+
+
+def mbtiles_path(layer, root=None):
+    return os.path.join(root or archive_root(), f"{layer_name(layer)}.mbtiles")
+
+
+def directory_path(layer, root=None):
+    return os.path.join(root or archive_root(), layer_name(layer))
+
+
+class MBTilesArchive:
+    """
+    Writes tiles into an MBTiles 1.3 file.  Tiles are stored uncompressed and rows
+    follow the TMS scheme of the specification.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # build next to the target and swap it in on close, readers never see a
+        # half written archive
+        self.tmp_path = f"{path}.tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.tmp_path)
+        self.connection.executescript("""
+            CREATE TABLE metadata (name TEXT, value TEXT, UNIQUE (name));
+            CREATE TABLE tiles (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB,
+                UNIQUE (zoom_level, tile_column, tile_row)
+            );
+            """)
+
+    def write_metadata(self, metadata):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            [(name, str(value)) for name, value in metadata.items()],
+        )
+
+    def write_tile(self, z, x, y, data):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            (z, x, (2**z - 1) - y, sqlite3.Binary(bytes(data))),
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.connection.close()
+        os.remove(self.tmp_path)
+
+
+class DirectoryArchive:
+    """
+    Writes tiles into a z/x/y.pbf directory tree that can also be served by nginx.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write_metadata(self, metadata):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "metadata.json"), "w") as file:
+            json.dump(metadata, file)
+
+    def write_tile(self, z, x, y, data):
+        tile_dir = os.path.join(self.path, str(z), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        with open(os.path.join(tile_dir, f"{y}.pbf"), "wb") as file:
+            file.write(bytes(data))
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+def _mbtiles_connection(path):
+    """
+    Returns a read-only connection to ``path`` for the current thread, reopened when
+    the archive has been replaced by a new export.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cache = getattr(_connections, "archives", None)
+    if cache is None:
+        cache = _connections.archives = {}
+    cached = cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    cache[path] = (mtime, connection)
+    return connection
+
+
+def get_archived_tile(layer, z, x, y):
+    """
+    Returns the archived tile of ``layer`` at z/x/y, or None when no archive holds it.
+    An empty bytes object is a tile that was exported without features.
+    """
+    if not archive_root():
+        return None
+    connection = _mbtiles_connection(mbtiles_path(layer))
+    if connection is not None:
+        row = connection.execute(
+            "SELECT tile_data FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (2**z - 1) - y),
+        ).fetchone()
+        if row is not None:
+            return bytes(row[0])
+    tile_path = os.path.join(directory_path(layer), str(z), str(x), f"{y}.pbf")
+    try:
+        with open(tile_path, "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def export_tile_archive(
+    model, bounds, min_zoom, max_zoom, archive_format="mbtiles", path=None
+):
+    """
+    Renders every tile of ``model`` covering ``bounds`` from ``min_zoom`` to
+    ``max_zoom`` through its MVTManager and writes them into an archive.
+
+    Args:
+        model: Model with a ``vector_tiles`` MVTManager.
+        bounds (list): List of (xmin, ymin, xmax, ymax) extents in EPSG:4326.
+        archive_format (str): "mbtiles" or "directory".
+        path (str): Output path.  Defaults to the archive path of the layer under
+                    TILE_ARCHIVE_ROOT, where tile views look for it.
+    Returns:
+        dict:
+        The number of tiles written, and of those the number of empty tiles.
+    """
+    # pylint: disable=import-outside-toplevel
+    from core.tile import tile_range
+
+    if path is None and not archive_root():
+        raise ValueError("Set TILE_ARCHIVE_ROOT or pass the path of the archive")
+    if archive_format == "mbtiles":
+        archive = MBTilesArchive(path or mbtiles_path(model))
+    elif archive_format == "directory":
+        archive = DirectoryArchive(path or directory_path(model))
+    else:
+        raise ValueError(f"Unsupported tile archive format: {archive_format}")
+
+    tiles = empty = 0
+    try:
+        for z in range(min_zoom, max_zoom + 1):
+            positions = set()
+            for extent in bounds:
+                positions.update(tile_range(*extent, z))
+            for x, y in sorted(positions):
+                mvt = model.vector_tiles.intersect(tile=(z, x, y))
+                mvt = bytes(mvt) if mvt else b""
+                archive.write_tile(z, x, y, mvt)
+                tiles += 1
+                empty += 0 if mvt else 1
+        archive.write_metadata(
+            {
+                "name": layer_name(model),
+                "format": "pbf",
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+                "bounds": ",".join(
+                    str(value)
+                    for value in (
+                        min(extent[0] for extent in bounds),
+                        min(extent[1] for extent in bounds),
+                        max(extent[2] for extent in bounds),
+                        max(extent[3] for extent in bounds),
+                    )
+                ),
+                "json": json.dumps({"vector_layers": [{"id": "default"}]}),
+            }
+        )
+    except Exception:
+        archive.abort()
+        raise
+    archive.close()
+    return {"tiles": tiles, "empty": empty}
@@ -0,0 +1,224 @@
+"""
+Server side cache for Mapbox Vector Tiles.
+
+Rendered tiles are stored in the ``tiles`` cache under a key built from the layer(s),
+the z/x/y position, a canonical form of the request filters and the current
+generation of every layer involved. A generation is a millisecond timestamp kept at
+three levels:
+
+    * layer: bumped when a whole layer changes (bulk uploads, deletes of everything)
+    * zoom:  bumped when a change covers too many tiles of one zoom level
+    * tile:  bumped for the tiles intersecting the extent of an edited geometry
+
+Invalidating a tile never deletes anything, it only moves the generation forward so
+that the next request renders a fresh tile under a new key. Stale entries expire with
+``TILE_CACHE_TIMEOUT``. Generation keys are stored without expiry, so the redis
+instance backing the cache should use a ``volatile-*`` eviction policy.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+TILE_CACHE_ALIAS = getattr(settings, "TILE_CACHE_ALIAS", "tiles")
+TILE_CACHE_TIMEOUT = getattr(settings, "TILE_CACHE_TIMEOUT", 60 * 60 * 24)
+TILE_CACHE_MAX_ZOOM = getattr(settings, "TILE_CACHE_MAX_ZOOM", 22)
+TILE_CACHE_MAX_INVALIDATE_TILES = getattr(
+    settings, "TILE_CACHE_MAX_INVALIDATE_TILES", 256
+)
+
+
+def get_tile_cache():
+    return caches[TILE_CACHE_ALIAS]
+
+
+def layer_name(layer):
+    """
+    Returns the cache name of a layer, given either a model class, a model instance
+    or an already resolved layer name.
+    """
+    if isinstance(layer, str):
+        return layer
+    return layer._meta.label_lower
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def _layer_key(layer):
+    return f"tile-gen:{layer}"
+
+
+def _zoom_key(layer, z):
+    return f"tile-gen:{layer}:{z}"
+
+
+def _tile_key(layer, z, x, y):
+    return f"tile-gen:{layer}:{z}:{x}:{y}"
+
+
+def _get_generations(cache, keys, layer_keys):
+    values = cache.get_many(keys)
+    missing = [key for key in layer_keys if key not in values]
+    if missing:
+        # a layer without a generation (new or evicted) starts now, so tiles cached
+        # under an older, lost generation can never be served again
+        now = _now()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        values.update(cache.get_many(missing))
+    return values
+
+
+def layer_generations(layers):
+    """
+    Returns the current layer generation of every layer, as a list in the same order
+    as ``layers``, or None when the cache is unavailable. Layer generations version
+    whole layer responses such as GeoJSON lists.
+    """
+    keys = [_layer_key(layer_name(layer)) for layer in layers]
+    try:
+        values = _get_generations(get_tile_cache(), keys, keys)
+    except Exception:
+        return None
+    return [values.get(key, 0) for key in keys]
+
+
+def tile_generations(layers, z, x, y):
+    """
+    Returns the current generation of every layer for the tile at z/x/y, as a list in
+    the same order as ``layers``. The generation of a tile on a layer is the latest of
+    its layer, zoom and tile generations.
+    """
+    layers = [layer_name(layer) for layer in layers]
+    keys = []
+    for layer in layers:
+        keys += [_layer_key(layer), _zoom_key(layer, z), _tile_key(layer, z, x, y)]
+    try:
+        values = _get_generations(
+            get_tile_cache(), keys, [_layer_key(layer) for layer in layers]
+        )
+    except Exception:
+        return None
+    return [
+        max(
+            values.get(_layer_key(layer), 0),
+            values.get(_zoom_key(layer, z), 0),
+            values.get(_tile_key(layer, z, x, y), 0),
+        )
+        for layer in layers
+    ]
+
+
+def tile_cache_key(layers, z, x, y, params=None, queryset=None, generations=None):
+    """
+    Args:
+        layers (list): Models or layer names rendered into the tile.
+        params (dict): Filter params of the request.
+        queryset (dict): Optional raw query parts passed to ``MVTManager.intersect``.
+        generations (list): Generations of the tile already read with
+                            ``tile_generations``, read from the cache when omitted.
+    Returns:
+        str:
+        The cache key of the tile, or None when the cache is unavailable.
+    """
+    if generations is None:
+        generations = tile_generations(layers, z, x, y)
+    if generations is None:
+        return None
+    canonical = json.dumps(
+        {
+            "layers": [layer_name(layer) for layer in layers],
+            "tile": [z, x, y],
+            "params": {key: str(value) for key, value in (params or {}).items()},
+            "queryset": queryset,
+            "generations": generations,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return "tile:" + hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def get_cached_tile(key):
+    """
+    Returns the cached tile bytes for ``key``, or None on a miss. Cache errors are
+    treated as misses so that tiles keep being served from the database.
+    """
+    if key is None:
+        return None
+    try:
+        return get_tile_cache().get(key)
+    except Exception:
+        return None
+
+
+def set_cached_tile(key, mvt):
+    if key is None:
+        return
+    try:
+        get_tile_cache().set(key, bytes(mvt), timeout=TILE_CACHE_TIMEOUT)
+    except Exception:
+        pass
+
+
+def invalidate_layer(layers):
+    """
+    Invalidates every cached tile of the given layers.
+    """
+    now = _now()
+    try:
+        get_tile_cache().set_many(
+            {_layer_key(layer_name(layer)): now for layer in layers}, timeout=None
+        )
+    except Exception:
+        pass
+
+
+def invalidate_tiles(layers, *extents):
+    """
+    Invalidates the cached tiles of ``layers`` that intersect any of ``extents``.
+
+    Args:
+        layers (list): Models or layer names to invalidate.
+        extents: Tuples of (xmin, ymin, xmax, ymax) in EPSG:4326, e.g. ``geom.extent``.
+                 None values are ignored so that old and new extents of an edit can be
+                 passed as they are.
+    """
+    # pylint: disable=import-outside-toplevel
+    from core.tile import tile_range
+
+    extents = [extent for extent in extents if extent]
+    if not extents:
+        return
+    now = _now()
+    generations = {}
+    for layer in [layer_name(layer) for layer in layers]:
+        for z in range(TILE_CACHE_MAX_ZOOM + 1):
+            tiles = set()
+            for extent in extents:
+                tiles.update(tile_range(*extent, z))
+            if len(tiles) > TILE_CACHE_MAX_INVALIDATE_TILES:
+                generations[_zoom_key(layer, z)] = now
+            else:
+                for x, y in tiles:
+                    generations[_tile_key(layer, z, x, y)] = now
+    try:
+        get_tile_cache().set_many(generations, timeout=None)
+    except Exception:
+        pass
+
+
+def geometry_extent(geom):
+    """
+    Returns the EPSG:4326 extent of a GEOS geometry, or None for empty geometries.
+    """
+    if geom is None or geom.empty:
+        return None
+    if geom.srid and geom.srid != 4326:
+        geom = geom.transform(4326, clone=True)
+    return geom.extent
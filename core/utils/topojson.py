@@ -0,0 +1,207 @@
+"""
+Minimal TopoJSON encoder for polygon and line FeatureCollections.
+
+Coordinates are quantized, rings and lines are cut into arcs at the junctions
+where neighbouring geometries stop sharing a border, shared arcs are stored once
+and every arc is delta encoded, as described in the TopoJSON specification
+https://github.com/topojson/topojson-specification
+"""
+
+from collections import defaultdict
+
+
+def _quantize(coordinates, translate, scale):
+    points = []
+    for x, y, *_ in coordinates:
+        point = (
+            int(round((x - translate[0]) / scale[0])),
+            int(round((y - translate[1]) / scale[1])),
+        )
+        if not points or points[-1] != point:
+            points.append(point)
+    return points
+
+
+def _polygons(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return None
+
+
+def _lines(geometry):
+    if geometry["type"] == "LineString":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiLineString":
+        return geometry["coordinates"]
+    return None
+
+
+def _bounds(features):
+    xs, ys = [], []
+
+    def collect(coordinates):
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            xs.append(coordinates[0])
+            ys.append(coordinates[1])
+        else:
+            for item in coordinates:
+                collect(item)
+
+    for feature in features:
+        if feature.get("geometry"):
+            collect(feature["geometry"]["coordinates"])
+    if not xs:
+        return [0, 0, 0, 0]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def _junctions(lines):
+    """
+    Returns the points where lines meet with different neighbours, plus the
+    endpoints of open lines.
+    """
+    neighbours = defaultdict(set)
+    junctions = set()
+    for points, closed in lines:
+        ring = points[:-1] if closed else points
+        size = len(ring)
+        for index, point in enumerate(ring):
+            if closed:
+                previous, following = ring[index - 1], ring[(index + 1) % size]
+            else:
+                previous = ring[index - 1] if index > 0 else None
+                following = ring[index + 1] if index < size - 1 else None
+            neighbours[point].add(frozenset((previous, following)))
+        if not closed and ring:
+            junctions.update((ring[0], ring[-1]))
+    junctions.update(point for point, pairs in neighbours.items() if len(pairs) > 1)
+    return junctions
+
+
+def _cut(points, closed, junctions):
+    if closed:
+        ring = points[:-1]
+        starts = [index for index, point in enumerate(ring) if point in junctions]
+        # rings without junctions start at their smallest point so that identical
+        # rings produce identical arcs
+        start = starts[0] if starts else ring.index(min(ring))
+        points = ring[start:] + ring[:start] + [ring[start]]
+    arcs, current = [], [points[0]]
+    for point in points[1:]:
+        current.append(point)
+        if point in junctions:
+            arcs.append(current)
+            current = [point]
+    if len(current) > 1:
+        arcs.append(current)
+    return arcs
+
+
+def _delta(arc):
+    encoded, previous = [], (0, 0)
+    for point in arc:
+        encoded.append([point[0] - previous[0], point[1] - previous[1]])
+        previous = point
+    return encoded
+
+
+def encode(feature_collection, object_name="boundaries", quantization=100000):
+    """
+    Args:
+        feature_collection (dict): GeoJSON FeatureCollection of polygons or lines.
+        object_name (str): Name of the geometry collection in the topology.
+        quantization (int): Number of distinct values per axis.
+    Returns:
+        dict:
+        The TopoJSON topology of the features.
+    """
+    features = feature_collection.get("features") or []
+    bbox = _bounds(features)
+    translate = [bbox[0], bbox[1]]
+    scale = [
+        (bbox[2] - bbox[0]) / (quantization - 1) or 1,
+        (bbox[3] - bbox[1]) / (quantization - 1) or 1,
+    ]
+
+    lines = []
+
+    def add_line(coordinates, closed):
+        points = _quantize(coordinates, translate, scale)
+        if closed and points and points[0] != points[-1]:
+            points.append(points[0])
+        lines.append((points, closed and len(points) > 2))
+        return len(lines) - 1
+
+    shapes = []
+    for feature in features:
+        geometry = feature.get("geometry")
+        shape = None
+        if geometry:
+            polygons = _polygons(geometry)
+            if polygons is not None:
+                shape = (
+                    "polygon",
+                    [
+                        [add_line(ring, True) for ring in polygon]
+                        for polygon in polygons
+                    ],
+                )
+            elif _lines(geometry) is not None:
+                shape = (
+                    "line",
+                    [add_line(line, False) for line in _lines(geometry)],
+                )
+            else:
+                raise ValueError(
+                    f"Unsupported geometry type for TopoJSON: {geometry['type']}"
+                )
+        shapes.append(shape)
+
+    junctions = _junctions(lines)
+    arcs, arc_index, line_arcs = [], {}, []
+    for points, closed in lines:
+        indexes = []
+        for arc in _cut(points, closed, junctions) if points else []:
+            key = tuple(arc)
+            if key in arc_index:
+                indexes.append(arc_index[key])
+            elif key[::-1] in arc_index:
+                indexes.append(~arc_index[key[::-1]])
+            else:
+                arc_index[key] = len(arcs)
+                indexes.append(len(arcs))
+                arcs.append(arc)
+        line_arcs.append(indexes)
+
+    geometries = []
+    for feature, shape in zip(features, shapes):
+        if shape is None:
+            geometry = {"type": None}
+        elif shape[0] == "polygon":
+            polygons = [[line_arcs[ring] for ring in polygon] for polygon in shape[1]]
+            if feature["geometry"]["type"] == "Polygon":
+                geometry = {"type": "Polygon", "arcs": polygons[0]}
+            else:
+                geometry = {"type": "MultiPolygon", "arcs": polygons}
+        else:
+            parts = [line_arcs[line] for line in shape[1]]
+            if feature["geometry"]["type"] == "LineString":
+                geometry = {"type": "LineString", "arcs": parts[0]}
+            else:
+                geometry = {"type": "MultiLineString", "arcs": parts}
+        if feature.get("id") is not None:
+            geometry["id"] = feature["id"]
+        geometry["properties"] = feature.get("properties") or {}
+        geometries.append(geometry)
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": scale, "translate": translate},
+        "objects": {
+            object_name: {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": [_delta(arc) for arc in arcs],
+    }
@@ -1,4 +1,13 @@
-from dmaps.models import GeometryFile, MunicipalityGeometry, ProvinceGeometry
+import gzip
+import json
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from dmaps.models import (
+    BoundaryGeojson,
+    GeometryFile,
+    MunicipalityGeometry,
+    ProvinceGeometry,
+)
 from django.contrib.gis.geos import GEOSGeometry
 from user.models import User
 from django.contrib.gis.geos.prototypes.io import wkt_w
@@ -9,6 +18,66 @@ from shapely.geometry import Point, LineString, MultiLineString
 import fiona
 import geopandas as gpd
 from core.utils import pluscode
+from core.utils import topojson
+
+BOUNDARY_MODELS = {
+    "municipality": MunicipalityGeometry,
+    "province": ProvinceGeometry,
+}
+BOUNDARY_GEOJSON_TOLERANCES = getattr(
+    settings, "BOUNDARY_GEOJSON_TOLERANCES", [0.001, 0.005, 0.01]
+)
+DEFAULT_BOUNDARY_TOLERANCE = getattr(settings, "DEFAULT_BOUNDARY_TOLERANCE", 0.005)
+
+
+def boundary_geojson_query(table):
+    return f"""SELECT jsonb_build_object('type','FeatureCollection', 'features', jsonb_agg(features.feature))
+            FROM (
+            SELECT jsonb_build_object(
+                'type',       'Feature',
+                'properties', to_jsonb(inputs) - 'geom',
+                'geometry',   ST_AsGeoJSON(ST_Simplify(geom, %s, true))::jsonb
+            ) AS feature
+            FROM (SELECT * FROM {table})inputs) features;"""
+
+
+def get_boundary_geojson(table, tolerance=DEFAULT_BOUNDARY_TOLERANCE):
+    """
+    Returns the boundaries of ``table`` simplified with ``tolerance`` as a GeoJSON
+    FeatureCollection, queried on the Django managed connection.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(boundary_geojson_query(table), [tolerance])
+        geojson = cursor.fetchone()[0]
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    # jsonb_agg of no rows is null
+    geojson["features"] = geojson.get("features") or []
+    return geojson
+
+
+def build_boundary_geojson(layer, tolerances=None):
+    """
+    Stores the gzip compressed GeoJSON and TopoJSON of a boundary layer for every
+    tolerance, served as they are by the boundary GeoJSON views.
+    """
+    table = BOUNDARY_MODELS[layer]._meta.db_table
+    for tolerance in tolerances or BOUNDARY_GEOJSON_TOLERANCES:
+        geojson = get_boundary_geojson(table, tolerance)
+        for format, data in (
+            ("geojson", geojson),
+            ("topojson", topojson.encode(geojson, object_name=layer)),
+        ):
+            content = gzip.compress(json.dumps(data, separators=(",", ":")).encode())
+            stored = BoundaryGeojson.objects.filter(
+                layer=layer, tolerance=tolerance, format=format
+            )
+            try:
+                with transaction.atomic():
+                    stored.update_or_create(defaults={"content": content})
+            except IntegrityError:
+                # built at the same time by another request or upload
+                stored.update(content=content)
 
 
 def handlegeometryfile(id):
@@ -40,4 +109,7 @@ def handlegeometryfile(id):
             ProvinceGeometry.objects.create(
                 name=name, geom=geom, bbox=bbox, area=area, attr_data=attr_data
             )
+    if file_type in BOUNDARY_MODELS:
+        # after the hooks of the saved rows, which delete the stored GeoJSON
+        transaction.on_commit(lambda: build_boundary_geojson(file_type))
     return "success"
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import psycopg2
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dmaps.file_handlers import DEFAULT_BOUNDARY_TOLERANCE, boundary_geojson_query
+
+BOUNDARY_TABLES = {
+    "municipality": "dmaps_municipalitygeometry",
+    "province": "dmaps_provincegeometry",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the boundary GeoJSON query on a single shared "
+        "psycopg2 connection and on Django managed connections"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--layer", choices=sorted(BOUNDARY_TABLES), default="municipality"
+        )
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        query = boundary_geojson_query(BOUNDARY_TABLES[options["layer"]])
+        threads, requests = options["threads"], options["requests"]
+        self.stdout.write(
+            f"{requests} requests on {threads} threads, layer {options['layer']}"
+        )
+        for name, run in (
+            ("shared psycopg2 connection", self.run_shared),
+            ("django connection per request", self.run_per_request),
+            ("persistent django connections", self.run_persistent),
+        ):
+            elapsed = run(query, threads, requests)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: {requests / elapsed:.1f} req/s ({elapsed:.2f}s)"
+                )
+            )
+
+    def run_threads(self, worker, threads, requests):
+        """
+        Splits the requests over the threads and returns the wall clock time.
+        """
+        counts = [
+            requests // threads + (i < requests % threads) for i in range(threads)
+        ]
+        pool = [threading.Thread(target=worker, args=(count,)) for count in counts]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return time.perf_counter() - start
+
+    def run_shared(self, query, threads, requests):
+        # the former module level connection of dmaps.viewsets
+        database = settings.DATABASES["default"]
+        shared = psycopg2.connect(
+            database=database["NAME"],
+            user=database["USER"],
+            password=database["PASSWORD"],
+            port=database["PORT"],
+            host=database["HOST"],
+        )
+
+        def worker(count):
+            for _ in range(count):
+                with shared.cursor() as cursor:
+                    cursor.execute(query, [DEFAULT_BOUNDARY_TOLERANCE])
+                    cursor.fetchone()
+
+        try:
+            return self.run_threads(worker, threads, requests)
+        finally:
+            shared.close()
+
+    def run_per_request(self, query, threads, requests):
+        # CONN_MAX_AGE = 0, the connection is closed when the request finishes
+        def worker(count):
+            for _ in range(count):
+                with connection.cursor() as cursor:
+                    cursor.execute(query, [DEFAULT_BOUNDARY_TOLERANCE])
+                    cursor.fetchone()
+                connection.close()
+
+        return self.run_threads(worker, threads, requests)
+
+    def run_persistent(self, query, threads, requests):
+        # CONN_MAX_AGE > 0, every thread keeps its own connection
+        def worker(count):
+            try:
+                for _ in range(count):
+                    with connection.cursor() as cursor:
+                        cursor.execute(query, [DEFAULT_BOUNDARY_TOLERANCE])
+                        cursor.fetchone()
+            finally:
+                connection.close()
+
+        return self.run_threads(worker, threads, requests)
@@ -0,0 +1,49 @@
+# Generated by Django 4.1 on 2024-01-15 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dmaps", "0017_about_title_en_about_title_ne_header_title_en_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BoundaryGeojson",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "layer",
+                    models.CharField(
+                        choices=[
+                            ("municipality", "Municipality"),
+                            ("province", "Province"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("tolerance", models.FloatField()),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[("geojson", "GeoJSON"), ("topojson", "TopoJSON")],
+                        max_length=10,
+                    ),
+                ),
+                ("content", models.BinaryField()),
+                ("updated_date", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("layer", "tolerance", "format")},
+            },
+        ),
+    ]
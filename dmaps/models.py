@@ -123,7 +123,7 @@ class MunicipalityGeometry(models.Model):
     attr_data = models.JSONField(default=dict, blank=True, null=True)
 
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True)
 
     def __str__(self):
         return str(self.id)
@@ -137,12 +137,35 @@ class ProvinceGeometry(models.Model):
     attr_data = models.JSONField(default=dict, blank=True, null=True)
 
     objects = models.Manager()
-    vector_tiles = MVTManager()
+    vector_tiles = MVTManager(cache=True)
 
     def __str__(self):
         return str(self.id)
 
 
+class BoundaryGeojson(models.Model):
+    """
+    Pre-simplified boundaries of a layer, serialized and gzip compressed for one
+    tolerance and format.  Built from the boundary tables, see build_boundary_geojson.
+    """
+
+    FORMAT_CHOICES = [
+        ("geojson", "GeoJSON"),
+        ("topojson", "TopoJSON"),
+    ]
+    layer = models.CharField(max_length=20, choices=GeometryFile.FILE_CHOICES)
+    tolerance = models.FloatField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    content = models.BinaryField()
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("layer", "tolerance", "format")
+
+    def __str__(self):
+        return f"{self.layer}, {self.tolerance}, {self.format}"
+
+
 # END MAP
 
 
@@ -1,11 +1,18 @@
 import re
 from django.conf import settings
 from django.core.mail import send_mail
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from dmaps.models import Collaborator
+from dmaps.models import (
+    BoundaryGeojson,
+    Collaborator,
+    MunicipalityGeometry,
+    ProvinceGeometry,
+)
+from core.utils.tile_cache import invalidate_layer
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -81,3 +88,16 @@ def send_team_notification_email(sender, instance, **kwargs):
             {"message": f"Error sending email to team."},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
+
+
+@receiver([post_save, post_delete], sender=MunicipalityGeometry)
+@receiver([post_save, post_delete], sender=ProvinceGeometry)
+def bump_boundary_layer_version(sender, **kwargs):
+    def invalidate():
+        invalidate_layer([sender])
+        # the stored GeoJSON is rebuilt by the next request or geometry file upload
+        BoundaryGeojson.objects.filter(
+            layer="municipality" if sender is MunicipalityGeometry else "province"
+        ).delete()
+
+    transaction.on_commit(invalidate)
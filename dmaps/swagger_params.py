@@ -19,3 +19,21 @@ use_case_detail_params = (
         description="card_id",
     ),
 )
+
+boundary_geojson_params = [
+    openapi.Parameter(
+        name="tolerance",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_NUMBER,
+        required=False,
+        description="simplification tolerance in degrees, 0.001, 0.005 or 0.01",
+    ),
+    openapi.Parameter(
+        name="format",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        enum=["geojson", "topojson"],
+        description="geojson (default) or topojson",
+    ),
+]
@@ -1,7 +1,9 @@
-import os
-import psycopg2
+import gzip
 from math import ceil
 from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 from dmaps.swagger_params import *
 from dmaps.serializers import *
@@ -12,6 +14,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from dmaps.filters import HeaderFilter, UseCaseFilter, WeWorkWithFilter, CardFilter
 from rest_framework import filters
 from dmaps.models import (
+    BoundaryGeojson,
     GeometryFile,
     MunicipalityGeometry,
     ProvinceGeometry,
@@ -20,23 +23,88 @@ from dmaps.models import (
     UseCaseDetail,
 )
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from dmaps.file_handlers import handlegeometryfile
+from dmaps.file_handlers import (
+    BOUNDARY_GEOJSON_TOLERANCES,
+    BOUNDARY_MODELS,
+    DEFAULT_BOUNDARY_TOLERANCE,
+    build_boundary_geojson,
+    handlegeometryfile,
+)
 from core.tile import BinaryRenderer, BaseMVTView, split_on_last_occurrence
+from core.utils.http_cache import (
+    add_validators,
+    is_public_request,
+    layer_validators,
+    not_modified,
+)
 from rest_framework.views import APIView
 from django.core.serializers import serialize
 from rest_framework.pagination import PageNumberPagination
 from core.models import BuildingGeometry, RoadGeometry, Building, Road
 
 
-# Connect to the PostgreSQL database
-conn = psycopg2.connect(
-    database=os.environ.get("POSTGRES_DB", "postgres"),
-    user=os.environ.get("POSTGRES_USER", "postgres"),
-    password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
-    port=os.environ.get("POSTGRES_PORT", "5432"),
-    host=os.environ.get("POSTGRES_HOST", "localhost"),
-)
-cur = conn.cursor()
+class BoundaryGeojsonNegotiation(DefaultContentNegotiation):
+    """
+    ?format= selects the boundary serialization, not a DRF renderer.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+def boundary_geojson_response(request, layer):
+    """
+    Returns the stored GeoJSON or TopoJSON of a boundary layer for the ``tolerance``
+    and ``format`` query params, gzip encoded when the client accepts it.
+    """
+    try:
+        tolerance = float(
+            request.query_params.get("tolerance", DEFAULT_BOUNDARY_TOLERANCE)
+        )
+    except ValueError:
+        tolerance = None
+    if tolerance not in BOUNDARY_GEOJSON_TOLERANCES:
+        return Response(
+            {"message": f"tolerance must be one of {BOUNDARY_GEOJSON_TOLERANCES}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    format = request.query_params.get("format", "geojson")
+    if format not in dict(BoundaryGeojson.FORMAT_CHOICES):
+        return Response(
+            {"message": "format must be geojson or topojson"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    accepts_gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+    etag, last_modified = layer_validators(
+        [BOUNDARY_MODELS[layer]],
+        params={"tolerance": tolerance, "format": format, "gzip": accepts_gzip},
+    )
+    # the tolerance and format only select a serialization of the whole layer
+    public = is_public_request(request)
+    response = not_modified(request, etag, last_modified, public=public)
+    if response is not None:
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    stored = BoundaryGeojson.objects.filter(
+        layer=layer, tolerance=tolerance, format=format
+    )
+    content = stored.values_list("content", flat=True).first()
+    if content is None:
+        build_boundary_geojson(layer, [tolerance])
+        content = stored.values_list("content", flat=True).first()
+    content = bytes(content)
+
+    if accepts_gzip:
+        response = HttpResponse(content, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(
+            gzip.decompress(content), content_type="application/json"
+        )
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return add_validators(response, etag, last_modified, public=public)
 
 
 class DefaultPagination(PageNumberPagination):
@@ -1462,32 +1530,15 @@ class MunicipalityGeojsonViewSet(viewsets.ModelViewSet):
     queryset = MunicipalityGeometry.objects.all()
     serializer_class = ProvinceGeometrySerializer
     http_method_names = ["get"]
+    content_negotiation_class = BoundaryGeojsonNegotiation
 
     @swagger_auto_schema(
         operation_summary="Get Municipality Geojson",
         tags=["dmaps municipality-geojson"],
+        manual_parameters=boundary_geojson_params,
     )
     def list(self, request, *args, **kwargs):
-        query = f"""SELECT jsonb_build_object('type','FeatureCollection', 'features', jsonb_agg(features.feature))
-            FROM (
-            SELECT jsonb_build_object(
-                'type',       'Feature',
-                'properties', to_jsonb(inputs) - 'geom',
-                'geometry',   ST_AsGeoJSON(ST_Simplify(geom, 0.005, true))::jsonb
-            ) AS feature
-            FROM (SELECT * FROM dmaps_municipalitygeometry)inputs) features;"""
-
-        cur.execute(query)
-
-        # Fetch all rows
-        rows = cur.fetchall()
-        geojson = rows[0][0]
-
-        # Close the cursor and connection
-        # cur.close()
-        # conn.close()
-
-        return Response(geojson)
+        return boundary_geojson_response(request, "municipality")
 
     @swagger_auto_schema(
         operation_summary="Get Municipality Geojson",
@@ -1502,32 +1553,15 @@ class ProvinceGeojsonViewSet(viewsets.ModelViewSet):
     queryset = ProvinceGeometry.objects.all()
     serializer_class = ProvinceGeometrySerializer
     http_method_names = ["get"]
+    content_negotiation_class = BoundaryGeojsonNegotiation
 
     @swagger_auto_schema(
         operation_summary="Get Palika Ward Geojson",
         tags=["dmaps province-geojson"],
+        manual_parameters=boundary_geojson_params,
     )
     def list(self, request, *args, **kwargs):
-        query = f"""SELECT jsonb_build_object('type','FeatureCollection', 'features', jsonb_agg(features.feature))
-            FROM (
-            SELECT jsonb_build_object(
-                'type',       'Feature',
-                'properties', to_jsonb(inputs) - 'geom',
-                'geometry',   ST_AsGeoJSON(ST_Simplify(geom, 0.005, true))::jsonb
-            ) AS feature
-            FROM (SELECT * FROM dmaps_provincegeometry)inputs) features;"""
-
-        cur.execute(query)
-
-        # Fetch all rows
-        rows = cur.fetchall()
-        geojson = rows[0][0]
-
-        # Close the cursor and connection
-        # cur.close()
-        # conn.close()
-
-        return Response(geojson)
+        return boundary_geojson_response(request, "province")
 
     @swagger_auto_schema(
         operation_summary="Get Palika Ward Geojson",
@@ -107,6 +107,10 @@ WSGI_APPLICATION = "project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Seconds a database connection is reused across requests, 0 closes it after every
+# request and None keeps it open for the lifetime of the worker.
+CONN_MAX_AGE = os.environ.get("CONN_MAX_AGE", "0")
+CONN_MAX_AGE = None if CONN_MAX_AGE == "None" else int(CONN_MAX_AGE)
 
 DATABASES = {
     "default": {
@@ -118,6 +122,12 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "postgres"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": os.environ.get("CONN_HEALTH_CHECKS", "True") == "True",
+        # required behind pgbouncer in transaction pooling mode
+        "DISABLE_SERVER_SIDE_CURSORS": (
+            os.environ.get("DISABLE_SERVER_SIDE_CURSORS", "False") == "True"
+        ),
     }
 }
 
@@ -212,6 +222,68 @@ CSRF_TRUSTED_ORIGINS = os.environ.get(
 
 DEFAULT_AUTO_FIELD = os.environ.get("DEFAULT_AUTO_FIELD", "django.db.models.AutoField")
 
+# CACHE SETTINGS
+# Vector tiles are cached in redis by default, TILE_CACHE_BACKEND=file keeps them on
+# disk instead and TILE_CACHE_BACKEND=dummy disables the cache.
+TILE_CACHE_BACKENDS = {
+    "redis": "django.core.cache.backends.redis.RedisCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "dummy": "django.core.cache.backends.dummy.DummyCache",
+}
+TILE_CACHE_BACKEND = os.environ.get("TILE_CACHE_BACKEND", "redis")
+TILE_CACHE_LOCATION = os.environ.get(
+    "TILE_CACHE_LOCATION",
+    (
+        os.path.join(BASE_DIR, "tile_cache")
+        if TILE_CACHE_BACKEND == "file"
+        else "redis://redis:6379/1"
+    ),
+)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tiles": {
+        "BACKEND": TILE_CACHE_BACKENDS[TILE_CACHE_BACKEND],
+        "LOCATION": TILE_CACHE_LOCATION,
+    },
+    # Building and Road choices shared between processes, see core.utils.choice_registry
+    "choices": {
+        "BACKEND": TILE_CACHE_BACKENDS[TILE_CACHE_BACKEND],
+        "LOCATION": TILE_CACHE_LOCATION,
+        "KEY_PREFIX": "choices",
+    },
+}
+TILE_CACHE_TIMEOUT = int(os.environ.get("TILE_CACHE_TIMEOUT", 60 * 60 * 24))
+TILE_CACHE_MAX_ZOOM = int(os.environ.get("TILE_CACHE_MAX_ZOOM", 22))
+TILE_CACHE_MAX_INVALIDATE_TILES = int(
+    os.environ.get("TILE_CACHE_MAX_INVALIDATE_TILES", 256)
+)
+# Zoom level up to which layers with clusters are served as aggregated points
+TILE_CLUSTER_MAX_ZOOM = int(os.environ.get("TILE_CLUSTER_MAX_ZOOM", 13))
+# max-age of the Cache-Control header on tile and GeoJSON responses, clients and
+# proxies revalidate with the ETag afterwards
+HTTP_CACHE_MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", 60))
+# Tolerances, in degrees, of the stored municipality and province GeoJSON
+BOUNDARY_GEOJSON_TOLERANCES = [0.001, 0.005, 0.01]
+DEFAULT_BOUNDARY_TOLERANCE = 0.005
+# Directory of the pre-rendered tile archives written by the export_vector_tiles
+# command, e.g. MEDIA_ROOT/tiles. Archives are snapshots that edits do not
+# invalidate, so they are only served when set, for read-mostly deployments
+TILE_ARCHIVE_ROOT = os.environ.get("TILE_ARCHIVE_ROOT") or None
+# Number of rows written per bulk_create batch when importing uploaded files
+INGESTION_BATCH_SIZE = int(os.environ.get("INGESTION_BATCH_SIZE", 2000))
+# Number of features read from an uploaded file at a time
+INGESTION_CHUNK_SIZE = int(os.environ.get("INGESTION_CHUNK_SIZE", 50000))
+# Number of processes preparing chunks of an uploaded file in parallel
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", 1))
+# Number of sub-tasks numbering houses in parallel by connected road component
+HOUSE_NUMBERING_PARTITIONS = int(os.environ.get("HOUSE_NUMBERING_PARTITIONS", 8))
+# Renumber the houses affected by road and gate edits once they are saved
+INCREMENTAL_HOUSE_NUMBERING = (
+    os.environ.get("INCREMENTAL_HOUSE_NUMBERING", "True") == "True"
+)
+
 try:
     from project.local_settings import *
 except ImportError: